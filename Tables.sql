@@ -14,7 +14,9 @@ CREATE TABLE buildings (
     name VARCHAR(100) NOT NULL,
     address TEXT NOT NULL,
     owner_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    version INTEGER NOT NULL DEFAULT 1
 );
 
 -- Пожарные датчики
@@ -24,18 +26,65 @@ CREATE TABLE sensors (
     type VARCHAR(50) NOT NULL,           -- smoke, heat, gas и т.д.
     location VARCHAR(100) NOT NULL,      -- например: "1 этаж, коридор"
     installed_at DATE NOT NULL,
-    is_active BOOLEAN DEFAULT TRUE
+    is_active BOOLEAN DEFAULT TRUE,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    version INTEGER NOT NULL DEFAULT 1
 );
+CREATE INDEX ix_sensors_building_id ON sensors (building_id);
 
--- Инциденты (аварии, срабатывания)
+-- Инциденты (аварии, срабатывания); помесячные секции по detected_at
+-- создает partitions.py (python partitions.py maintain), перевод старой таблицы — python partitions.py migrate
 CREATE TABLE incidents (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     sensor_id INTEGER REFERENCES sensors(id) ON DELETE SET NULL,
     detected_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     level VARCHAR(20) NOT NULL,       -- low, medium, high
     description TEXT,
-    resolved BOOLEAN DEFAULT FALSE
+    resolved BOOLEAN DEFAULT FALSE,
+    resolved_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    version INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (id, detected_at)
+) PARTITION BY RANGE (detected_at);
+CREATE TABLE incidents_default PARTITION OF incidents DEFAULT;
+CREATE INDEX ix_incidents_detected_at_id ON incidents (detected_at, id);
+CREATE INDEX ix_incidents_sensor_id_detected_at ON incidents (sensor_id, detected_at);
+CREATE INDEX ix_incidents_unresolved ON incidents (detected_at, id) WHERE NOT resolved;
+
+-- Агрегаты инцидентов (аналитика): обновляются вместе с инцидентами
+CREATE TABLE incident_rollups_hourly (
+    bucket TIMESTAMP NOT NULL,
+    sensor_id INTEGER NOT NULL,
+    level VARCHAR(20) NOT NULL,
+    building_id INTEGER,
+    incident_count INTEGER NOT NULL DEFAULT 0,
+    resolved_count INTEGER NOT NULL DEFAULT 0,
+    resolve_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, sensor_id, level)
+);
+CREATE INDEX ix_incident_rollups_hourly_building_id_bucket ON incident_rollups_hourly (building_id, bucket);
+
+CREATE TABLE incident_rollups_daily (
+    bucket DATE NOT NULL,
+    sensor_id INTEGER NOT NULL,
+    level VARCHAR(20) NOT NULL,
+    building_id INTEGER,
+    incident_count INTEGER NOT NULL DEFAULT 0,
+    resolved_count INTEGER NOT NULL DEFAULT 0,
+    resolve_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, sensor_id, level)
+);
+CREATE INDEX ix_incident_rollups_daily_building_id_bucket ON incident_rollups_daily (building_id, bucket);
+
+-- Показания датчиков (телеметрия)
+CREATE TABLE sensor_readings (
+    id BIGSERIAL PRIMARY KEY,
+    sensor_id INTEGER NOT NULL REFERENCES sensors(id) ON DELETE CASCADE,
+    recorded_at TIMESTAMP NOT NULL,
+    value DOUBLE PRECISION NOT NULL,
+    unit VARCHAR(16)
 );
+CREATE INDEX ix_sensor_readings_sensor_id_recorded_at ON sensor_readings (sensor_id, recorded_at);
 
 -- Проверки зданий (инспекции)
 CREATE TABLE inspections (
@@ -0,0 +1,156 @@
+import os
+from collections import namedtuple
+from datetime import date, datetime, time
+from typing import Optional
+from sqlalchemy import select, func, delete, insert, cast, Date, Float, and_, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+
+# Ограничение размера ответа аналитики; больше — нужно сузить период или группировку
+ANALYTICS_MAX_ROWS = int(os.getenv("ANALYTICS_MAX_ROWS", "10000"))
+
+GRANULARITIES = {"hour": models.IncidentHourlyRollup, "day": models.IncidentDailyRollup}
+GROUP_FIELDS = ("building", "sensor", "level")
+
+# Состояние инцидента, влияющее на агрегаты; detected_at и resolved_at — naive UTC
+IncidentFacts = namedtuple("IncidentFacts", "detected_at sensor_id building_id level resolved_at")
+
+
+def _accumulate(changes) -> dict:
+    """Сворачивает изменения [(IncidentFacts, +1/-1)] в приращения по ячейкам агрегатов"""
+    totals = {}
+    for facts, sign in changes:
+        if facts.sensor_id is None or facts.detected_at is None:
+            continue
+        hour = facts.detected_at.replace(minute=0, second=0, microsecond=0)
+        resolved = facts.resolved_at is not None
+        seconds = max((facts.resolved_at - facts.detected_at).total_seconds(), 0.0) if resolved else 0.0
+        for table, bucket in ((models.IncidentHourlyRollup, hour), (models.IncidentDailyRollup, hour.date())):
+            entry = totals.setdefault(
+                (table, bucket, facts.sensor_id, facts.level or ""),
+                {"building_id": facts.building_id, "incident_count": 0, "resolved_count": 0, "resolve_seconds": 0.0}
+            )
+            entry["incident_count"] += sign
+            entry["resolved_count"] += sign * resolved
+            entry["resolve_seconds"] += sign * seconds
+    return totals
+
+async def apply(db: AsyncSession, changes):
+    """
+    Применяет изменения к агрегатам одним INSERT ... ON CONFLICT на таблицу.
+    Выполняется в транзакции вызывающего кода — агрегаты фиксируются вместе с инцидентами.
+    """
+    totals = _accumulate(changes)
+    for table in GRANULARITIES.values():
+        # Строки в порядке ключа: параллельные транзакции блокируют ячейки в одном порядке
+        rows = sorted(
+            (
+                {"bucket": bucket, "sensor_id": sensor_id, "level": level, **entry}
+                for (entry_table, bucket, sensor_id, level), entry in totals.items()
+                if entry_table is table and (entry["incident_count"] or entry["resolved_count"] or entry["resolve_seconds"])
+            ),
+            key=lambda row: (row["bucket"], row["sensor_id"], row["level"])
+        )
+        if not rows:
+            continue
+        statement = pg_insert(table).values(rows)
+        columns = table.__table__.c
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=["bucket", "sensor_id", "level"],
+            set_={
+                "building_id": func.coalesce(columns.building_id, statement.excluded.building_id),
+                "incident_count": columns.incident_count + statement.excluded.incident_count,
+                "resolved_count": columns.resolved_count + statement.excluded.resolved_count,
+                "resolve_seconds": columns.resolve_seconds + statement.excluded.resolve_seconds,
+            }
+        ))
+
+async def rebuild(db: AsyncSession) -> dict:
+    """Пересчитывает агрегаты из таблицы incidents (первичное заполнение, исправление расхождений)"""
+    hourly = models.IncidentHourlyRollup.__table__
+    daily = models.IncidentDailyRollup.__table__
+    incident = models.Incident
+    resolved = and_(incident.resolved, incident.resolved_at.isnot(None))
+    # Транзакции, меняющие инциденты, ждут окончания пересчета и применяют свои изменения поверх
+    await db.execute(text("LOCK TABLE incident_rollups_hourly, incident_rollups_daily IN EXCLUSIVE MODE"))
+    await db.execute(delete(hourly))
+    await db.execute(delete(daily))
+
+    hour = func.date_trunc("hour", incident.detected_at)
+    level = func.coalesce(incident.level, "")
+    source = (
+        select(
+            hour,
+            incident.sensor_id,
+            level,
+            func.min(models.Sensor.building_id),
+            func.count(),
+            func.count().filter(resolved),
+            func.coalesce(
+                func.sum(func.extract("epoch", incident.resolved_at - incident.detected_at)).filter(resolved), 0
+            ).cast(Float)
+        )
+        .outerjoin(models.Sensor, incident.sensor_id == models.Sensor.id)
+        .where(incident.sensor_id.isnot(None))
+        .group_by(hour, incident.sensor_id, level)
+    )
+    columns = ["bucket", "sensor_id", "level", "building_id", "incident_count", "resolved_count", "resolve_seconds"]
+    hourly_rows = await db.execute(insert(hourly).from_select(columns, source))
+
+    day = cast(hourly.c.bucket, Date)
+    daily_rows = await db.execute(insert(daily).from_select(columns, select(
+        day,
+        hourly.c.sensor_id,
+        hourly.c.level,
+        func.min(hourly.c.building_id),
+        func.sum(hourly.c.incident_count),
+        func.sum(hourly.c.resolved_count),
+        func.sum(hourly.c.resolve_seconds)
+    ).group_by(day, hourly.c.sensor_id, hourly.c.level)))
+    await db.commit()
+    return {"hourly": hourly_rows.rowcount, "daily": daily_rows.rowcount}
+
+async def query(
+    db: AsyncSession,
+    granularity: str,
+    date_from: date,
+    date_to: date,
+    group_by=(),
+    series: bool = True,
+    building_id: Optional[int] = None,
+    sensor_id: Optional[int] = None,
+    level: Optional[str] = None
+):
+    """
+    Число инцидентов, решенных и MTTR из агрегатов за [date_from, date_to).
+    series=True — с разбивкой по bucket; group_by — подмножество GROUP_FIELDS.
+    Возвращает None, если строк больше ANALYTICS_MAX_ROWS.
+    """
+    table = GRANULARITIES[granularity]
+    start, end = date_from, date_to
+    if granularity == "hour":
+        start, end = datetime.combine(date_from, time.min), datetime.combine(date_to, time.min)
+    group_columns = {"building": table.building_id, "sensor": table.sensor_id, "level": table.level}
+    keys = ([table.bucket] if series else []) + [group_columns[field] for field in GROUP_FIELDS if field in group_by]
+
+    resolved = func.sum(table.resolved_count)
+    query = select(
+        *keys,
+        func.sum(table.incident_count).label("incidents"),
+        resolved.label("resolved"),
+        (func.sum(table.resolve_seconds) / func.nullif(resolved, 0)).label("mttr_seconds")
+    ).where(table.bucket >= start, table.bucket < end)
+    if building_id is not None:
+        query = query.where(table.building_id == building_id)
+    if sensor_id is not None:
+        query = query.where(table.sensor_id == sensor_id)
+    if level is not None:
+        query = query.where(table.level == level)
+    if keys:
+        query = query.group_by(*keys).order_by(*keys)
+    result = await db.execute(query.limit(ANALYTICS_MAX_ROWS + 1))
+    rows = result.mappings().all()
+    if len(rows) > ANALYTICS_MAX_ROWS:
+        return None
+    return [row for row in rows if row["incidents"] is not None]
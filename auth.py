@@ -2,15 +2,23 @@ from jose import jwt, JWTError
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from logger import logger
+import cache
 import crud
 import database
 import models
+import passwords
 from typing import Optional
-from passlib.context import CryptContext
+from dataclasses import dataclass
+from collections import OrderedDict
+import hashlib
+import importlib
+import os
+import threading
+import time
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = passwords.pwd_context
 
 # Конфигурация JWT
 SECRET_KEY = "bebebe"  # В продакшене используйте надежный ключ из переменных окружения
@@ -18,18 +26,189 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
+# Кэш проверенных токенов и бэкенд JWT ("jose" или "pyjwt")
+JWT_BACKEND = os.getenv("JWT_BACKEND", "jose")
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+# Отзыв токенов; при включении refresh-токен одноразовый. Отзыв пишется в память процесса
+# и в бэкенд кэша (cache.py): с CACHE_BACKEND=redis его видят все воркеры uvicorn
+TOKEN_REVOCATION_ENABLED = os.getenv("TOKEN_REVOCATION_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Для токенов без claim is_admin флаг берется из БД и кэшируется на это время
+ADMIN_FLAG_TTL_SECONDS = 60
+ADMIN_FLAG_CACHE_MAX_SIZE = 10000
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def create_access_token(user_id: int, expires_delta: Optional[timedelta] = None) -> str:
-    """Создает access token с указанным user_id"""
+@dataclass(frozen=True)
+class Principal:
+    """Пользователь текущего запроса, собранный из claims токена без загрузки строки User"""
+    id: int
+    is_admin: bool = False
+
+# LRU: user_id -> (is_admin, истекает); используется только из цикла событий
+_admin_flag_cache: OrderedDict = OrderedDict()
+
+
+@dataclass(frozen=True)
+class JWTBackend:
+    name: str
+    encode: object
+    decode: object
+    expired_error: type
+    invalid_error: type
+
+def _load_jwt_backend(name: str) -> JWTBackend:
+    if name == "pyjwt":
+        try:
+            pyjwt = importlib.import_module("jwt")
+            return JWTBackend(
+                name="pyjwt",
+                encode=lambda claims: pyjwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM),
+                decode=lambda token: pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]),
+                expired_error=pyjwt.ExpiredSignatureError,
+                invalid_error=pyjwt.InvalidTokenError
+            )
+        except (ImportError, AttributeError):
+            logger.warning("JWT_BACKEND=pyjwt, but PyJWT is not installed; falling back to python-jose")
+    return JWTBackend(
+        name="jose",
+        encode=lambda claims: jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM),
+        decode=lambda token: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]),
+        expired_error=jwt.ExpiredSignatureError,
+        invalid_error=JWTError
+    )
+
+jwt_backend = _load_jwt_backend(JWT_BACKEND)
+
+
+class TokenCache:
+    """LRU-кэш проверенных токенов: token -> claims; запись живет до exp токена"""
+
+    def __init__(self, max_size: int = TOKEN_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            claims = self._entries.get(token)
+            if claims is not None and claims["exp"] > now:
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return claims
+            if claims is not None:
+                del self._entries[token]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, claims: dict):
+        if not isinstance(claims.get("exp"), (int, float)):
+            return
+        with self._lock:
+            self._entries[token] = claims
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def revoke(self, token: str, exp: float):
+        """Отзывает токен до момента exp и убирает его из кэша"""
+        now = time.time()
+        with self._lock:
+            self._entries.pop(token, None)
+            self._revoked[token] = exp
+            # Истекшие отзывы больше не нужны — такие токены не пройдут проверку exp
+            for revoked, revoked_exp in list(self._revoked.items()):
+                if revoked_exp <= now:
+                    del self._revoked[revoked]
+
+    def is_revoked(self, token: str) -> bool:
+        with self._lock:
+            return token in self._revoked
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._revoked.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": jwt_backend.name,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "revoked": len(self._revoked),
+            }
+
+token_cache = TokenCache()
+
+def _decode(token: str) -> dict:
+    """Возвращает claims из кэша или проверяет подпись и кладет результат в кэш"""
+    if TOKEN_REVOCATION_ENABLED and token_cache.is_revoked(token):
+        raise jwt_backend.invalid_error("Token revoked")
+    claims = token_cache.get(token)
+    if claims is None:
+        claims = jwt_backend.decode(token)
+        token_cache.put(token, claims)
+    return claims
+
+def _revocation_key(token: str) -> str:
+    # В общем хранилище лежит хэш, а не сам токен
+    return "revoked:" + hashlib.sha256(token.encode()).hexdigest()
+
+async def revoke_token(token: str):
+    """Отзывает токен (используется при ротации refresh-токена) до истечения его срока"""
+    if not TOKEN_REVOCATION_ENABLED:
+        return
+    try:
+        claims = _decode(token)
+    except jwt_backend.invalid_error:
+        return
+    token_cache.revoke(token, claims["exp"])
+    ttl = claims["exp"] - time.time()
+    if ttl > 0:
+        try:
+            await cache.cache.backend.set(_revocation_key(token), True, ttl)
+        except Exception as e:
+            logger.error(f"Token revocation was not shared with other workers: {str(e)}")
+
+async def is_token_revoked(token: str) -> bool:
+    """Отозван ли токен в этом процессе или в другом воркере (через бэкенд кэша)"""
+    if not TOKEN_REVOCATION_ENABLED:
+        return False
+    if token_cache.is_revoked(token):
+        return True
+    try:
+        return await cache.cache.backend.get(_revocation_key(token)) is not None
+    except Exception as e:
+        logger.error(f"Shared token revocation check failed: {str(e)}")
+        return False
+
+def create_access_token(
+    user_id: int,
+    expires_delta: Optional[timedelta] = None,
+    is_admin: bool = False
+) -> str:
+    """Создает access token с указанным user_id и флагом администратора"""
     try:
         expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
         to_encode = {
             "user_id": user_id,
             "type": "access",
+            "is_admin": bool(is_admin),
             "exp": expire
         }
-        return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        return jwt_backend.encode(to_encode)
     except Exception as e:
         logger.error(f"Access token creation error: {str(e)}")
         raise HTTPException(status_code=500, detail="Token creation failed")
@@ -41,45 +220,87 @@ def create_refresh_token(user_id: int) -> str:
         to_encode = {
             "user_id": user_id,
             "type": "refresh",
+            "jti": os.urandom(8).hex(),  # уникальность токена для ротации/отзыва
             "exp": expire
         }
-        return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        return jwt_backend.encode(to_encode)
     except Exception as e:
         logger.error(f"Refresh token creation error: {str(e)}")
         raise HTTPException(status_code=500, detail="Token creation failed")
 
-def get_user_id_from_token(token: str = Depends(oauth2_scheme)) -> int:
-    """Извлекает user_id из валидного токена"""
+def decode_access_token(token: str) -> dict:
+    """Проверяет access token и возвращает его claims"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decode(token)
         user_id = payload.get("user_id")
         token_type = payload.get("type")
         
         if user_id is None or token_type != "access":
             raise credentials_exception
-        return int(user_id)
-    except jwt.ExpiredSignatureError:
+        return payload
+    except jwt_backend.expired_error:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token expired",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except JWTError as e:
+    except jwt_backend.invalid_error as e:
         logger.error(f"JWT validation error: {str(e)}")
         raise credentials_exception
 
-def get_current_user(
-    db: Session = Depends(database.get_db),
+def get_user_id_from_token(token: str = Depends(oauth2_scheme)) -> int:
+    """Извлекает user_id из валидного токена"""
+    return int(decode_access_token(token)["user_id"])
+
+async def _get_admin_flag(db: AsyncSession, user_id: int) -> bool:
+    """Флаг администратора из TTL-кэша (для токенов, выпущенных без claim is_admin)"""
+    now = time.monotonic()
+    cached = _admin_flag_cache.get(user_id)
+    if cached and cached[1] > now:
+        _admin_flag_cache.move_to_end(user_id)
+        return cached[0]
+    user = await crud.get_user(db, user_id=user_id)
+    if not user:
+        logger.warning(f"User not found for ID: {user_id}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    _admin_flag_cache[user_id] = (bool(user.is_admin), now + ADMIN_FLAG_TTL_SECONDS)
+    _admin_flag_cache.move_to_end(user_id)
+    while len(_admin_flag_cache) > ADMIN_FLAG_CACHE_MAX_SIZE:
+        _admin_flag_cache.popitem(last=False)
+    return bool(user.is_admin)
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(database.get_async_db)
+) -> Principal:
+    """Собирает Principal из токена один раз на запрос; БД нужна только старым токенам без is_admin"""
+    payload = decode_access_token(token)
+    user_id = int(payload["user_id"])
+    if "is_admin" in payload:
+        return Principal(id=user_id, is_admin=bool(payload["is_admin"]))
+    return Principal(id=user_id, is_admin=await _get_admin_flag(db, user_id))
+
+async def get_current_admin(principal: Principal = Depends(get_current_principal)) -> Principal:
+    """Principal администратора; остальным — 403"""
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return principal
+
+async def get_current_user(
+    db: AsyncSession = Depends(database.get_async_db),
     user_id: int = Depends(get_user_id_from_token)
 ) -> models.User:
     """Получает полные данные пользователя по ID из токена"""
     try:
-        user = crud.get_user(db, user_id=user_id)
+        user = await crud.get_user(db, user_id=user_id)
         if not user:
             logger.warning(f"User not found for ID: {user_id}")
             raise HTTPException(
@@ -96,16 +317,9 @@ def get_current_user(
             detail="Internal server error"
         )
 
-def check_owner_or_admin(
-    db: Session,
-    current_user_id: int,
-    resource_owner_id: int
-) -> bool:
-    """Проверяет, является ли пользователь владельцем или админом"""
-    user = crud.get_user(db, user_id=current_user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    if user.id != resource_owner_id and not user.is_admin:
+def check_owner_or_admin(principal: Principal, resource_owner_id: int) -> bool:
+    """Проверяет, является ли пользователь владельцем или админом (без запросов к БД)"""
+    if principal.id != resource_owner_id and not principal.is_admin:
         raise HTTPException(status_code=403, detail="Forbidden")
     return True
 
@@ -114,15 +328,15 @@ def verify_token(token: str, expected_type: str) -> int:
     Проверяет токен и возвращает user_id, если токен валиден и нужного типа.
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decode(token)
         if payload.get("type") != expected_type:
             raise HTTPException(status_code=401, detail="Invalid token type")
         user_id = payload.get("user_id")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token payload")
         return int(user_id)
-    except jwt.ExpiredSignatureError:
+    except jwt_backend.expired_error:
         raise HTTPException(status_code=401, detail="Token expired")
-    except JWTError as e:
+    except jwt_backend.invalid_error as e:
         logger.error(f"JWT error: {str(e)}")
         raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
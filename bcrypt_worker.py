@@ -0,0 +1,27 @@
+import os
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+
+# Код дочерних процессов пула хэширования (passwords.PasswordHasher). Процессы запускаются
+# методом spawn и импортируют только этот модуль: журнал, пулы БД и остальное приложение
+# в них не загружаются.
+
+# Стоимость bcrypt; при изменении старые хэши пересчитываются при следующем входе
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Единственный контекст хэширования паролей в приложении.
+# min/max_rounds = BCRYPT_ROUNDS: хэши с другой стоимостью считаются устаревшими (needs_update)
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_and_update(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, password_hash)
@@ -0,0 +1,6 @@
+"""
+Нагрузочные замеры на реальном трафике:
+журналы -> рабочая нагрузка (workload), синтетический парк в отдельной БД (seed),
+воспроизведение против main.app (replay), отчет p50/p95/p99 в JSON (report).
+Запуск: python -m benchmarks --help
+"""
@@ -0,0 +1,214 @@
+import inspect
+import itertools
+import json
+import math
+import os
+import platform
+import statistics
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+# Замедление медианы больше порога относительно базового прогона считается регрессией
+MICRO_REGRESSION_THRESHOLD = float(os.getenv("MICRO_REGRESSION_THRESHOLD", "0.20"))
+# Время замеров одного случая и границы числа раундов
+MICRO_MIN_TIME = float(os.getenv("MICRO_MIN_TIME", "0.5"))
+MICRO_MIN_ROUNDS = 5
+MICRO_MAX_ROUNDS = 1000
+# Раунд короче этого повторяет вызов несколько раз: точность таймера и накладные расходы цикла
+MICRO_ROUND_TIME = 0.001
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+
+# Размер парка для замеров crud: достаточно для реалистичных планов, заполняется за секунды
+MICRO_FLEET = dict(users=10, buildings=100, sensors=2000, incidents=20000, days=30)
+# Размер пакета для сериализации и хэширования — как у страницы списка и пачки регистраций
+BATCH_SIZE = 100
+HASH_BATCH_SIZE = 8
+
+
+@dataclass
+class Case:
+    name: str
+    group: str
+    # factory(fixtures) -> вызываемый объект без аргументов (функция или корутина)
+    factory: Callable
+    needs_db: bool = False
+
+CASES = {}
+
+
+def case(name: str, group: str, needs_db: bool = False):
+    """Регистрирует случай замера; имя — ключ в базовом прогоне"""
+    def decorator(factory):
+        CASES[name] = Case(name, group, factory, needs_db)
+        return factory
+    return decorator
+
+
+async def measure(fn: Callable, min_time: float = MICRO_MIN_TIME) -> dict:
+    """
+    Замер в духе pytest-benchmark: прогрев, калибровка числа вызовов на раунд,
+    затем раунды до min_time. Статистика — время одного вызова в секундах.
+    """
+    async def call():
+        result = fn()
+        if inspect.isawaitable(result):
+            await result
+
+    start = time.perf_counter()
+    await call()
+    first = time.perf_counter() - start
+    iterations = max(1, math.ceil(MICRO_ROUND_TIME / first)) if first > 0 else 1000
+
+    rounds = []
+    deadline = time.perf_counter() + min_time
+    while len(rounds) < MICRO_MIN_ROUNDS or (time.perf_counter() < deadline and len(rounds) < MICRO_MAX_ROUNDS):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await call()
+        rounds.append((time.perf_counter() - start) / iterations)
+
+    median = statistics.median(rounds)
+    return {
+        "min": min(rounds),
+        "max": max(rounds),
+        "mean": statistics.fmean(rounds),
+        "median": median,
+        "stddev": statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        "rounds": len(rounds),
+        "iterations": iterations,
+        "ops": 1 / median if median else 0.0,
+    }
+
+
+@asynccontextmanager
+async def ephemeral_database(base_url: str):
+    """Временная БД рядом с base_url: создается на время замеров и удаляется после"""
+    url = make_url(base_url).set(drivername="postgresql+asyncpg")
+    name = f"lr4_micro_{os.getpid()}"
+    admin = create_async_engine(url.set(database="postgres"), poolclass=NullPool, isolation_level="AUTOCOMMIT")
+    try:
+        async with admin.connect() as conn:
+            await conn.execute(text(f"DROP DATABASE IF EXISTS {name}"))
+            await conn.execute(text(f"CREATE DATABASE {name}"))
+        engine = create_async_engine(url.set(database=name), poolclass=NullPool)
+        try:
+            yield engine
+        finally:
+            await engine.dispose()
+            async with admin.connect() as conn:
+                await conn.execute(text(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)"))
+    finally:
+        await admin.dispose()
+
+
+class Fixtures:
+    """Общие данные случаев: сессия на временной БД и заранее подготовленные объекты"""
+
+    def __init__(self, db: Optional[AsyncSession] = None, fleet: Optional[dict] = None):
+        self.db = db
+        self.fleet = fleet or {}
+
+    def ids(self, table: str):
+        """Бесконечный перебор id таблицы: каждый вызов читает другую строку"""
+        return itertools.cycle(range(1, self.fleet.get(table, 1) + 1))
+
+    def session_call(self, fn: Callable):
+        """Вызов crud с чистой identity map: иначе db.get вернет объект без запроса"""
+        async def call():
+            try:
+                return await fn(self.db)
+            finally:
+                self.db.expunge_all()
+        return call
+
+
+async def run(
+    names=None,
+    database_url: Optional[str] = None,
+    min_time: float = MICRO_MIN_TIME,
+    progress: Callable = None
+) -> dict:
+    """Выполняет выбранные случаи (все при names=None); случаи с БД — на временной базе"""
+    # Регистрация случаев при импорте модуля
+    from benchmarks import micro_cases  # noqa: F401
+    selected = [CASES[name] for name in (names or CASES)]
+    results = {}
+
+    async def measure_all(fixtures: Fixtures, cases):
+        for item in cases:
+            stats = await measure(item.factory(fixtures), min_time=min_time)
+            results[item.name] = {"group": item.group, **stats}
+            if progress:
+                progress(item.name, stats)
+
+    await measure_all(Fixtures(), [item for item in selected if not item.needs_db])
+    db_cases = [item for item in selected if item.needs_db]
+    if db_cases:
+        if database_url is None:
+            raise ValueError("database_url is required for crud cases")
+        from benchmarks import seed
+        async with ephemeral_database(database_url) as engine:
+            await seed.seed(engine, seed.FleetSize(**MICRO_FLEET))
+            fleet = await seed.fleet_counts(engine)
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                await measure_all(Fixtures(db, fleet), db_cases)
+
+    return {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "min_time": min_time,
+        },
+        "cases": {name: results[name] for name in sorted(results)},
+    }
+
+
+def regressions(baseline: dict, current: dict, threshold: float = MICRO_REGRESSION_THRESHOLD) -> list:
+    """Случаи, медиана которых выросла больше чем на threshold; новые случаи не сравниваются"""
+    found = []
+    for name, stats in current["cases"].items():
+        old = baseline.get("cases", {}).get(name)
+        if not old or not old["median"]:
+            continue
+        change = stats["median"] / old["median"] - 1
+        if change > threshold:
+            found.append({"case": name, "baseline": old["median"], "current": stats["median"], "change": round(change, 4)})
+    return found
+
+def load_baseline(path: str = BASELINE_PATH) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_baseline(result: dict, path: str = BASELINE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+def format_table(result: dict, baseline: Optional[dict] = None) -> str:
+    old_cases = (baseline or {}).get("cases", {})
+    lines = [f"{'case':<48}{'median':>12}{'min':>12}{'stddev':>12}{'rounds':>8}{'change':>9}"]
+    lines.append("-" * len(lines[0]))
+    for name, stats in result["cases"].items():
+        old = old_cases.get(name)
+        change = f"{(stats['median'] / old['median'] - 1) * 100:+.1f}%" if old and old["median"] else ""
+        lines.append(
+            f"{name:<48}{_duration(stats['median']):>12}{_duration(stats['min']):>12}"
+            f"{_duration(stats['stddev']):>12}{stats['rounds']:>8}{change:>9}"
+        )
+    return "\n".join(lines)
+
+def _duration(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.2f} us"
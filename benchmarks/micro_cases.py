@@ -0,0 +1,189 @@
+import asyncio
+from datetime import datetime, timedelta
+import auth
+import crud
+import models
+import passwords
+import responses
+import schemas
+from benchmarks.micro import BATCH_SIZE, HASH_BATCH_SIZE, case
+
+# Случаи микрозамеров. Функция-фабрика получает Fixtures и возвращает замеряемый вызов;
+# подготовка данных в фабрике в замер не входит.
+
+_NOW = datetime(2025, 1, 1, 12, 0, 0)
+_PASSWORD = "benchmark-password"
+
+
+def _building_dicts(created_at_as_text: bool = False) -> list:
+    return [
+        {
+            "id": i,
+            "name": f"Здание {i}",
+            "address": f"ул. Замерная, {i}",
+            "owner_id": 1 + i % 10,
+            "created_at": (_NOW + timedelta(minutes=i)).isoformat() if created_at_as_text else _NOW + timedelta(minutes=i),
+            "updated_at": _NOW,
+            "version": 1,
+        }
+        for i in range(1, BATCH_SIZE + 1)
+    ]
+
+def _sensor_dicts() -> list:
+    return [
+        {
+            "id": i,
+            "building_id": 1 + i % 10,
+            "type": "smoke",
+            "location": f"Этаж {i % 20}",
+            "installed_at": _NOW,
+            "is_active": True,
+            "updated_at": _NOW,
+            "version": 1,
+        }
+        for i in range(1, BATCH_SIZE + 1)
+    ]
+
+
+# SCHEMAS
+@case("schemas.Building.model_validate[orm x100]", "schemas")
+def _building_from_orm(fixtures):
+    buildings = [models.Building(**row) for row in _building_dicts()]
+    return lambda: [schemas.Building.model_validate(building, from_attributes=True) for building in buildings]
+
+@case("schemas.Building.parse_created_at[text x100]", "schemas")
+def _building_parse_created_at(fixtures):
+    # created_at строкой идет через field_validator(mode='before') и datetime.fromisoformat
+    rows = _building_dicts(created_at_as_text=True)
+    return lambda: [schemas.Building.model_validate(row) for row in rows]
+
+@case("schemas.buildings_adapter.validate_python[x100]", "schemas")
+def _buildings_adapter_validate(fixtures):
+    rows = _building_dicts()
+    return lambda: schemas.buildings_adapter.validate_python(rows)
+
+@case("schemas.buildings_adapter.dump_json[x100]", "schemas")
+def _buildings_adapter_dump(fixtures):
+    buildings = schemas.buildings_adapter.validate_python(_building_dicts())
+    return lambda: schemas.buildings_adapter.dump_json(buildings)
+
+@case("schemas.SensorCreate.model_validate_json[x100]", "schemas")
+def _sensor_create_from_json(fixtures):
+    bodies = [
+        schemas.SensorCreate(building_id=i, type="heat", location=f"Этаж {i}", is_active=True).model_dump_json()
+        for i in range(1, BATCH_SIZE + 1)
+    ]
+    return lambda: [schemas.SensorCreate.model_validate_json(body) for body in bodies]
+
+@case("responses.dumps[sensor page x100]", "schemas")
+def _responses_dumps(fixtures):
+    # Страница в том виде, в котором ее хранит кэш ответов (_dump_rows)
+    items = schemas.sensors_adapter.dump_python(schemas.sensors_adapter.validate_python(_sensor_dicts()), mode="json")
+    return lambda: responses.dumps(items)
+
+
+# AUTH
+@case("auth.create_access_token", "auth")
+def _create_access_token(fixtures):
+    return lambda: auth.create_access_token(1, is_admin=True)
+
+@case("auth.verify_token[cached]", "auth")
+def _verify_token_cached(fixtures):
+    token = auth.create_access_token(1)
+    auth.verify_token(token, "access")
+    return lambda: auth.verify_token(token, "access")
+
+@case("auth.verify_token[uncached]", "auth")
+def _verify_token_uncached(fixtures):
+    # Проверка подписи на каждом вызове: первый запрос с новым токеном
+    token = auth.create_access_token(1)
+
+    def call():
+        auth.token_cache.clear()
+        return auth.verify_token(token, "access")
+    return call
+
+
+# PASSWORDS
+@case("passwords.hash", "passwords")
+def _hash(fixtures):
+    return lambda: passwords._hash(_PASSWORD)
+
+@case("passwords.verify_and_update", "passwords")
+def _verify_and_update(fixtures):
+    password_hash = passwords._hash(_PASSWORD)
+    return lambda: passwords._verify_and_update(_PASSWORD, password_hash)
+
+@case(f"passwords.hasher.hash[x{HASH_BATCH_SIZE} concurrent]", "passwords")
+def _hasher_batch(fixtures):
+    # Пачка одновременных регистраций через пул процессов с ограничением очереди
+    return lambda: asyncio.gather(*(passwords.hasher.hash(_PASSWORD) for _ in range(HASH_BATCH_SIZE)))
+
+
+# CRUD (временная БД с парком MICRO_FLEET)
+@case("crud.get_user", "crud", needs_db=True)
+def _get_user(fixtures):
+    ids = fixtures.ids("users")
+    return fixtures.session_call(lambda db: crud.get_user(db, next(ids)))
+
+@case("crud.get_users[100]", "crud", needs_db=True)
+def _get_users(fixtures):
+    return fixtures.session_call(lambda db: crud.get_users(db, limit=BATCH_SIZE))
+
+@case("crud.get_building", "crud", needs_db=True)
+def _get_building(fixtures):
+    ids = fixtures.ids("buildings")
+    return fixtures.session_call(lambda db: crud.get_building(db, next(ids)))
+
+@case("crud.get_buildings[100]", "crud", needs_db=True)
+def _get_buildings(fixtures):
+    return fixtures.session_call(lambda db: crud.get_buildings(db, limit=BATCH_SIZE))
+
+@case("crud.get_building_stats[100]", "crud", needs_db=True)
+def _get_building_stats(fixtures):
+    building_ids = list(range(1, min(BATCH_SIZE, fixtures.fleet["buildings"]) + 1))
+    return fixtures.session_call(lambda db: crud.get_building_stats(db, building_ids))
+
+@case("crud.get_building_overview", "crud", needs_db=True)
+def _get_building_overview(fixtures):
+    ids = fixtures.ids("buildings")
+    return fixtures.session_call(lambda db: crud.get_building_overview(db, next(ids)))
+
+@case("crud.get_sensor", "crud", needs_db=True)
+def _get_sensor(fixtures):
+    ids = fixtures.ids("sensors")
+    return fixtures.session_call(lambda db: crud.get_sensor(db, next(ids)))
+
+@case("crud.get_sensor_with_owner", "crud", needs_db=True)
+def _get_sensor_with_owner(fixtures):
+    ids = fixtures.ids("sensors")
+    return fixtures.session_call(lambda db: crud.get_sensor_with_owner(db, next(ids)))
+
+@case("crud.get_sensors[building]", "crud", needs_db=True)
+def _get_sensors(fixtures):
+    ids = fixtures.ids("buildings")
+    return fixtures.session_call(lambda db: crud.get_sensors(db, limit=BATCH_SIZE, building_id=next(ids)))
+
+@case("crud.get_sensor_overview", "crud", needs_db=True)
+def _get_sensor_overview(fixtures):
+    ids = fixtures.ids("sensors")
+    return fixtures.session_call(lambda db: crud.get_sensor_overview(db, next(ids)))
+
+@case("crud.get_open_incident_counts[100]", "crud", needs_db=True)
+def _get_open_incident_counts(fixtures):
+    sensor_ids = list(range(1, min(BATCH_SIZE, fixtures.fleet["sensors"]) + 1))
+    return fixtures.session_call(lambda db: crud.get_open_incident_counts(db, sensor_ids))
+
+@case("crud.get_incident", "crud", needs_db=True)
+def _get_incident(fixtures):
+    ids = fixtures.ids("incidents")
+    return fixtures.session_call(lambda db: crud.get_incident(db, next(ids)))
+
+@case("crud.get_incidents[100]", "crud", needs_db=True)
+def _get_incidents(fixtures):
+    return fixtures.session_call(lambda db: crud.get_incidents(db, limit=BATCH_SIZE))
+
+@case("crud.get_incidents[sensor]", "crud", needs_db=True)
+def _get_incidents_of_sensor(fixtures):
+    ids = fixtures.ids("sensors")
+    return fixtures.session_call(lambda db: crud.get_incidents(db, limit=BATCH_SIZE, sensor_id=next(ids)))
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import time
+from collections import Counter, defaultdict
+import httpx
+from benchmarks import report
+
+# Запрос дольше этого считается ошибкой (статус 0): зависший ответ не должен останавливать прогон
+REPLAY_TIMEOUT = float(os.getenv("REPLAY_TIMEOUT", "30"))
+
+
+async def replay(
+    app, items: list, concurrency: int = 8, headers: dict = None, warmup: int = 0, meta: dict = None,
+    timeout: float = REPLAY_TIMEOUT
+) -> dict:
+    """
+    Замкнутый цикл: concurrency воркеров по очереди берут запросы workload и отправляют их
+    в ASGI-приложение app в одном процессе (без сети). Первые warmup запросов не учитываются.
+    """
+    transport = httpx.ASGITransport(app=app)
+    samples = defaultdict(list)
+    statuses = defaultdict(Counter)
+    position = iter(range(len(items)))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", headers=headers or {}) as client:
+        async def send(item):
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(client.request(item.method, item.url), timeout)
+                status = response.status_code
+            except Exception:
+                status = 0
+            return time.perf_counter() - start, status
+
+        # Прогрев: пулы соединений, кэши, первые компиляции запросов
+        for item in items[:warmup]:
+            await send(item)
+
+        async def worker():
+            for index in position:
+                item = items[index]
+                elapsed, status = await send(item)
+                samples[item.route].append(elapsed)
+                statuses[item.route][status] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    return report.summarize(samples, statuses, wall, {"concurrency": concurrency, "warmup": warmup, **(meta or {})})
@@ -0,0 +1,78 @@
+import math
+import platform
+from datetime import datetime, timezone
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Перцентиль методом ближайшего ранга по отсортированным значениям"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+def _latency(values: list) -> dict:
+    values = sorted(values)
+    return {
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+def summarize(samples: dict, statuses: dict, wall_seconds: float, meta: dict = None) -> dict:
+    """
+    Отчет прогона: samples — {маршрут: [секунды]}, statuses — {маршрут: Counter(статус)}.
+    Ошибки — ответы со статусом >= 500 и исключения (статус 0).
+    """
+    routes = {}
+    for route in sorted(samples):
+        codes = statuses.get(route, {})
+        routes[route] = {
+            "requests": len(samples[route]),
+            "errors": sum(count for code, count in codes.items() if code >= 500 or code == 0),
+            "statuses": {str(code): count for code, count in sorted(codes.items())},
+            "throughput_rps": round(len(samples[route]) / wall_seconds, 2) if wall_seconds else 0.0,
+            **_latency(samples[route]),
+        }
+    everything = [value for values in samples.values() for value in values]
+    return {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            **(meta or {}),
+        },
+        "total": {
+            "requests": len(everything),
+            "errors": sum(route["errors"] for route in routes.values()),
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_rps": round(len(everything) / wall_seconds, 2) if wall_seconds else 0.0,
+            **_latency(everything),
+        },
+        "routes": routes,
+    }
+
+def compare(baseline: dict, current: dict) -> dict:
+    """Изменение перцентилей и пропускной способности относительно базового прогона, в процентах"""
+    def delta(old, new):
+        return round((new - old) / old * 100, 1) if old else None
+
+    result = {}
+    pairs = [("total", baseline["total"], current["total"])] + [
+        (route, baseline["routes"][route], current["routes"][route])
+        for route in sorted(set(baseline["routes"]) & set(current["routes"]))
+    ]
+    for name, old, new in pairs:
+        result[name] = {
+            key: delta(old[key], new[key]) for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+        }
+    return result
+
+def format_table(report: dict) -> str:
+    header = f"{'route':<48} {'req':>7} {'err':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9}"
+    lines = [header, "-" * len(header)]
+    for name, row in list(report["routes"].items()) + [("TOTAL", report["total"])]:
+        lines.append(
+            f"{name[:48]:<48} {row['requests']:>7} {row['errors']:>5} "
+            f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['throughput_rps']:>9.1f}"
+        )
+    return "\n".join(lines)
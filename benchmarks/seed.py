@@ -0,0 +1,78 @@
+from dataclasses import asdict, dataclass
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+import analytics
+import models
+import partitions
+import passwords
+
+# Пароль всех пользователей парка (вход через /token в сценариях с записью)
+BENCH_PASSWORD = "benchmark"
+
+
+@dataclass
+class FleetSize:
+    users: int = 10
+    buildings: int = 200
+    sensors: int = 5000
+    incidents: int = 100000
+    # Инциденты равномерно распределяются по последним days суткам
+    days: int = 90
+
+
+async def seed(engine, size: FleetSize) -> dict:
+    """
+    Пересоздает схему в БД engine и заполняет ее детерминированным парком:
+    одинаковые размеры дают одинаковые данные, поэтому прогоны сравнимы.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.drop_all)
+        await conn.run_sync(models.Base.metadata.create_all)
+
+        password_hash = passwords.pwd_context.hash(BENCH_PASSWORD)
+        await conn.execute(text(
+            "INSERT INTO users (id, username, email, password_hash, is_admin, created_at) "
+            "SELECT i, 'bench' || i, 'bench' || i || '@example.com', :password_hash, i = 1, now() "
+            "FROM generate_series(1, :users) AS i"
+        ), {"password_hash": password_hash, "users": size.users})
+        await conn.execute(text(
+            "INSERT INTO buildings (id, name, address, owner_id) "
+            "SELECT i, 'Здание ' || i, 'ул. Нагрузочная, ' || i, 1 + (i - 1) % :users "
+            "FROM generate_series(1, :buildings) AS i"
+        ), {"users": size.users, "buildings": size.buildings})
+        await conn.execute(text(
+            "INSERT INTO sensors (id, building_id, type, location, installed_at, is_active) "
+            "SELECT i, 1 + (i - 1) % :buildings, (ARRAY['smoke', 'heat', 'gas'])[1 + i % 3], "
+            "'Этаж ' || (1 + i % 20), DATE '2023-01-01' + i % 365, i % 10 <> 0 "
+            "FROM generate_series(1, :sensors) AS i"
+        ), {"buildings": size.buildings, "sensors": size.sensors})
+        # Каждый четвертый инцидент открыт; время решения — от 1 до 120 минут
+        await conn.execute(text(
+            "INSERT INTO incidents (id, sensor_id, detected_at, level, description, resolved, resolved_at) "
+            "SELECT i, 1 + (i - 1) % :sensors, d, (ARRAY['low', 'medium', 'high'])[1 + i % 3], "
+            "'Инцидент ' || i, i % 4 <> 0, CASE WHEN i % 4 <> 0 THEN d + (1 + i % 120) * interval '1 minute' END "
+            "FROM generate_series(1, :incidents) AS i, "
+            "LATERAL (SELECT date_trunc('second', now() AT TIME ZONE 'UTC') "
+            "- i * (:days * 86400.0 / :incidents) * interval '1 second' AS d) AS t"
+        ), {"sensors": size.sensors, "incidents": size.incidents, "days": size.days})
+        for table in ("users", "buildings", "sensors", "incidents"):
+            await conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT coalesce(max(id), 1) FROM {table}))"
+            ))
+        # Строки из DEFAULT раскладываются по месячным секциям, как в рабочей БД
+        await partitions.ensure_partitions(conn)
+
+    async with AsyncSession(engine) as db:
+        rollups = await analytics.rebuild(db)
+    async with engine.begin() as conn:
+        for table in ("users", "buildings", "sensors", "incidents", "incident_rollups_hourly", "incident_rollups_daily"):
+            await conn.execute(text(f"ANALYZE {table}"))
+    return {**asdict(size), "rollups": rollups}
+
+async def fleet_counts(engine) -> dict:
+    """Число строк парка по таблицам — для переноса id из журналов"""
+    async with engine.connect() as conn:
+        return {
+            table: await conn.scalar(text(f"SELECT coalesce(max(id), 0) FROM {table}"))
+            for table in ("users", "buildings", "sensors", "incidents")
+        }
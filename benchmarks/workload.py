@@ -0,0 +1,113 @@
+import json
+import re
+from dataclasses import dataclass
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Старый текстовый формат журнала: "... - INFO - Request: GET http://localhost:8000/buildings/7"
+_TEXT_REQUEST = re.compile(r" - Request: (?P<method>[A-Z]+) (?P<url>\S+)")
+
+# Воспроизводятся только чтения: записи меняют состояние и делают прогоны несравнимыми
+REPLAY_METHODS = frozenset({"GET"})
+SKIP_PATHS = frozenset({"/docs", "/redoc", "/openapi.json", "/health", "/metrics", "/favicon.ico"})
+# Потоковые ответы (SSE, выгрузки) не заканчиваются или идут минутами, а httpx.ASGITransport
+# буферизует тело целиком — такой запрос останавливал бы воспроизведение
+STREAMING_PATHS = frozenset({"/incidents/stream"})
+STREAMING_PREFIXES = ("/export/",)
+# Запросы тестов (TestClient) — не реальный трафик
+SKIP_HOSTS = frozenset({"testserver"})
+
+# Сегмент пути и параметр запроса -> таблица, из которой берется id
+ID_SEGMENTS = {"users": "users", "buildings": "buildings", "sensors": "sensors", "incidents": "incidents"}
+ID_PARAMS = {"user_id": "users", "building_id": "buildings", "sensor_id": "sensors", "incident_id": "incidents"}
+
+
+@dataclass(frozen=True)
+class WorkItem:
+    method: str
+    path: str
+    query: str = ""
+
+    @property
+    def url(self) -> str:
+        return f"{self.path}?{self.query}" if self.query else self.path
+
+    @property
+    def route(self) -> str:
+        """Группа для отчета: метод, путь с {id} вместо чисел и имена параметров запроса"""
+        segments = ["{id}" if segment.isdigit() else segment for segment in self.path.rstrip("/").split("/")]
+        route = f"{self.method} {'/'.join(segments) or '/'}"
+        keys = sorted({key for key, _ in parse_qsl(self.query, keep_blank_values=True)})
+        return f"{route}?{'&'.join(keys)}" if keys else route
+
+    def as_dict(self) -> dict:
+        return {"method": self.method, "path": self.path, "query": self.query}
+
+
+def parse_line(line: str) -> Optional[WorkItem]:
+    """Запрос из строки журнала (JSON-запись fire_safety.access или старый текстовый формат)"""
+    line = line.strip()
+    if line.startswith("{"):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if record.get("logger") != "fire_safety.access" or not record.get("method") or not record.get("path"):
+            return None
+        return WorkItem(record["method"], record["path"], record.get("query") or "")
+    match = _TEXT_REQUEST.search(line)
+    if not match:
+        return None
+    url = urlsplit(match["url"])
+    if url.hostname in SKIP_HOSTS:
+        return None
+    return WorkItem(match["method"], url.path, url.query)
+
+def replayable(item: WorkItem, methods=REPLAY_METHODS) -> bool:
+    path = item.path.rstrip("/") or "/"
+    return (
+        item.method in methods
+        and item.path not in SKIP_PATHS
+        and path not in STREAMING_PATHS
+        and not item.path.startswith(STREAMING_PREFIXES)
+    )
+
+def parse_logs(paths: Iterable[str], methods=REPLAY_METHODS) -> list:
+    """Рабочая нагрузка из журналов в порядке записей"""
+    items = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                item = parse_line(line)
+                if item and replayable(item, methods):
+                    items.append(item)
+    return items
+
+def _remap_id(value: str, table: str, fleet: dict) -> str:
+    count = fleet.get(table)
+    if not value.isdigit() or not count:
+        return value
+    # Детерминированно: один и тот же id из журнала всегда попадает в ту же строку парка
+    return str((int(value) - 1) % count + 1)
+
+def remap(item: WorkItem, fleet: dict) -> WorkItem:
+    """Переносит id из журнала в диапазоны синтетического парка {таблица: число строк}"""
+    segments = item.path.split("/")
+    for index in range(1, len(segments)):
+        table = ID_SEGMENTS.get(segments[index - 1])
+        if table:
+            segments[index] = _remap_id(segments[index], table, fleet)
+    params = [
+        (key, _remap_id(value, ID_PARAMS[key], fleet) if key in ID_PARAMS else value)
+        for key, value in parse_qsl(item.query, keep_blank_values=True)
+    ]
+    return WorkItem(item.method, "/".join(segments), urlencode(params))
+
+def save(items: list, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item.as_dict(), ensure_ascii=False) + "\n")
+
+def load(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [WorkItem(**json.loads(line)) for line in f if line.strip()]
@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from logger import logger
+
+# Настройки кэша чтения
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Число процессов uvicorn/gunicorn (--workers читает ту же переменную)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# "memory" — LRU в процессе; "redis" — общий Redis-совместимый сервер (CACHE_REDIS_URL).
+# Поколения и удаление ключей видны только своему хранилищу: при нескольких воркерах
+# кэш в памяти отдавал бы другим воркерам устаревшие строки и ETag до CACHE_TTL_SECONDS,
+# поэтому по умолчанию в этом режиме используется redis, а "memory" запрещен
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "redis" if WEB_CONCURRENCY > 1 else "memory")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+
+class MemoryBackend:
+    """LRU с TTL в памяти процесса; счетчики поколений хранятся отдельно и не вытесняются"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    async def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    async def set_if_generation(self, key: str, value, ttl: float, name: str, expected: int) -> bool:
+        """set, только если поколение name не изменилось с момента чтения expected"""
+        with self._lock:
+            if self._generations.get(name, 0) != expected:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def _store(self, key: str, value, ttl: float):
+        # Вызывается под self._lock
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    async def generation(self, name: str) -> int:
+        return self._generations.get(name, 0)
+
+    async def bump(self, *names: str):
+        with self._lock:
+            for name in names:
+                self._generations[name] = self._generations.get(name, 0) + 1
+
+    async def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Redis-совместимое хранилище (redis, KeyDB, Dragonfly); значения хранятся как JSON"""
+    prefix = "fire_safety:"
+
+    def __init__(self, url: str = CACHE_REDIS_URL):
+        import redis.asyncio as redis
+        from redis.exceptions import WatchError
+        self._redis = redis.from_url(url)
+        self._watch_error = WatchError
+        self.evictions = 0
+
+    async def get(self, key: str):
+        raw = await self._redis.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value, ttl: float):
+        await self._redis.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000))
+
+    async def set_if_generation(self, key: str, value, ttl: float, name: str, expected: int) -> bool:
+        """set, только если поколение name не изменилось: WATCH на счетчике и MULTI"""
+        generation_key = self.prefix + "gen:" + name
+        async with self._redis.pipeline() as pipe:
+            try:
+                await pipe.watch(generation_key)
+                raw = await pipe.get(generation_key)
+                if (int(raw) if raw is not None else 0) != expected:
+                    return False
+                pipe.multi()
+                pipe.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000))
+                await pipe.execute()
+                return True
+            except self._watch_error:
+                return False
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._redis.delete(*(self.prefix + key for key in keys))
+
+    async def generation(self, name: str) -> int:
+        raw = await self._redis.get(self.prefix + "gen:" + name)
+        return int(raw) if raw is not None else 0
+
+    async def bump(self, *names: str):
+        for name in names:
+            await self._redis.incr(self.prefix + "gen:" + name)
+
+    async def clear(self):
+        async for key in self._redis.scan_iter(match=self.prefix + "*"):
+            await self._redis.delete(key)
+
+    def size(self) -> int:
+        return -1
+
+
+class ReadThroughCache:
+    """
+    Кэш чтения для строк и списков.
+    Ключ строки удаляется точечно; ключи списков включают номер поколения,
+    который увеличивается при любом изменении соответствующего набора данных.
+    У ключа строки тоже есть поколение: значение, прочитанное из БД до изменения,
+    не записывается в кэш, если за время загрузки ключ был сброшен.
+    """
+
+    def __init__(self, backend, ttl: float = CACHE_TTL_SECONDS, enabled: bool = CACHE_ENABLED):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_writes = 0
+        self.errors = 0
+
+    async def get_or_load(self, key: str, loader, ttl: float = None):
+        """Возвращает значение из кэша или вызывает loader(); None не кэшируется"""
+        if not self.enabled:
+            return await loader()
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            # Недоступный кэш не должен ронять чтение
+            self.errors += 1
+            logger.warning(f"Cache get failed: {str(e)}")
+            return await loader()
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        try:
+            generation = await self.backend.generation(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache get failed: {str(e)}")
+            return await loader()
+        value = await loader()
+        if value is not None:
+            try:
+                if not await self.backend.set_if_generation(key, value, ttl or self.ttl, key, generation):
+                    # Ключ сброшен во время загрузки: value может быть старше данных в БД
+                    self.stale_writes += 1
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Cache set failed: {str(e)}")
+        return value
+
+    async def list_key(self, generation: str, *parts) -> str:
+        number = await self.backend.generation(generation) if self.enabled else 0
+        return ":".join([generation, str(number)] + ["" if part is None else str(part) for part in parts])
+
+    async def invalidate(self, keys=(), generations=()):
+        if not self.enabled:
+            return
+        try:
+            await self.backend.delete(*keys)
+            await self.backend.bump(*keys, *generations)
+            self.invalidations += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Cache invalidation failed: {str(e)}")
+
+    async def clear(self):
+        await self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.backend.evictions,
+            "invalidations": self.invalidations,
+            "stale_writes": self.stale_writes,
+            "errors": self.errors,
+        }
+
+
+# Ключи и поколения
+def building_key(building_id: int) -> str:
+    return f"building:{building_id}"
+
+def sensor_key(sensor_id: int) -> str:
+    return f"sensor:{sensor_id}"
+
+BUILDINGS_LIST = "buildings:list"
+SENSORS_LIST_ALL = "sensors:list:all"
+
+def sensors_list_of(building_id: int) -> str:
+    return f"sensors:list:b{building_id}"
+
+
+def _make_backend(backend: str = CACHE_BACKEND, workers: int = WEB_CONCURRENCY):
+    if CACHE_ENABLED and workers > 1 and backend != "redis":
+        raise RuntimeError(
+            f"CACHE_BACKEND={backend} is per-process and would serve stale data with WEB_CONCURRENCY={workers}; "
+            "use CACHE_BACKEND=redis or CACHE_ENABLED=false"
+        )
+    if backend == "redis":
+        try:
+            return RedisBackend()
+        except ImportError:
+            if CACHE_ENABLED and workers > 1:
+                raise RuntimeError("CACHE_BACKEND=redis requires the redis package with several workers")
+            logger.warning("CACHE_BACKEND=redis, but the redis package is not installed; using memory cache")
+    return MemoryBackend()
+
+cache = ReadThroughCache(_make_backend())
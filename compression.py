@@ -0,0 +1,180 @@
+import asyncio
+import gzip
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from logger import logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Меньшие ответы не сжимаются: выигрыш меньше заголовков и затрат CPU
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Порядок предпочтения сервера; недоступные (нет модуля) пропускаются
+COMPRESSION_ENCODINGS = [
+    name.strip() for name in os.getenv("COMPRESSION_ENCODINGS", "br,zstd,gzip").split(",") if name.strip()
+]
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+# Тела от этого размера сжимаются в пуле потоков: brotli и gzip на сотнях КБ занимают
+# десятки мс и иначе останавливали бы цикл событий для всех остальных запросов
+COMPRESSION_THREAD_MIN_SIZE = int(os.getenv("COMPRESSION_THREAD_MIN_SIZE", "65536"))
+# Сжатые тела ответов с ETag: повторный запрос той же версии не сжимается заново
+COMPRESSION_CACHE_MAX_ENTRIES = int(os.getenv("COMPRESSION_CACHE_MAX_ENTRIES", "1000"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+_codecs = {"gzip": lambda data: gzip.compress(data, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)}
+if brotli is not None:
+    _codecs["br"] = lambda data: brotli.compress(data, quality=COMPRESSION_BROTLI_QUALITY)
+if zstandard is not None:
+    _codecs["zstd"] = lambda data: zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(data)
+
+# Предупреждаем, только если список задан явно: по умолчанию br и zstd — необязательные
+if "COMPRESSION_ENCODINGS" in os.environ:
+    for _name in COMPRESSION_ENCODINGS:
+        if _name not in _codecs:
+            logger.warning(f"Compression encoding {_name} is not available; skipping it")
+ENCODINGS = [name for name in COMPRESSION_ENCODINGS if name in _codecs]
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Кодировка из Accept-Encoding клиента с учетом q; None — отдавать без сжатия"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    for name in ENCODINGS:
+        if accepted.get(name, accepted.get("*", 0.0)) > 0:
+            return name
+    return None
+
+
+class Compressor:
+    """Сжатие тел ответов и LRU сжатых версий ответов с ETag"""
+
+    def __init__(self, max_entries: int = COMPRESSION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.compressed = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.offloaded = 0
+
+    async def compress(self, encoding: str, body: bytes, cache_key=None) -> bytes:
+        if cache_key is not None:
+            with self._lock:
+                data = self._entries.get(cache_key)
+                if data is not None:
+                    self._entries.move_to_end(cache_key)
+                    self.cache_hits += 1
+                    return data
+        offload = len(body) >= COMPRESSION_THREAD_MIN_SIZE
+        # Кодеки отпускают GIL на время сжатия, поэтому поток действительно разгружает цикл
+        data = await asyncio.to_thread(_codecs[encoding], body) if offload else _codecs[encoding](body)
+        with self._lock:
+            self.compressed += 1
+            self.offloaded += int(offload)
+            self.bytes_in += len(body)
+            self.bytes_out += len(data)
+            if cache_key is not None and self.max_entries > 0:
+                self._entries[cache_key] = data
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": COMPRESSION_ENABLED,
+                "encodings": ENCODINGS,
+                "min_size": COMPRESSION_MIN_SIZE,
+                "compressed": self.compressed,
+                "offloaded": self.offloaded,
+                "thread_min_size": COMPRESSION_THREAD_MIN_SIZE,
+                "cache_hits": self.cache_hits,
+                "cache_size": len(self._entries),
+                "ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+            }
+
+compressor = Compressor()
+
+
+def _compressible(status: int, headers: MutableHeaders, body: bytes) -> bool:
+    if status < 200 or status in (204, 304) or len(body) < COMPRESSION_MIN_SIZE:
+        return False
+    # Уже сжатое (выгрузка с gzip=true) и запрет преобразований не трогаем
+    if "content-encoding" in headers or "no-transform" in headers.get("cache-control", ""):
+        return False
+    return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+class CompressionMiddleware:
+    """
+    ASGI-middleware сжатия ответов. Сжимаются только ответы, отданные одним куском:
+    потоковые (SSE, выгрузки) идут как есть, без буферизации.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Заголовки откладываются до первого куска тела: от него зависит, сжимать ли ответ
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            pending, start = start, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=pending["headers"])
+            if message.get("more_body", False) or not _compressible(pending["status"], headers, body):
+                await send(pending)
+                await send(message)
+                return
+            etag = headers.get("etag")
+            cache_key = (scope["path"], scope.get("query_string", b""), etag, encoding) if etag else None
+            data = await compressor.compress(encoding, body, cache_key)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(data))
+            headers.add_vary_header("Accept-Encoding")
+            await send(pending)
+            await send({"type": "http.response.body", "body": data})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,55 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response
+
+
+def make_etag(*parts) -> str:
+    """Слабый ETag из произвольных частей (тип ресурса, id, версия, параметры запроса)"""
+    digest = hashlib.sha1("|".join("" if part is None else str(part) for part in parts).encode()).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+def row_etag(kind: str, row: dict) -> str:
+    return make_etag(kind, row["id"], row.get("version"))
+
+def _as_utc(value) -> Optional[datetime]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    # Время в БД хранится без часового пояса, в UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+def is_not_modified(request: Request, etag: str, last_modified=None) -> bool:
+    """Проверяет If-None-Match (приоритетно) и If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        # Сравнение слабое: W/"x" и "x" считаются одним тегом
+        bare = etag[2:] if etag.startswith("W/") else etag
+        return "*" in tags or etag in tags or bare in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    modified = _as_utc(last_modified)
+    if if_modified_since and modified is not None:
+        try:
+            return modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _validator_headers(etag: str, last_modified=None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    modified = _as_utc(last_modified)
+    if modified is not None:
+        headers["Last-Modified"] = format_datetime(modified, usegmt=True)
+    return headers
+
+def not_modified(etag: str, last_modified=None) -> Response:
+    """Ответ 304 без тела — схема ответа не валидируется и не сериализуется"""
+    return Response(status_code=304, headers=_validator_headers(etag, last_modified))
+
+def set_validators(response: Response, etag: str, last_modified=None):
+    response.headers.update(_validator_headers(etag, last_modified))
@@ -1,15 +1,21 @@
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import select, insert, func, distinct, union_all
+from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 import models
 import schemas
-from datetime import datetime
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import pagination
+from passwords import hasher
+import cache
+import conditional
+import analytics
+import partitions
+from datetime import datetime, timezone
 
 # USERS
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    # bcrypt нагружает CPU — хэшируем в отдельном пуле процессов
+    hashed_password = await hasher.hash(user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -17,49 +23,68 @@ def create_user(db: Session, user: schemas.UserCreate):
         created_at=datetime.utcnow()
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-def get_user(db: Session, user_id: int) -> models.User:
+async def get_user(db: AsyncSession, user_id: int) -> models.User:
     """Получает пользователя по ID"""
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    result = await db.execute(select(models.User).where(models.User.id == user_id))
+    return result.scalars().first()
 
-def get_user_by_email(db: Session, email: str) -> models.User:
+async def get_user_by_email(db: AsyncSession, email: str) -> models.User:
     """Получает пользователя по email"""
-    return db.query(models.User).filter(models.User.email == email).first()
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
+
+def schema_columns(model, schema):
+    """Колонки таблицы, которые есть в схеме ответа: списки читаются строками, без ORM-объектов"""
+    table = model.__table__
+    return [table.c[name] for name in schema.model_fields if name in table.c]
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+USER_PAGE_KEY = [models.User.id]
 
-def update_user(db: Session, user_id: int, user: schemas.UserCreate):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100, after: str = None):
+    """Страница пользователей по id; возвращает (строки по схеме User, курсор следующей страницы)"""
+    query = select(*schema_columns(models.User, schemas.User))
+    query = pagination.keyset(query, USER_PAGE_KEY, limit, after).offset(skip)
+    result = await db.execute(query)
+    return pagination.split_page(result.all(), USER_PAGE_KEY, limit)
+
+async def update_user(db: AsyncSession, user_id: int, user: schemas.UserCreate):
+    db_user = await get_user(db, user_id=user_id)
     if not db_user:
         return None
     db_user.username = user.username
     db_user.email = user.email
-    db_user.password_hash = pwd_context.hash(user.password)
-    db.commit()
-    db.refresh(db_user)
+    db_user.password_hash = await hasher.hash(user.password)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-def delete_user(db: Session, user_id: int):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def update_password_hash(db: AsyncSession, db_user: models.User, password_hash: str):
+    """Сохраняет пересчитанный хэш пароля (например, после смены стоимости bcrypt)"""
+    db_user.password_hash = password_hash
+    await db.commit()
+    return db_user
+
+async def delete_user(db: AsyncSession, user_id: int):
+    db_user = await get_user(db, user_id=user_id)
     if not db_user:
         return False
-    db.delete(db_user)
-    db.commit()
+    await db.delete(db_user)
+    await db.commit()
     return True
 
-def check_owner_or_admin(db: Session, user_id: int, resource_owner_id: int):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def check_owner_or_admin(db: AsyncSession, user_id: int, resource_owner_id: int):
+    user = await get_user(db, user_id=user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if user.id != resource_owner_id and not user.is_admin:
         raise HTTPException(status_code=403, detail="Forbidden")
-    
+
 # BUILDINGS
-def create_building(db: Session, building: schemas.BuildingCreate, owner_id: int):
+async def create_building(db: AsyncSession, building: schemas.BuildingCreate, owner_id: int):
     db_building = models.Building(
         name=building.name,
         address=building.address,
@@ -67,37 +92,157 @@ def create_building(db: Session, building: schemas.BuildingCreate, owner_id: int
         created_at=datetime.utcnow()  # Явно устанавливаем время
     )
     db.add(db_building)
-    db.commit()
-    db.refresh(db_building)
+    await db.commit()
+    await db.refresh(db_building)
+    await cache.cache.invalidate(generations=[cache.BUILDINGS_LIST])
     return db_building
 
-def get_building(db: Session, building_id: int):
-    return db.query(models.Building).filter(models.Building.id == building_id).first()
+async def get_building(db: AsyncSession, building_id: int):
+    # db.get берет объект из identity map сессии, если он уже загружен в этом запросе
+    return await db.get(models.Building, building_id)
+
+BUILDING_PAGE_KEY = [models.Building.id]
+
+async def collection_stamp(db: AsyncSession, query):
+    """Число строк и max(updated_at) выборки — основа ETag коллекции"""
+    result = await db.execute(query)
+    count, last_modified = result.one()
+    return count, last_modified
+
+def _stamp_query(model):
+    return select(func.count(), func.max(model.updated_at)).select_from(model)
+
+def _dump_rows(adapter, rows) -> list:
+    # В кэш кладутся JSON-совместимые dict — из кэша страница отдается без повторной проверки
+    return adapter.dump_python(adapter.validate_python(rows, from_attributes=True), mode="json")
+
+def _page(items, next_cursor, etag: str, last_modified) -> dict:
+    # Страница хранится в кэше вместе с валидаторами, чтобы 304 не требовал запросов к БД
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "etag": etag,
+        "last_modified": last_modified.isoformat() if last_modified else None
+    }
+
+async def get_buildings(db: AsyncSession, skip: int = 0, limit: int = 100, after: str = None):
+    """Страница зданий по id; возвращает (строки по схеме Building, курсор следующей страницы)"""
+    query = select(*schema_columns(models.Building, schemas.Building))
+    query = pagination.keyset(query, BUILDING_PAGE_KEY, limit, after).offset(skip)
+    result = await db.execute(query)
+    return pagination.split_page(result.all(), BUILDING_PAGE_KEY, limit)
+
+async def get_building_cached(db: AsyncSession, building_id: int):
+    """Здание для чтения (dict по схеме Building) через кэш"""
+    async def load():
+        db_building = await get_building(db, building_id)
+        if db_building is None:
+            return None
+        return schemas.Building.model_validate(db_building, from_attributes=True).model_dump(mode="json")
+    return await cache.cache.get_or_load(cache.building_key(building_id), load)
 
-def get_buildings(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Building).offset(skip).limit(limit).all()
+async def get_buildings_cached(db: AsyncSession, skip: int = 0, limit: int = 100, after: str = None):
+    """Страница зданий через кэш; возвращает dict с items, next_cursor, etag и last_modified"""
+    async def load():
+        count, last_modified = await collection_stamp(db, _stamp_query(models.Building))
+        buildings, next_cursor = await get_buildings(db, skip=skip, limit=limit, after=after)
+        return _page(
+            _dump_rows(schemas.buildings_adapter, buildings),
+            next_cursor,
+            conditional.make_etag("buildings", count, last_modified, skip, limit, after),
+            last_modified
+        )
+    key = await cache.cache.list_key(cache.BUILDINGS_LIST, skip, limit, after)
+    return await cache.cache.get_or_load(key, load)
 
-def update_building(db: Session, building_id: int, building: schemas.BuildingCreate):
-    db_building = db.query(models.Building).filter(models.Building.id == building_id).first()
+async def get_open_incident_counts(db: AsyncSession, sensor_ids) -> dict:
+    """{sensor_id: число нерешенных инцидентов} одним сгруппированным запросом"""
+    if not sensor_ids:
+        return {}
+    result = await db.execute(
+        select(models.Incident.sensor_id, func.count())
+        .where(models.Incident.sensor_id.in_(sensor_ids), ~models.Incident.resolved)
+        .group_by(models.Incident.sensor_id)
+    )
+    return dict(result.all())
+
+async def get_building_stats(db: AsyncSession, building_ids) -> dict:
+    """{building_id: BuildingStats} для набора зданий одним сгруппированным запросом"""
+    if not building_ids:
+        return {}
+    result = await db.execute(
+        select(
+            models.Sensor.building_id,
+            func.count(distinct(models.Sensor.id)),
+            func.count(distinct(models.Sensor.id)).filter(models.Sensor.is_active),
+            func.count(models.Incident.id)
+        )
+        .outerjoin(
+            models.Incident,
+            (models.Incident.sensor_id == models.Sensor.id) & ~models.Incident.resolved
+        )
+        .where(models.Sensor.building_id.in_(building_ids))
+        .group_by(models.Sensor.building_id)
+    )
+    return {
+        building_id: schemas.BuildingStats(
+            sensor_count=sensor_count, active_sensor_count=active_count, open_incidents=open_incidents
+        )
+        for building_id, sensor_count, active_count, open_incidents in result.all()
+    }
+
+async def get_building_overview(db: AsyncSession, building_id: int):
+    """
+    Здание, его датчики и число открытых инцидентов по каждому датчику.
+    Не более трех запросов: здание, датчики (selectinload), сгруппированные счетчики.
+    """
+    result = await db.execute(
+        select(models.Building)
+        .options(selectinload(models.Building.sensors))
+        .where(models.Building.id == building_id)
+    )
+    db_building = result.scalars().first()
+    if db_building is None:
+        return None
+    sensors = sorted(db_building.sensors, key=lambda sensor: sensor.id)
+    counts = await get_open_incident_counts(db, [sensor.id for sensor in sensors])
+    overview = schemas.Building.model_validate(db_building, from_attributes=True).model_dump()
+    overview["sensors"] = [
+        {**schemas.Sensor.model_validate(sensor, from_attributes=True).model_dump(), "open_incidents": counts.get(sensor.id, 0)}
+        for sensor in sensors
+    ]
+    overview["open_incidents"] = sum(counts.values())
+    return overview
+
+async def update_building(db: AsyncSession, building_id: int, building: schemas.BuildingCreate):
+    db_building = await get_building(db, building_id=building_id)
     if not db_building:
         return None
     db_building.name = building.name
     db_building.address = building.address
     #db_building.owner_id = building.owner_id
-    db.commit()
-    db.refresh(db_building)
+    await db.commit()
+    await cache.cache.invalidate(keys=[cache.building_key(building_id)], generations=[cache.BUILDINGS_LIST])
     return db_building
 
-def delete_building(db: Session, building_id: int):
-    db_building = db.query(models.Building).filter(models.Building.id == building_id).first()
+async def delete_building(db: AsyncSession, building_id: int):
+    db_building = await get_building(db, building_id=building_id)
     if not db_building:
         return False
-    db.delete(db_building)
-    db.commit()
+    # У датчиков здания при удалении обнуляется building_id — их записи в кэше тоже устаревают
+    # (коллекция загружается здесь, ORM использует ее же при удалении)
+    await db.refresh(db_building, ["sensors"])
+    sensor_ids = [sensor.id for sensor in db_building.sensors]
+    await db.delete(db_building)
+    await db.commit()
+    await cache.cache.invalidate(
+        keys=[cache.building_key(building_id)] + [cache.sensor_key(sensor_id) for sensor_id in sensor_ids],
+        generations=[cache.BUILDINGS_LIST, cache.SENSORS_LIST_ALL, cache.sensors_list_of(building_id)]
+    )
     return True
 
 # SENSORS
-def create_sensor(db: Session, sensor: schemas.SensorCreate):
+async def create_sensor(db: AsyncSession, sensor: schemas.SensorCreate):
     db_sensor = models.Sensor(
         type=sensor.type,
         location=sensor.location,
@@ -106,73 +251,370 @@ def create_sensor(db: Session, sensor: schemas.SensorCreate):
         is_active=sensor.is_active
     )
     db.add(db_sensor)
-    db.commit()
-    db.refresh(db_sensor)
+    await db.commit()
+    await db.refresh(db_sensor)
+    await cache.cache.invalidate(
+        generations=[cache.SENSORS_LIST_ALL, cache.sensors_list_of(sensor.building_id)]
+    )
     return db_sensor
 
-def get_sensor(db: Session, sensor_id: int):
-    return db.query(models.Sensor).filter(models.Sensor.id == sensor_id).first()
+async def get_sensor(db: AsyncSession, sensor_id: int):
+    return await db.get(models.Sensor, sensor_id)
 
-def get_sensors(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Sensor).offset(skip).limit(limit).all()
+async def get_sensor_with_owner(db: AsyncSession, sensor_id: int):
+    """
+    Загружает датчик и owner_id его здания одним запросом (sensor -> building).
+    Возвращает None, если датчика нет; owner_id = None, если нет здания.
+    """
+    result = await db.execute(
+        select(models.Sensor, models.Building.owner_id)
+        .outerjoin(models.Building, models.Sensor.building_id == models.Building.id)
+        .where(models.Sensor.id == sensor_id)
+    )
+    return result.first()
 
-def update_sensor(db: Session, sensor_id: int, sensor: schemas.SensorCreate):
-    db_sensor = db.query(models.Sensor).filter(models.Sensor.id == sensor_id).first()
+async def get_sensor_overview(db: AsyncSession, sensor_id: int, incident_limit: int = 100):
+    """Датчик с его зданием (joinedload) и последними инцидентами: два запроса"""
+    result = await db.execute(
+        select(models.Sensor)
+        .options(joinedload(models.Sensor.building))
+        .where(models.Sensor.id == sensor_id)
+    )
+    db_sensor = result.scalars().first()
+    if db_sensor is None:
+        return None
+    incidents = await db.execute(
+        select(models.Incident)
+        .where(models.Incident.sensor_id == sensor_id)
+        .order_by(*(column.desc() for column in INCIDENT_PAGE_KEY))
+        .limit(incident_limit)
+    )
+    overview = schemas.Sensor.model_validate(db_sensor, from_attributes=True).model_dump()
+    overview["building"] = db_sensor.building
+    overview["incidents"] = incidents.scalars().all()
+    return overview
+
+SENSOR_PAGE_KEY = [models.Sensor.id]
+
+async def get_sensors(db: AsyncSession, skip: int = 0, limit: int = 100, building_id: int = None, after: str = None):
+    """Страница датчиков по id; возвращает (строки по схеме Sensor, курсор следующей страницы)"""
+    query = select(*schema_columns(models.Sensor, schemas.Sensor))
+    if building_id is not None:
+        query = query.where(models.Sensor.building_id == building_id)
+    query = pagination.keyset(query, SENSOR_PAGE_KEY, limit, after).offset(skip)
+    result = await db.execute(query)
+    return pagination.split_page(result.all(), SENSOR_PAGE_KEY, limit)
+
+async def get_sensor_cached(db: AsyncSession, sensor_id: int):
+    """Датчик для чтения (dict по схеме Sensor) через кэш"""
+    async def load():
+        db_sensor = await get_sensor(db, sensor_id)
+        if db_sensor is None:
+            return None
+        return schemas.Sensor.model_validate(db_sensor, from_attributes=True).model_dump(mode="json")
+    return await cache.cache.get_or_load(cache.sensor_key(sensor_id), load)
+
+async def get_sensors_cached(
+    db: AsyncSession, skip: int = 0, limit: int = 100, building_id: int = None, after: str = None
+):
+    """Страница датчиков через кэш; список здания инвалидируется отдельно от общего"""
+    async def load():
+        stamp_query = _stamp_query(models.Sensor)
+        if building_id is not None:
+            stamp_query = stamp_query.where(models.Sensor.building_id == building_id)
+        count, last_modified = await collection_stamp(db, stamp_query)
+        sensors, next_cursor = await get_sensors(db, skip=skip, limit=limit, building_id=building_id, after=after)
+        return _page(
+            _dump_rows(schemas.sensors_adapter, sensors),
+            next_cursor,
+            conditional.make_etag("sensors", count, last_modified, building_id, skip, limit, after),
+            last_modified
+        )
+    generation = cache.SENSORS_LIST_ALL if building_id is None else cache.sensors_list_of(building_id)
+    key = await cache.cache.list_key(generation, skip, limit, after)
+    return await cache.cache.get_or_load(key, load)
+
+async def update_sensor(db: AsyncSession, sensor_id: int, sensor: schemas.SensorCreate):
+    db_sensor = await get_sensor(db, sensor_id=sensor_id)
     if not db_sensor:
         return None
+    old_building_id = db_sensor.building_id
     db_sensor.type = sensor.type
     db_sensor.location = sensor.location
     db_sensor.installed_at = sensor.installed_at
     db_sensor.building_id = sensor.building_id
     db_sensor.is_active = sensor.is_active
-    db.commit()
-    db.refresh(db_sensor)
+    await db.commit()
+    await cache.cache.invalidate(
+        keys=[cache.sensor_key(sensor_id)],
+        generations={
+            cache.SENSORS_LIST_ALL,
+            cache.sensors_list_of(old_building_id),
+            cache.sensors_list_of(sensor.building_id)
+        }
+    )
     return db_sensor
 
-def delete_sensor(db: Session, sensor_id: int):
-    db_sensor = db.query(models.Sensor).filter(models.Sensor.id == sensor_id).first()
+async def delete_sensor(db: AsyncSession, sensor_id: int):
+    db_sensor = await get_sensor(db, sensor_id=sensor_id)
     if not db_sensor:
         return False
-    db.delete(db_sensor)
-    db.commit()
+    building_id = db_sensor.building_id
+    await db.delete(db_sensor)
+    await db.commit()
+    await cache.cache.invalidate(
+        keys=[cache.sensor_key(sensor_id)],
+        generations=[cache.SENSORS_LIST_ALL, cache.sensors_list_of(building_id)]
+    )
     return True
 
 # INCIDENTS
-def create_incident(db: Session, incident: schemas.IncidentCreate):
+def incident_facts(incident, building_id: int) -> analytics.IncidentFacts:
+    """Состояние инцидента для агрегатов; incident — ORM-объект или строка RETURNING"""
+    get = incident.get if isinstance(incident, dict) else lambda name: getattr(incident, name)
+    return analytics.IncidentFacts(
+        detected_at=_naive_utc(get("detected_at")),
+        sensor_id=get("sensor_id"),
+        building_id=building_id,
+        level=get("level"),
+        resolved_at=get("resolved_at") if get("resolved") else None
+    )
+
+async def create_incident(db: AsyncSession, incident: schemas.IncidentCreate):
     db_incident = models.Incident(
         level=incident.level,
         description=incident.description,
         sensor_id=incident.sensor_id,
-        detected_at=incident.detected_at or datetime.utcnow(),  # Установка времени
+        # Время с часовым поясом (ISO с Z или +03:00 из формы) приводится к UTC без пояса
+        detected_at=_naive_utc(incident.detected_at) or datetime.utcnow(),
         resolved=False
     )
     db.add(db_incident)
-    db.commit()
-    db.refresh(db_incident)
+    # Датчик обычно уже в identity map сессии (проверка в обработчике)
+    sensor = await db.get(models.Sensor, incident.sensor_id)
+    await analytics.apply(db, [(incident_facts(db_incident, sensor.building_id if sensor else None), 1)])
+    await db.commit()
+    await db.refresh(db_incident)
     return db_incident
 
-def get_incident(db: Session, incident_id: int):
-    return db.query(models.Incident).filter(models.Incident.id == incident_id).first()
+async def get_sensor_building_ids(db: AsyncSession, sensor_ids, lock: bool = False) -> dict:
+    """
+    Возвращает {sensor_id: building_id} для существующих датчиков из переданных (один запрос с IN).
+    lock=True — FOR KEY SHARE до конца транзакции: датчик нельзя удалить, пока на него
+    ссылаются вставляемые строки, и внешний ключ не отклонит весь пакет.
+    """
+    if not sensor_ids:
+        return {}
+    query = select(models.Sensor.id, models.Sensor.building_id).where(models.Sensor.id.in_(set(sensor_ids)))
+    if lock:
+        query = query.with_for_update(key_share=True)
+    result = await db.execute(query)
+    return dict(result.all())
+
+async def create_incidents_bulk(db: AsyncSession, incidents: list, building_ids: dict = None):
+    """
+    Вставляет инциденты одним многострочным INSERT ... RETURNING в одной транзакции.
+    building_ids — {sensor_id: building_id}, если уже загружен вызывающим кодом
+    в той же транзакции с lock=True.
+    """
+    if not incidents:
+        return []
+    if building_ids is None:
+        building_ids = await get_sensor_building_ids(db, [incident.sensor_id for incident in incidents], lock=True)
+    now = datetime.utcnow()
+    rows = [
+        {
+            "level": incident.level,
+            "description": incident.description,
+            "sensor_id": incident.sensor_id,
+            "detected_at": _naive_utc(incident.detected_at) or now,
+            "resolved": False
+        }
+        for incident in incidents
+    ]
+    table = models.Incident.__table__
+    result = await db.execute(insert(table).values(rows).returning(*table.c))
+    created = result.mappings().all()
+    await analytics.apply(db, [(incident_facts(row, building_ids.get(row["sensor_id"])), 1) for row in created])
+    await db.commit()
+    return created
+
+def _recent_first(query, incident_id: int):
+    """
+    Поиск инцидента по id сначала в секциях горячего окна: id уникален, поэтому
+    UNION ALL с LIMIT 1 не доходит до старых секций, если строка нашлась в окне.
+    """
+    cutoff = partitions.recent_cutoff()
+    query = query.where(models.Incident.id == incident_id)
+    return union_all(
+        query.where(models.Incident.detected_at >= cutoff),
+        query.where(models.Incident.detected_at < cutoff)
+    ).limit(1)
+
+async def get_incident(db: AsyncSession, incident_id: int):
+    statement = _recent_first(select(models.Incident), incident_id)
+    result = await db.execute(select(models.Incident).from_statement(statement))
+    return result.scalars().first()
+
+# Инциденты отдаются от новых к старым
+INCIDENT_PAGE_KEY = [models.Incident.detected_at, models.Incident.id]
 
-def get_incidents(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Incident).offset(skip).limit(limit).all()
+def _naive_utc(value: datetime) -> datetime:
+    # detected_at хранится как TIMESTAMP без часового пояса (UTC)
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
-def update_incident(db: Session, incident_id: int, incident: schemas.IncidentCreate):
-    db_incident = db.query(models.Incident).filter(models.Incident.id == incident_id).first()
-    if not db_incident:
+def filter_incidents(
+    query,
+    sensor_id: int = None,
+    building_id: int = None,
+    level: str = None,
+    resolved: bool = None,
+    detected_from: datetime = None,
+    detected_to: datetime = None
+):
+    """Применяет фильтры списка инцидентов к запросу"""
+    if sensor_id is not None:
+        query = query.where(models.Incident.sensor_id == sensor_id)
+    if building_id is not None:
+        query = query.join(models.Sensor, models.Incident.sensor_id == models.Sensor.id).where(
+            models.Sensor.building_id == building_id
+        )
+    if level is not None:
+        query = query.where(models.Incident.level == level)
+    if resolved is not None:
+        query = query.where(models.Incident.resolved == resolved)
+    if detected_from is not None:
+        query = query.where(models.Incident.detected_at >= _naive_utc(detected_from))
+    if detected_to is not None:
+        query = query.where(models.Incident.detected_at < _naive_utc(detected_to))
+    return query
+
+async def get_incident_with_building(db: AsyncSession, incident_id: int):
+    """Загружает инцидент и building_id его датчика одним запросом; None, если инцидента нет"""
+    statement = _recent_first(
+        select(models.Incident, models.Sensor.building_id)
+        .outerjoin(models.Sensor, models.Incident.sensor_id == models.Sensor.id),
+        incident_id
+    )
+    result = await db.execute(select(models.Incident, models.Sensor.building_id).from_statement(statement))
+    return result.first()
+
+async def get_incidents_stamp(
+    db: AsyncSession,
+    resolved: bool = None,
+    sensor_id: int = None,
+    building_id: int = None,
+    level: str = None,
+    detected_from: datetime = None,
+    detected_to: datetime = None
+):
+    """(число, max(updated_at)) инцидентов с теми же фильтрами, что и у списка"""
+    query = filter_incidents(
+        _stamp_query(models.Incident),
+        sensor_id=sensor_id,
+        building_id=building_id,
+        level=level,
+        resolved=resolved,
+        detected_from=detected_from,
+        detected_to=detected_to
+    )
+    if building_id is None:
+        return await collection_stamp(db, query)
+    # Фильтр по зданию идет через sensors.building_id: перенос датчика меняет выборку,
+    # не трогая incidents.updated_at, поэтому в отметку входит и max(sensors.updated_at)
+    result = await db.execute(query.add_columns(func.max(models.Sensor.updated_at)))
+    count, incidents_modified, sensors_modified = result.one()
+    return count, max((value for value in (incidents_modified, sensors_modified) if value is not None), default=None)
+
+async def get_incidents(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    resolved: bool = None,
+    after: str = None,
+    sensor_id: int = None,
+    building_id: int = None,
+    level: str = None,
+    detected_from: datetime = None,
+    detected_to: datetime = None
+):
+    """
+    Страница инцидентов по (detected_at, id) по убыванию; возвращает (строки по схеме Incident, курсор).
+    Страница без смещения сначала читается из горячего окна (partitions.recent_cutoff); более
+    старые секции запрашиваются вторым запросом, только если окно не заполнило страницу.
+    """
+    query = filter_incidents(
+        select(*schema_columns(models.Incident, schemas.Incident)),
+        sensor_id=sensor_id,
+        building_id=building_id,
+        level=level,
+        resolved=resolved,
+        detected_from=detected_from,
+        detected_to=detected_to
+    )
+    cutoff = partitions.recent_cutoff()
+    position = pagination.decode_cursor(after, INCIDENT_PAGE_KEY)[0] if after else None
+    windowed = (
+        skip == 0
+        and (detected_from is None or _naive_utc(detected_from) < cutoff)
+        and (detected_to is None or _naive_utc(detected_to) > cutoff)
+        and (position is None or position >= cutoff)
+    )
+    if not windowed:
+        query = pagination.keyset(query, INCIDENT_PAGE_KEY, limit, after, descending=True).offset(skip)
+        result = await db.execute(query)
+        return pagination.split_page(result.all(), INCIDENT_PAGE_KEY, limit)
+
+    recent = pagination.keyset(
+        query.where(models.Incident.detected_at >= cutoff), INCIDENT_PAGE_KEY, limit, after, descending=True
+    )
+    rows = (await db.execute(recent)).all()
+    if len(rows) <= limit:
+        # Строки старше окна идут после всех строк окна — курсор для них не нужен
+        older = pagination.keyset(
+            query.where(models.Incident.detected_at < cutoff), INCIDENT_PAGE_KEY, limit - len(rows), descending=True
+        )
+        rows += (await db.execute(older)).all()
+    return pagination.split_page(rows, INCIDENT_PAGE_KEY, limit)
+
+async def set_incident_fields(db: AsyncSession, db_incident: models.Incident, building_id: int, fields: dict):
+    """Изменяет поля инцидента и агрегаты аналитики в текущей транзакции (без commit)"""
+    before = incident_facts(db_incident, building_id)
+    was_resolved = db_incident.resolved
+    for field, value in fields.items():
+        setattr(db_incident, field, value)
+    if db_incident.resolved and not was_resolved:
+        db_incident.resolved_at = datetime.utcnow()
+    elif was_resolved and not db_incident.resolved:
+        db_incident.resolved_at = None
+    if "sensor_id" in fields and fields["sensor_id"] != before.sensor_id:
+        sensor = await get_sensor(db, fields["sensor_id"])
+        building_id = sensor.building_id if sensor else None
+    await analytics.apply(db, [(before, -1), (incident_facts(db_incident, building_id), 1)])
+
+async def update_incident(db: AsyncSession, incident_id: int, incident: schemas.IncidentCreate):
+    row = await get_incident_with_building(db, incident_id=incident_id)
+    if not row:
         return None
-    db_incident.level = incident.level
-    db_incident.description = incident.description
-    db_incident.sensor_id = incident.sensor_id
-    db_incident.resolved = getattr(incident, "resolved", db_incident.resolved)
-    db.commit()
-    db.refresh(db_incident)
+    db_incident, building_id = row
+    await set_incident_fields(db, db_incident, building_id, {
+        "level": incident.level,
+        "description": incident.description,
+        "sensor_id": incident.sensor_id,
+        "resolved": getattr(incident, "resolved", db_incident.resolved)
+    })
+    await db.commit()
+    await db.refresh(db_incident)
     return db_incident
 
-def delete_incident(db: Session, incident_id: int):
-    db_incident = db.query(models.Incident).filter(models.Incident.id == incident_id).first()
-    if not db_incident:
+async def delete_incident(db: AsyncSession, incident_id: int):
+    row = await get_incident_with_building(db, incident_id=incident_id)
+    if not row:
         return False
-    db.delete(db_incident)
-    db.commit()
-    return True
\ No newline at end of file
+    db_incident, building_id = row
+    await analytics.apply(db, [(incident_facts(db_incident, building_id), -1)])
+    await db.delete(db_incident)
+    await db.commit()
+    return True
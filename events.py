@@ -0,0 +1,239 @@
+import asyncio
+import json
+import os
+from typing import Optional
+from sqlalchemy.engine import make_url
+import database
+from logger import logger
+
+# Бэкенд доставки событий: "memory" — только текущий процесс,
+# "postgres" — через LISTEN/NOTIFY, события видят все воркеры uvicorn
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "incident_events")
+# Размер буфера подписчика; переполнение означает медленного клиента — он отключается
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "100"))
+# Проверка соединения LISTEN и предельная пауза между попытками переподключения, секунды
+EVENTS_HEALTHCHECK_INTERVAL = float(os.getenv("EVENTS_HEALTHCHECK_INTERVAL", "30"))
+EVENTS_RECONNECT_MAX_DELAY = float(os.getenv("EVENTS_RECONNECT_MAX_DELAY", "30"))
+
+# Payload NOTIFY должен быть короче 8000 байт
+NOTIFY_MAX_PAYLOAD = 7999
+
+
+class Subscription:
+    """Подписка клиента; building_id = None — все здания"""
+
+    def __init__(self, building_id: Optional[int], maxsize: int):
+        self.building_id = building_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def matches(self, event: dict) -> bool:
+        return self.building_id is None or event.get("building_id") == self.building_id
+
+    def close(self):
+        """Закрывает подписку: очередь очищается, потребитель получает None"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class InProcessBackend:
+    """Доставка внутри процесса"""
+
+    def __init__(self, broker: "Broker"):
+        self.broker = broker
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: dict):
+        self.broker.deliver(event)
+
+
+class PostgresNotifyBackend:
+    """
+    Доставка через LISTEN/NOTIFY: каждый воркер слушает канал своим соединением.
+    pg_notify идет через отдельное соединение под блокировкой — asyncpg не допускает
+    параллельных операций на одном соединении. Потерянное соединение LISTEN восстанавливается;
+    события, отправленные во время переподключения, этим воркером не будут получены.
+    """
+
+    def __init__(self, broker: "Broker", channel: str = EVENTS_CHANNEL, dsn: str = None):
+        self.broker = broker
+        self.channel = channel
+        self.dsn = dsn or make_url(database.ASYNC_DATABASE_URL).set(
+            drivername="postgresql"
+        ).render_as_string(hide_password=False)
+        self._listen_conn = None
+        self._publish_conn = None
+        self._publish_lock = asyncio.Lock()
+        self._lost = asyncio.Event()
+        self._task = None
+        self.reconnects = 0
+        self.truncated = 0
+
+    async def start(self):
+        await self._listen()
+        self._task = asyncio.create_task(self._supervise())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for conn in (self._listen_conn, self._publish_conn):
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        self._listen_conn = self._publish_conn = None
+
+    async def _listen(self):
+        import asyncpg
+        self._lost.clear()
+        conn = await asyncpg.connect(self.dsn)
+        conn.add_termination_listener(lambda connection: self._lost.set())
+        await conn.add_listener(self.channel, self._on_notify)
+        self._listen_conn = conn
+
+    async def _supervise(self):
+        """Ждет потери соединения LISTEN (или не отвечающего сервера) и переподключается"""
+        delay = 1.0
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), timeout=EVENTS_HEALTHCHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                try:
+                    await asyncio.wait_for(self._listen_conn.execute("SELECT 1"), timeout=EVENTS_HEALTHCHECK_INTERVAL)
+                    continue
+                except Exception:
+                    pass
+            logger.warning(f"Event listener connection on {self.channel} lost, reconnecting")
+            self._listen_conn.terminate()
+            while True:
+                try:
+                    await self._listen()
+                    self.reconnects += 1
+                    delay = 1.0
+                    break
+                except Exception as e:
+                    logger.error(f"Event listener reconnect failed: {str(e)}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, EVENTS_RECONNECT_MAX_DELAY)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            self.broker.deliver(json.loads(payload))
+        except ValueError:
+            logger.warning(f"Malformed event payload on {channel}")
+
+    def encode(self, event: dict) -> str:
+        """
+        JSON события в пределах лимита NOTIFY: сначала отбрасывается описание инцидента,
+        затем остается только id; такие события помечены truncated=true.
+        """
+        payload = json.dumps(event, default=str)
+        if len(payload.encode()) <= NOTIFY_MAX_PAYLOAD:
+            return payload
+        self.truncated += 1
+        incident = event.get("incident") or {}
+        for reduced in (
+            {key: value for key, value in incident.items() if key != "description"},
+            {"id": incident.get("id")},
+        ):
+            payload = json.dumps({**event, "incident": reduced, "truncated": True}, default=str)
+            if len(payload.encode()) <= NOTIFY_MAX_PAYLOAD:
+                return payload
+        return json.dumps(
+            {"type": event.get("type"), "building_id": event.get("building_id"), "incident": {"id": incident.get("id")},
+             "truncated": True},
+            default=str
+        )
+
+    async def publish(self, event: dict):
+        import asyncpg
+        payload = self.encode(event)
+        async with self._publish_lock:
+            # Одна повторная попытка на новом соединении, если прежнее разорвано
+            for attempt in range(2):
+                if self._publish_conn is None or self._publish_conn.is_closed():
+                    self._publish_conn = await asyncpg.connect(self.dsn)
+                try:
+                    await self._publish_conn.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+                    return
+                except (asyncpg.ConnectionDoesNotExistError, asyncpg.InterfaceError, OSError):
+                    self._publish_conn.terminate()
+                    self._publish_conn = None
+                    if attempt:
+                        raise
+
+
+class Broker:
+    """Pub/sub для событий инцидентов с подписками по зданиям"""
+
+    def __init__(self, backend: str = EVENTS_BACKEND, buffer_size: int = EVENTS_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._subscriptions = set()
+        self.backend = PostgresNotifyBackend(self) if backend == "postgres" else InProcessBackend(self)
+        self.published = 0
+        self.delivered = 0
+        self.dropped_subscribers = 0
+
+    async def start(self):
+        await self.backend.start()
+
+    async def stop(self):
+        for subscription in list(self._subscriptions):
+            self.unsubscribe(subscription)
+            subscription.close()
+        await self.backend.stop()
+
+    def subscribe(self, building_id: Optional[int] = None) -> Subscription:
+        subscription = Subscription(building_id, self.buffer_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def deliver(self, event: dict):
+        """Раздает событие подписчикам этого процесса, не блокируясь на медленных"""
+        for subscription in list(self._subscriptions):
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                self.unsubscribe(subscription)
+                subscription.close()
+                self.dropped_subscribers += 1
+                logger.warning("Slow event subscriber dropped")
+
+    async def publish(self, event: dict):
+        self.published += 1
+        try:
+            await self.backend.publish(event)
+        except Exception as e:
+            # Push-канал не должен ломать запрос, изменивший данные
+            logger.error(f"Event publish failed: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "reconnects": getattr(self.backend, "reconnects", 0),
+            "truncated": getattr(self.backend, "truncated", 0),
+            "subscribers": len(self._subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped_subscribers": self.dropped_subscribers,
+        }
+
+
+broker = Broker()
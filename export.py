@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import date, datetime
+from sqlalchemy import select, text
+from logger import logger
+
+# Строк в одной выборке серверного курсора и в одном куске ответа
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+# statement_timeout для выгрузки (мс); 0 — без ограничения, выгрузка может идти долго
+EXPORT_STATEMENT_TIMEOUT_MS = int(os.getenv("EXPORT_STATEMENT_TIMEOUT_MS", "0"))
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def _ndjson_chunk(columns: list, rows) -> str:
+    return "".join(
+        json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default) + "\n" for row in rows
+    )
+
+def _csv_chunk(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [value.isoformat() if isinstance(value, (datetime, date)) else value for value in row] for row in rows
+    )
+    return buffer.getvalue()
+
+def table_query(table, after_id: int = None, until_id: int = None):
+    """Все столбцы таблицы без ORM в порядке id; диапазон (after_id, until_id] — для докачки"""
+    query = select(*table.c).order_by(table.c.id)
+    if after_id is not None:
+        query = query.where(table.c.id > after_id)
+    if until_id is not None:
+        query = query.where(table.c.id <= until_id)
+    return query
+
+async def stream_rows(engine, query, fmt: str = "ndjson", compress: bool = False):
+    """
+    Генератор тела ответа: строки читаются серверным курсором пакетами по EXPORT_BATCH_SIZE
+    и сразу пишутся в ответ, поэтому память не зависит от объема выгрузки.
+    Соединение берется у engine: сессия запроса закрывается до начала отправки тела.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # 31 — формат gzip
+
+    def encode(chunk: str) -> bytes:
+        data = chunk.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    columns = [column.name for column in query.selected_columns]
+    exported = 0
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text(f"SET LOCAL statement_timeout = {EXPORT_STATEMENT_TIMEOUT_MS}"))
+            if fmt == "csv":
+                yield encode(_csv_chunk([columns]))
+            result = await conn.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for rows in result.partitions():
+                chunk = _ndjson_chunk(columns, rows) if fmt == "ndjson" else _csv_chunk(rows)
+                exported += len(rows)
+                data = encode(chunk)
+                if data:
+                    yield data
+    except Exception as e:
+        # Статус уже отправлен; клиент докачает с after_id последней полученной строки
+        logger.error(f"Export failed after {exported} rows: {str(e)}")
+        raise
+    if compressor:
+        # Завершающий блок gzip пишется только при полной выгрузке — обрыв виден при распаковке
+        yield compressor.flush()
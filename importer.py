@@ -0,0 +1,245 @@
+import codecs
+import csv
+import json
+import os
+from typing import AsyncIterator, Optional
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+import cache
+import database
+import schemas
+from logger import logger
+
+# Строк в одном COPY во временную таблицу
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Ошибок в отчете; остальные только считаются
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+FORMATS = ("csv", "ndjson")
+
+
+class ImportReport:
+    """Итог импорта: счетчики и ошибки по номерам строк файла (с 1, без заголовка CSV)"""
+
+    def __init__(self):
+        self.received = 0
+        self.created = 0
+        self.existing = 0
+        self.failed = 0
+        self.errors = []
+        self.rows = None
+
+    def error(self, row: int, message: str):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def as_dict(self) -> dict:
+        result = {
+            "received": self.received,
+            "created": self.created,
+            "existing": self.existing,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+        }
+        if self.rows is not None:
+            result["rows"] = self.rows
+        return result
+
+
+async def _lines(chunks: AsyncIterator[bytes]):
+    """Строки из потока байтов без загрузки всего тела в память"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str):
+    """Записи файла: (номер строки, dict) или (номер строки, текст ошибки разбора)"""
+    number = 0
+    if fmt == "ndjson":
+        async for line in _lines(chunks):
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, f"Invalid JSON: {str(e)}"
+                continue
+            yield number, record if isinstance(record, dict) else "Row must be a JSON object"
+        return
+
+    header = None
+    record_text = ""
+    async for line in _lines(chunks):
+        record_text += line
+        # Поле в кавычках может содержать перевод строки: запись закончена, когда кавычки парные
+        if record_text.count('"') % 2:
+            continue
+        text_, record_text = record_text, ""
+        if not text_.strip():
+            continue
+        values = next(csv.reader([text_]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        number += 1
+        if len(values) != len(header):
+            yield number, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # Пустая ячейка CSV — отсутствующее значение
+        yield number, {name: value if value != "" else None for name, value in zip(header, values)}
+    if record_text.strip():
+        yield number + 1, "Unterminated quoted field"
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+
+async def _stage(db: AsyncSession, chunks, fmt: str, schema, table: str, columns: tuple, to_record, report: ImportReport):
+    """Проверяет записи схемой и пишет корректные во временную таблицу через COPY пакетами"""
+    conn = await db.connection()
+    raw = (await conn.get_raw_connection()).driver_connection
+    batch = []
+    async for number, record in iter_records(chunks, fmt):
+        report.received += 1
+        if isinstance(record, str):
+            report.error(number, record)
+            continue
+        try:
+            item = schema.model_validate(record)
+        except ValidationError as e:
+            report.error(number, _format_validation_error(e))
+            continue
+        batch.append((number,) + to_record(item))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await raw.copy_records_to_table(table, records=batch, columns=("row_no",) + columns)
+            batch = []
+    if batch:
+        await raw.copy_records_to_table(table, records=batch, columns=("row_no",) + columns)
+
+
+async def import_buildings(db: AsyncSession, chunks, fmt: str, owner_id: int) -> dict:
+    """
+    Импорт зданий владельца owner_id. Здание с тем же (name, address) у владельца
+    не дублируется — повторный импорт того же файла ничего не создает.
+    В отчете — id здания для каждой принятой строки (нужны для импорта датчиков).
+    """
+    report = ImportReport()
+    await db.execute(text(
+        "CREATE TEMP TABLE import_buildings (row_no INTEGER, name TEXT, address TEXT) ON COMMIT DROP"
+    ))
+    await _stage(
+        db, chunks, fmt, schemas.BuildingCreate, "import_buildings", ("name", "address"),
+        lambda item: (item.name, item.address), report
+    )
+    # Параллельные импорты одного владельца не должны создать дубликаты
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext('import:buildings'), :owner_id)"), {"owner_id": owner_id})
+    created = await db.execute(text(
+        "INSERT INTO buildings (name, address, owner_id) "
+        "SELECT DISTINCT ON (name, address) name, address, :owner_id FROM import_buildings s "
+        "WHERE NOT EXISTS (SELECT 1 FROM buildings b WHERE b.owner_id = :owner_id AND b.name = s.name AND b.address = s.address) "
+        "ORDER BY name, address, row_no "
+        "RETURNING id"
+    ), {"owner_id": owner_id})
+    report.created = len(created.all())
+    rows = await db.execute(text(
+        "SELECT s.row_no, b.id FROM import_buildings s "
+        "JOIN buildings b ON b.owner_id = :owner_id AND b.name = s.name AND b.address = s.address "
+        "ORDER BY s.row_no"
+    ), {"owner_id": owner_id})
+    report.rows = [{"row": row_no, "id": building_id} for row_no, building_id in rows.all()]
+    report.existing = len(report.rows) - report.created
+    await db.commit()
+    await cache.cache.invalidate(generations=[cache.BUILDINGS_LIST])
+    logger.info(f"Buildings import: {report.created} created, {report.existing} existing, {report.failed} failed")
+    return report.as_dict()
+
+async def import_sensors(db: AsyncSession, chunks, fmt: str, owner_id: Optional[int]) -> dict:
+    """
+    Импорт датчиков в существующие здания; owner_id = None — без проверки владельца (администратор).
+    Датчик с тем же (building_id, type, location) не дублируется.
+    """
+    report = ImportReport()
+    await db.execute(text(
+        "CREATE TEMP TABLE import_sensors (row_no INTEGER, type TEXT, location TEXT, installed_at DATE, "
+        "building_id INTEGER, is_active BOOLEAN) ON COMMIT DROP"
+    ))
+    await _stage(
+        db, chunks, fmt, schemas.SensorCreate, "import_sensors",
+        ("type", "location", "installed_at", "building_id", "is_active"),
+        lambda item: (
+            item.type,
+            item.location,
+            item.installed_at.date() if item.installed_at else None,
+            item.building_id,
+            item.is_active
+        ),
+        report
+    )
+    # Ссылки на несуществующие и чужие здания — ошибки строк; такие строки не вставляются
+    rejected = await db.execute(text(
+        "DELETE FROM import_sensors s WHERE NOT EXISTS ("
+        "SELECT 1 FROM buildings b WHERE b.id = s.building_id AND (CAST(:owner_id AS INTEGER) IS NULL OR b.owner_id = :owner_id)"
+        ") RETURNING row_no"
+    ), {"owner_id": owner_id})
+    for (row_no,) in sorted(rejected.all()):
+        report.error(row_no, "Building not found")
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext('import:sensors'))"))
+    created = await db.execute(text(
+        "INSERT INTO sensors (type, location, installed_at, building_id, is_active) "
+        "SELECT DISTINCT ON (building_id, type, location) type, location, installed_at, building_id, is_active "
+        "FROM import_sensors s "
+        "WHERE NOT EXISTS (SELECT 1 FROM sensors x "
+        "WHERE x.building_id = s.building_id AND x.type = s.type AND x.location = s.location) "
+        "ORDER BY building_id, type, location, row_no "
+        "RETURNING building_id"
+    ))
+    building_ids = [building_id for (building_id,) in created.all()]
+    report.created = len(building_ids)
+    report.existing = report.received - report.failed - report.created
+    await db.commit()
+    await cache.cache.invalidate(
+        generations=[cache.SENSORS_LIST_ALL] + [cache.sensors_list_of(building_id) for building_id in set(building_ids)]
+    )
+    logger.info(f"Sensors import: {report.created} created, {report.existing} existing, {report.failed} failed")
+    return report.as_dict()
+
+IMPORTERS = {"buildings": import_buildings, "sensors": import_sensors}
+
+
+async def _read_file(path: str, chunk_size: int = 1 << 16):
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+async def _cli(kind: str, path: str, fmt: str, owner_id: Optional[int]) -> dict:
+    try:
+        async with database.AsyncSessionLocal() as db:
+            return await IMPORTERS[kind](db, _read_file(path), fmt, owner_id)
+    finally:
+        await database.async_engine.dispose()
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import sys
+    parser = argparse.ArgumentParser(description="Импорт зданий и датчиков из CSV/NDJSON")
+    parser.add_argument("kind", choices=sorted(IMPORTERS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="по умолчанию — по расширению файла")
+    parser.add_argument("--owner-id", type=int, help="владелец зданий; для датчиков без него владелец не проверяется")
+    args = parser.parse_args()
+    if args.kind == "buildings" and args.owner_id is None:
+        parser.error("--owner-id is required for buildings")
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    report = asyncio.run(_cli(args.kind, args.path, fmt, args.owner_id))
+    print(json.dumps(report, ensure_ascii=False))
+    sys.exit(1 if report["failed"] else 0)
@@ -1,31 +1,148 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
 from pathlib import Path
-from datetime import datetime
 
 # Настройки логгера
-LOG_DIR = Path("logs")
+LOG_DIR = Path(os.getenv("LOG_DIR", "logs"))
 LOG_DIR.mkdir(exist_ok=True)
 
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-LOG_FILE = LOG_DIR / f"fire_safety_{datetime.now().date()}.log"
+LOG_FILE = LOG_DIR / "fire_safety.log"
+# Формат вывода в консоль: "text" или "json" (в файл всегда пишется JSON)
+LOG_CONSOLE_FORMAT = os.getenv("LOG_CONSOLE_FORMAT", "text")
+# Ротация: "time" — каждую полночь, "size" — по достижении LOG_MAX_BYTES
+LOG_ROTATION = os.getenv("LOG_ROTATION", "time")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "14"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Правила для журнала запросов: методы и пути, которые не пишутся (кроме ошибок),
+# и доля успешных запросов, попадающих в журнал
+LOG_SUPPRESS_METHODS = {m.strip().upper() for m in os.getenv("LOG_SUPPRESS_METHODS", "OPTIONS").split(",") if m.strip()}
+LOG_SUPPRESS_PATHS = {p.strip() for p in os.getenv("LOG_SUPPRESS_PATHS", "/health,/metrics").split(",") if p.strip()}
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+# ID текущего запроса — подставляется во все записи, сделанные при его обработке
+request_id_var: ContextVar = ContextVar("request_id", default=None)
+
+# Стандартные атрибуты LogRecord; все остальное — поля, переданные через extra
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна JSON-строка; поля из extra попадают в запись как есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            data["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key not in data and value is not None:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Добавляет request_id из контекста запроса (вызывается в потоке, сделавшем запись)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        return True
+
+
+class AccessLogFilter(logging.Filter):
+    """Подавление и сэмплирование журнала запросов; ошибки (status >= 400) пишутся всегда"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        status = getattr(record, "status", 0) or 0
+        if status >= 400:
+            return True
+        if getattr(record, "method", None) in LOG_SUPPRESS_METHODS:
+            return False
+        if getattr(record, "path", None) in LOG_SUPPRESS_PATHS:
+            return False
+        return LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Не блокирует вызывающий поток: при переполнении очереди запись отбрасывается"""
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение и traceback вычисляются здесь, а форматирование — в фоновом потоке
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def _file_handler() -> logging.Handler:
+    if LOG_ROTATION == "size":
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    else:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when="midnight", backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    handler.setFormatter(JsonFormatter())
+    return handler
 
 def setup_logger():
     logger = logging.getLogger("fire_safety")
-    logger.setLevel(logging.INFO)
-
-    formatter = logging.Formatter(LOG_FORMAT)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
 
     # Консольный вывод
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    console_handler.setFormatter(JsonFormatter() if LOG_CONSOLE_FORMAT == "json" else logging.Formatter(LOG_FORMAT))
+
+    # Запись выполняет фоновый поток; обработчик запроса только кладет запись в очередь
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(
+        log_queue, console_handler, _file_handler(), respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
 
-    # Файловый вывод
-    file_handler = logging.FileHandler(LOG_FILE)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    # Журнал запросов — дочерний логгер со своими правилами подавления
+    logging.getLogger("fire_safety.access").addFilter(AccessLogFilter())
 
     return logger
 
-logger = setup_logger()
\ No newline at end of file
+logger = setup_logger()
+access_logger = logging.getLogger("fire_safety.access")
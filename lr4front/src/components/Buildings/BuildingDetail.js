@@ -27,13 +27,11 @@ const BuildingDetail = () => {
     const fetchData = async () => {
       try {
         setLoading(true);
-        const [buildingRes, sensorsRes] = await Promise.all([
-          api.get(`/buildings/${id}`),
-          api.get(`/sensors?building_id=${id}`)
-        ]);
+        // Здание, датчики и открытые инциденты — одним запросом
+        const response = await api.get(`/buildings/${id}/overview`);
         
-        setBuilding(buildingRes.data);
-        setSensors(sensorsRes.data);
+        setBuilding(response.data);
+        setSensors(response.data.sensors);
       } catch (err) {
         setError('Не удалось загрузить данные');
         console.error('Ошибка загрузки:', err);
@@ -138,6 +136,14 @@ const BuildingDetail = () => {
                     sx={{ ml: 1 }}
                     color={sensor.is_active ? 'success' : 'error'}
                   />
+                  {sensor.open_incidents > 0 && (
+                    <Chip 
+                      label={`Открытых инцидентов: ${sensor.open_incidents}`} 
+                      size="small"
+                      sx={{ ml: 1 }}
+                      color="warning"
+                    />
+                  )}
                 </Typography>
               </ListItem>
             ))}
@@ -9,6 +9,10 @@ const BuildingItem = ({ building }) => {
       <TableCell>{building.id}</TableCell>
       <TableCell>{building.name}</TableCell>
       <TableCell>{building.address}</TableCell>
+      <TableCell>
+        {building.stats ? `${building.stats.active_sensor_count} / ${building.stats.sensor_count}` : '—'}
+      </TableCell>
+      <TableCell>{building.stats ? building.stats.open_incidents : '—'}</TableCell>
       <TableCell>
         <Button 
           variant="outlined" 
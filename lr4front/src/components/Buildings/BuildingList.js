@@ -12,6 +12,8 @@ const BuildingList = ({ buildings, loading }) => {
             <TableCell>ID</TableCell>
             <TableCell>Название</TableCell>
             <TableCell>Адрес</TableCell>
+            <TableCell>Датчики</TableCell>
+            <TableCell>Открытые инциденты</TableCell>
             <TableCell>Действия</TableCell>
           </TableRow>
         </TableHead>
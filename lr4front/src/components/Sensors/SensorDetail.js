@@ -29,18 +29,12 @@ const SensorDetail = () => {
     const fetchData = async () => {
       try {
         setLoading(true);
-        const [sensorRes, incidentsRes] = await Promise.all([
-          api.get(`/sensors/${id}`),
-          api.get(`/incidents?sensor_id=${id}`)
-        ]);
+        // Датчик, его здание и инциденты — одним запросом
+        const response = await api.get(`/sensors/${id}/overview`);
         
-        setSensor(sensorRes.data);
-        setIncidents(incidentsRes.data);
-
-        if (sensorRes.data.building_id) {
-          const buildingRes = await api.get(`/buildings/${sensorRes.data.building_id}`);
-          setBuilding(buildingRes.data);
-        }
+        setSensor(response.data);
+        setIncidents(response.data.incidents);
+        setBuilding(response.data.building);
       } catch (err) {
         setError('Не удалось загрузить данные датчика');
         console.error('Ошибка загрузки:', err);
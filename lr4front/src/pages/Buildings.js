@@ -12,7 +12,7 @@ const Buildings = () => {
   useEffect(() => {
     const fetchBuildings = async () => {
       try {
-        const response = await api.get('/buildings');
+        const response = await api.get('/buildings/?include=stats');
         setBuildings(response.data);
       } catch (err) {
         console.error(err);
@@ -15,6 +15,8 @@ import {
 } from '@mui/material';
 import api from '../api/api';
 
+const LATEST_LIMIT = 5;
+
 const Dashboard = () => {
   const [incidents, setIncidents] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -23,7 +25,7 @@ const Dashboard = () => {
   useEffect(() => {
     const fetchIncidents = async () => {
       try {
-        const response = await api.get('/incidents?limit=5&resolved=false');
+        const response = await api.get(`/incidents?limit=${LATEST_LIMIT}&resolved=false`);
         setIncidents(response.data);
       } catch (err) {
         setError('Не удалось загрузить инциденты');
@@ -34,6 +36,31 @@ const Dashboard = () => {
     };
 
     fetchIncidents();
+
+    // Новые и измененные инциденты приходят по SSE; EventSource сам переподключается
+    const source = new EventSource(`${api.defaults.baseURL}/incidents/stream`);
+    const applyEvent = (message) => {
+      const event = JSON.parse(message.data);
+      if (event.truncated) {
+        // Событие урезано до id (лимит NOTIFY) — перечитываем список целиком
+        fetchIncidents();
+        return;
+      }
+      const incident = event.incident;
+      setIncidents((current) => {
+        const others = current.filter((item) => item.id !== incident.id);
+        if (incident.resolved) {
+          return others;
+        }
+        return [incident, ...others]
+          .sort((a, b) => new Date(b.detected_at) - new Date(a.detected_at))
+          .slice(0, LATEST_LIMIT);
+      });
+    };
+    source.addEventListener('incident.created', applyEvent);
+    source.addEventListener('incident.updated', applyEvent);
+
+    return () => source.close();
   }, []);
 
   const getSeverityColor = (level) => {
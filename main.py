@@ -1,61 +1,187 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request, Body
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Depends, status, Request, Response, Body, Query, BackgroundTasks
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session, joinedload
-from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from datetime import datetime, timedelta, date
 import models
 import schemas
 import crud
 import database
 import auth
+import telemetry
+import pagination
+import passwords
+import events
+import cache
+import conditional
+import analytics
+import partitions
+import export
+import responses
+import compression
+import metrics
+import querycheck
+import importer
+import profiler
+import asyncio
+import json
 from auth import oauth2_scheme
-from auth import pwd_context
-from logger import logger
-from database import get_db
+from logger import logger, access_logger, request_id_var
+from database import get_async_db
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pydantic import ValidationError
 from typing import List, Optional
+import os
+import time
+import uuid
 
-app = FastAPI()
+# Без редиректов 307 на путь со слешем: коллекции принимают обе формы пути
+app = FastAPI(default_response_class=responses.DefaultResponse, redirect_slashes=False)
 security = HTTPBearer()
 
-# CORS
+# CORS: явный список источников; preflight кэшируется браузером на CORS_MAX_AGE секунд
+CORS_ALLOW_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ALLOW_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000").split(",")
+    if origin.strip()
+]
+CORS_MAX_AGE = int(os.getenv("CORS_MAX_AGE", "7200"))
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ALLOW_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["*"]
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type", "If-None-Match", "If-Modified-Since", "X-Request-ID"],
+    # "*" при allow_credentials браузеры не раскрывают — заголовки перечислены явно
+    expose_headers=["ETag", "Last-Modified", "X-Next-Cursor", "X-Request-ID", "Content-Disposition"],
+    max_age=CORS_MAX_AGE
 )
+app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(querycheck.QueryCheckMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(profiler.ProfilerMiddleware)
 
 @app.on_event("startup")
-def on_startup():
-    models.Base.metadata.create_all(bind=database.engine)
+async def on_startup():
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    await telemetry.buffer.start()
+    await events.broker.start()
+    await partitions.maintainer.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await telemetry.buffer.stop()
+    await events.broker.stop()
+    await partitions.maintainer.stop()
+    # Дочерние процессы хэширования завершаются до выхода, а не остаются сиротами
+    await asyncio.to_thread(passwords.hasher.shutdown, True)
+    await database.async_engine.dispose()
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "db_pool": database.pool_stats(),
+        "token_cache": auth.token_cache.stats(),
+        "password_hasher": passwords.hasher.stats(),
+        "events": events.broker.stats(),
+        "cache": cache.cache.stats(),
+        "incident_partitions": partitions.maintainer.stats(),
+        "compression": compression.compressor.stats(),
+        "profiler": profiler.profiler.stats()
+    }
+
+# Метрики в текстовом формате Prometheus (задержки по маршрутам, SQL, пул, кэши)
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# PROFILER
+# Профиль процесса на время или одного запроса (заголовок X-Profile); только администраторам
+@app.get("/profiler")
+async def read_profiler(current_user: auth.Principal = Depends(auth.get_current_admin)):
+    """Состояние профилировщика и сохраненные профили"""
+    profiler.ensure_enabled()
+    return {**profiler.profiler.stats(), "profiles": profiler.profiler.profiles()}
+
+@app.post("/profiler/start", status_code=202)
+async def start_profiler(
+    seconds: float = Query(30, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    memory: bool = False,
+    idle: bool = False,
+    cpu: bool = True,  # false вместе с memory=true — только память, без выборки стеков
+    current_user: auth.Principal = Depends(auth.get_current_admin)
+):
+    """Запускает выборку стеков всех потоков процесса на seconds секунд"""
+    profiler.ensure_enabled()
+    profile = await profiler.profiler.start(seconds, memory=memory, include_idle=idle, cpu=cpu)
+    return profile.summary(top=0)
+
+@app.post("/profiler/stop")
+async def stop_profiler(current_user: auth.Principal = Depends(auth.get_current_admin)):
+    """Останавливает профиль процесса досрочно"""
+    profiler.ensure_enabled()
+    profile = await profiler.profiler.stop()
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profiling is not in progress")
+    return profile.summary()
+
+@app.get("/profiler/profiles/{profile_id}")
+async def read_profile(
+    profile_id: str,
+    format: str = Query("speedscope", pattern="^(speedscope|collapsed|json)$"),
+    current_user: auth.Principal = Depends(auth.get_current_admin)
+):
+    """Профиль: speedscope (JSON для speedscope.app), collapsed (flamegraph) или json (сводка и tracemalloc)"""
+    profiler.ensure_enabled()
+    profile = profiler.profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    body, media_type = profiler.render(profile, format)
+    headers = {}
+    if format != "json":
+        suffix = "speedscope.json" if format == "speedscope" else "collapsed.txt"
+        headers["Content-Disposition"] = f'attachment; filename="profile-{profile_id}.{suffix}"'
+    return Response(content=body, media_type=media_type, headers=headers)
 
 # USERS
+@app.post("/users", response_model=schemas.User, status_code=201, include_in_schema=False)
 @app.post("/users/", response_model=schemas.User, status_code=201)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    return await crud.create_user(db=db, user=user)
 
 @app.get("/users/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id=user_id)
+async def read_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_user = await crud.get_user(db, user_id=user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
+@app.get("/users", response_model=list[schemas.User], include_in_schema=False)
 @app.get("/users/", response_model=list[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_users(db, skip=skip, limit=limit)
+@querycheck.budget(1)
+async def read_users(
+    response: Response,
+    after: Optional[str] = None,  # курсор из заголовка X-Next-Cursor
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=pagination.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    users, next_cursor = await crud.get_users(db, skip=skip, limit=limit, after=after)
+    pagination.set_next_cursor(response, next_cursor)
+    return responses.json_list(schemas.users_adapter, users, response)
 
 @app.put("/users/{user_id}", response_model=schemas.User)
-def update_user(user_id: int, user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.update_user(db, user_id=user_id, user=user)
+async def update_user(user_id: int, user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await crud.update_user(db, user_id=user_id, user=user)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
@@ -63,18 +189,18 @@ def update_user(user_id: int, user: schemas.UserCreate, db: Session = Depends(ge
 @app.post("/register", response_model=schemas.Token)
 async def register_user(
     user_data: schemas.UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Проверка существующего пользователя
-    db_user = crud.get_user_by_email(db, email=user_data.email)
+    db_user = await crud.get_user_by_email(db, email=user_data.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Создание пользователя
-    user = crud.create_user(db=db, user=user_data)
+    user = await crud.create_user(db=db, user=user_data)
     
     # Создание токенов
-    access_token = auth.create_access_token(user.id)
+    access_token = auth.create_access_token(user.id, is_admin=user.is_admin)
     refresh_token = auth.create_refresh_token(user.id)
     
     return {
@@ -84,14 +210,15 @@ async def register_user(
     }
 
 # BUILDINGS
+@app.post("/buildings", response_model=schemas.Building, status_code=201, include_in_schema=False)
 @app.post("/buildings/", response_model=schemas.Building, status_code=201)
-def create_building(
+async def create_building(
     building: schemas.BuildingCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     try:
-        return crud.create_building(db=db, building=building, owner_id=current_user.id)
+        return await crud.create_building(db=db, building=building, owner_id=current_user.id)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -101,171 +228,595 @@ def create_building(
         )
 
 @app.get("/buildings/{building_id}", response_model=schemas.Building)
-def read_building(building_id: int, db: Session = Depends(get_db)):
-    db_building = crud.get_building(db, building_id=building_id)
+@querycheck.budget(1)
+async def read_building(
+    building_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    db_building = await crud.get_building_cached(db, building_id=building_id)
     if not db_building:
         raise HTTPException(status_code=404, detail="Building not found")
+    etag = conditional.row_etag("building", db_building)
+    if conditional.is_not_modified(request, etag, db_building["updated_at"]):
+        return conditional.not_modified(etag, db_building["updated_at"])
+    conditional.set_validators(response, etag, db_building["updated_at"])
     return db_building
 
+@app.get("/buildings/{building_id}/overview", response_model=schemas.BuildingOverview)
+@querycheck.budget(3)
+async def read_building_overview(building_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Здание, его датчики и открытые инциденты по датчикам — вместо цепочки запросов клиента"""
+    overview = await crud.get_building_overview(db, building_id=building_id)
+    if overview is None:
+        raise HTTPException(status_code=404, detail="Building not found")
+    return overview
+
+BUILDING_INCLUDES = {"stats"}
+
+@app.get("/buildings", response_model=list[schemas.Building], include_in_schema=False)
 @app.get("/buildings/", response_model=list[schemas.Building])
-def read_buildings(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_buildings(db, skip=skip, limit=limit)
+@querycheck.budget(3)
+async def read_buildings(
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=pagination.MAX_PAGE_SIZE),
+    include: Optional[str] = None,  # "stats" — счетчики датчиков и открытых инцидентов
+    db: AsyncSession = Depends(get_async_db)
+):
+    includes = {part.strip() for part in include.split(",") if part.strip()} if include else set()
+    if includes - BUILDING_INCLUDES:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(sorted(includes - BUILDING_INCLUDES))}")
+
+    page = await crud.get_buildings_cached(db, skip=skip, limit=limit, after=after)
+    items, etag, last_modified = page["items"], page["etag"], page["last_modified"]
+    if "stats" in includes:
+        # Счетчики меняются вместе с инцидентами, поэтому не кэшируются и входят в ETag
+        stats = await crud.get_building_stats(db, [item["id"] for item in items])
+        empty = schemas.BuildingStats()
+        items = [{**item, "stats": stats.get(item["id"], empty).model_dump()} for item in items]
+        etag = conditional.make_etag(etag, *(stats.get(item["id"], empty) for item in items))
+        last_modified = None
+    if conditional.is_not_modified(request, etag, last_modified):
+        return conditional.not_modified(etag, last_modified)
+    conditional.set_validators(response, etag, last_modified)
+    pagination.set_next_cursor(response, page["next_cursor"])
+    # Элементы страницы уже сериализованы по схеме (кэш) — только кодирование в JSON
+    return responses.json_body(responses.dumps(items), response)
 
 @app.put("/buildings/{building_id}", response_model=schemas.Building)
-def update_building(
+@querycheck.budget(2)
+async def update_building(
     building_id: int,
     building: schemas.BuildingCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
-    db_building = crud.get_building(db, building_id=building_id)
+    db_building = await crud.get_building(db, building_id=building_id)
     if not db_building:
         raise HTTPException(status_code=404, detail="Building not found")
     
-    auth.check_owner_or_admin(db, current_user.id, db_building.owner_id)
+    auth.check_owner_or_admin(current_user, db_building.owner_id)
     
-    return crud.update_building(db, building_id=building_id, building=building)
+    return await crud.update_building(db, building_id=building_id, building=building)
 
 @app.delete("/buildings/{building_id}", status_code=204)
-def delete_building(
+@querycheck.budget(4)
+async def delete_building(
     building_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
-    db_building = crud.get_building(db, building_id=building_id)
+    db_building = await crud.get_building(db, building_id=building_id)
     if not db_building:
         raise HTTPException(status_code=404, detail="Building not found")
     
-    auth.check_owner_or_admin(db, current_user.id, db_building.owner_id)
+    auth.check_owner_or_admin(current_user, db_building.owner_id)
     
-    if not crud.delete_building(db, building_id=building_id):
+    if not await crud.delete_building(db, building_id=building_id):
         raise HTTPException(status_code=404, detail="Building not found")
 
 # SENSORS
+@app.post("/sensors", response_model=schemas.Sensor, status_code=201, include_in_schema=False)
 @app.post("/sensors/", response_model=schemas.Sensor, status_code=201)
-def create_sensor(sensor: schemas.SensorCreate, db: Session = Depends(get_db)):
-    return crud.create_sensor(db=db, sensor=sensor)
+async def create_sensor(sensor: schemas.SensorCreate, db: AsyncSession = Depends(get_async_db)):
+    return await crud.create_sensor(db=db, sensor=sensor)
 
 @app.get("/sensors/{sensor_id}", response_model=schemas.Sensor)
-def read_sensor(sensor_id: int, db: Session = Depends(get_db)):
-    db_sensor = crud.get_sensor(db, sensor_id=sensor_id)
+@querycheck.budget(1)
+async def read_sensor(
+    sensor_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    db_sensor = await crud.get_sensor_cached(db, sensor_id=sensor_id)
     if not db_sensor:
         raise HTTPException(status_code=404, detail="Sensor not found")
+    etag = conditional.row_etag("sensor", db_sensor)
+    if conditional.is_not_modified(request, etag, db_sensor["updated_at"]):
+        return conditional.not_modified(etag, db_sensor["updated_at"])
+    conditional.set_validators(response, etag, db_sensor["updated_at"])
     return db_sensor
 
+@app.get("/sensors/{sensor_id}/overview", response_model=schemas.SensorOverview)
+@querycheck.budget(2)
+async def read_sensor_overview(
+    sensor_id: int,
+    incident_limit: int = Query(100, ge=0, le=pagination.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Датчик, его здание и последние инциденты одним ответом"""
+    overview = await crud.get_sensor_overview(db, sensor_id=sensor_id, incident_limit=incident_limit)
+    if overview is None:
+        raise HTTPException(status_code=404, detail="Sensor not found")
+    return overview
+
+@app.get("/sensors", response_model=list[schemas.Sensor], include_in_schema=False)
 @app.get("/sensors/", response_model=list[schemas.Sensor])
-def read_sensors(
+@querycheck.budget(2)
+async def read_sensors(
+    request: Request,
+    response: Response,
     building_id: int = None,  # Новый параметр фильтрации
+    after: Optional[str] = None,
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=pagination.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(models.Sensor)
-    if building_id is not None:
-        query = query.filter(models.Sensor.building_id == building_id)
-    return query.offset(skip).limit(limit).all()
+    page = await crud.get_sensors_cached(db, skip=skip, limit=limit, building_id=building_id, after=after)
+    if conditional.is_not_modified(request, page["etag"], page["last_modified"]):
+        return conditional.not_modified(page["etag"], page["last_modified"])
+    conditional.set_validators(response, page["etag"], page["last_modified"])
+    pagination.set_next_cursor(response, page["next_cursor"])
+    return responses.json_body(responses.dumps(page["items"]), response)
 
 @app.put("/sensors/{sensor_id}", response_model=schemas.Sensor)
-def update_sensor(
+@querycheck.budget(2)
+async def update_sensor(
     sensor_id: int,
     sensor: schemas.SensorCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
-    db_sensor = crud.get_sensor(db, sensor_id=sensor_id)
-    if not db_sensor:
+    # Датчик и владелец его здания — одним запросом
+    row = await crud.get_sensor_with_owner(db, sensor_id=sensor_id)
+    if not row:
         raise HTTPException(status_code=404, detail="Sensor not found")
-    
-    # Получаем здание, которому принадлежит датчик
-    db_building = crud.get_building(db, building_id=db_sensor.building_id)
-    if not db_building:
+    db_sensor, owner_id = row
+    if owner_id is None:
         raise HTTPException(status_code=404, detail="Building not found")
     
-    auth.check_owner_or_admin(db, current_user.id, db_building.owner_id)
+    auth.check_owner_or_admin(current_user, owner_id)
     
-    return crud.update_sensor(db, sensor_id=sensor_id, sensor=sensor)
+    return await crud.update_sensor(db, sensor_id=sensor_id, sensor=sensor)
 
 @app.delete("/sensors/{sensor_id}", status_code=204)
-def delete_sensor(
+@querycheck.budget(4)
+async def delete_sensor(
     sensor_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
-    db_sensor = crud.get_sensor(db, sensor_id=sensor_id)
-    if not db_sensor:
+    row = await crud.get_sensor_with_owner(db, sensor_id=sensor_id)
+    if not row:
         raise HTTPException(status_code=404, detail="Sensor not found")
-    
-    db_building = crud.get_building(db, building_id=db_sensor.building_id)
-    if not db_building:
+    db_sensor, owner_id = row
+    if owner_id is None:
         raise HTTPException(status_code=404, detail="Building not found")
     
-    auth.check_owner_or_admin(db, current_user.id, db_building.owner_id)
+    auth.check_owner_or_admin(current_user, owner_id)
     
-    if not crud.delete_sensor(db, sensor_id=sensor_id):
+    if not await crud.delete_sensor(db, sensor_id=sensor_id):
         raise HTTPException(status_code=404, detail="Sensor not found")
 
 # INCIDENTS
+async def publish_incident_events(event_type: str, items: list):
+    """Рассылает события по инцидентам; items — пары (инцидент, building_id)"""
+    for incident, building_id in items:
+        await events.broker.publish({
+            "type": event_type,
+            "building_id": building_id,
+            "incident": schemas.Incident.model_validate(incident, from_attributes=True).model_dump(mode="json")
+        })
+
 @app.patch("/incidents/{incident_id}", response_model=schemas.Incident)
-def update_incident(
+@querycheck.budget(5)
+async def update_incident(
     incident_id: int,
     incident_update: schemas.IncidentUpdate,  # Новая схема для обновления
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_incident = crud.get_incident(db, incident_id=incident_id)
-    if not db_incident:
+    row = await crud.get_incident_with_building(db, incident_id=incident_id)
+    if not row:
         raise HTTPException(status_code=404, detail="Incident not found")
+    db_incident, building_id = row
     
-    # Обновляем только разрешенные поля
+    # Обновляем только разрешенные поля; resolved_at и агрегаты аналитики — в той же транзакции
     update_data = incident_update.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_incident, field, value)
+    await crud.set_incident_fields(db, db_incident, building_id, update_data)
     
-    db.commit()
-    db.refresh(db_incident)
+    await db.commit()
+    await db.refresh(db_incident)
+    background_tasks.add_task(publish_incident_events, "incident.updated", [(db_incident, building_id)])
+    return db_incident
+
+# Поток событий по инцидентам (Server-Sent Events) вместо опроса GET /incidents
+@app.get("/incidents/stream")
+async def stream_incidents(request: Request, building_id: Optional[int] = None):
+    subscription = events.broker.subscribe(building_id)
+
+    async def event_source():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    # Клиент не успевал читать и был отключен; EventSource переподключится сам
+                    break
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Архив инцидентов: секции, удаленные политикой хранения, читаются из файлов по запросу
+@app.get("/incidents/archive", response_model=List[schemas.Incident])
+async def read_archived_incidents(
+    date_from: date,  # включительно, UTC
+    date_to: date,  # не включительно
+    sensor_id: Optional[int] = None,
+    level: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=pagination.MAX_PAGE_SIZE)
+):
+    if date_from >= date_to:
+        raise HTTPException(status_code=400, detail="date_from must be earlier than date_to")
+    return await partitions.query_archive(date_from, date_to, sensor_id=sensor_id, level=level, limit=limit)
+
+@app.post("/incidents/partitions/maintain")
+@querycheck.budget(repeats=True)  # архив выгружается пакетами одного вида
+async def maintain_incident_partitions(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_admin)
+):
+    """Внеочередное обслуживание секций (создание и архивирование)"""
+    return await partitions.maintain(db.bind)
+
+@app.get("/incidents/{incident_id}", response_model=schemas.Incident)
+@querycheck.budget(1)
+async def read_incident(
+    incident_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    db_incident = await crud.get_incident(db, incident_id=incident_id)
+    if not db_incident:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    etag = conditional.make_etag("incident", db_incident.id, db_incident.version)
+    if conditional.is_not_modified(request, etag, db_incident.updated_at):
+        return conditional.not_modified(etag, db_incident.updated_at)
+    conditional.set_validators(response, etag, db_incident.updated_at)
     return db_incident
 
 # Эндпоинт для создания инцидента
 @app.post("/incidents", response_model=schemas.Incident, status_code=201)
+@app.post("/incidents/", response_model=schemas.Incident, status_code=201, include_in_schema=False)
+@querycheck.budget(5)
 async def create_incident(
     incident: schemas.IncidentCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
 ):
     try:
         # Проверяем существование датчика
-        sensor = crud.get_sensor(db, incident.sensor_id)
+        sensor = await crud.get_sensor(db, incident.sensor_id)
         if not sensor:
             raise HTTPException(status_code=404, detail="Датчик не найден")
         
         # Создаем инцидент
-        db_incident = crud.create_incident(db=db, incident=incident)
+        db_incident = await crud.create_incident(db=db, incident=incident)
+        background_tasks.add_task(
+            publish_incident_events, "incident.created", [(db_incident, sensor.building_id)]
+        )
         return db_incident
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка создания инцидента: {str(e)}")
         raise HTTPException(status_code=500, detail="Ошибка сервера")
 
+# Пакетная загрузка инцидентов: ошибки возвращаются по каждому элементу
+@app.post("/incidents/batch", response_model=schemas.IncidentBatchResult)
+async def create_incidents_batch(
+    batch: schemas.IncidentBatchCreate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
+):
+    results = [None] * len(batch.incidents)
+    valid = []
+    for index, item in enumerate(batch.incidents):
+        try:
+            valid.append((index, schemas.IncidentCreate.model_validate(item)))
+        except ValidationError as e:
+            results[index] = schemas.IncidentBatchItem(
+                index=index, ok=False,
+                error="; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            )
+
+    # Датчики блокируются до commit вставки: удаление между проверкой и INSERT ждет ее
+    sensor_buildings = await crud.get_sensor_building_ids(db, [incident.sensor_id for _, incident in valid], lock=True)
+    to_insert = []
+    for index, incident in valid:
+        if incident.sensor_id in sensor_buildings:
+            to_insert.append((index, incident))
+        else:
+            results[index] = schemas.IncidentBatchItem(index=index, ok=False, error="Датчик не найден")
+
+    try:
+        rows = await crud.create_incidents_bulk(db, [incident for _, incident in to_insert], sensor_buildings)
+    except Exception as e:
+        logger.error(f"Ошибка пакетного создания инцидентов: {str(e)}")
+        raise HTTPException(status_code=500, detail="Ошибка сервера")
+    for (index, _), row in zip(to_insert, rows):
+        results[index] = schemas.IncidentBatchItem(index=index, ok=True, incident=dict(row))
+    background_tasks.add_task(
+        publish_incident_events,
+        "incident.created",
+        [(dict(row), sensor_buildings[row["sensor_id"]]) for row in rows]
+    )
+
+    created = len(rows)
+    return {"created": created, "failed": len(results) - created, "results": results}
+
 @app.get("/incidents", response_model=List[schemas.Incident])
-def read_incidents(
+@app.get("/incidents/", response_model=List[schemas.Incident], include_in_schema=False)
+# Отметка ETag и страница; третий запрос — к секциям старше горячего окна, если оно не заполнило страницу
+@querycheck.budget(3)
+async def read_incidents(
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=pagination.MAX_PAGE_SIZE),
     resolved: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    sensor_id: Optional[int] = None,
+    building_id: Optional[int] = None,
+    level: Optional[str] = None,
+    detected_from: Optional[datetime] = None,  # включительно
+    detected_to: Optional[datetime] = None,  # не включительно
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(models.Incident)
-    
-    if resolved is not None:
-        query = query.filter(models.Incident.resolved == resolved)
-    
-    return query.offset(skip).limit(limit).all()
+    if detected_from and detected_to and detected_from >= detected_to:
+        raise HTTPException(status_code=400, detail="detected_from must be earlier than detected_to")
+    # Сначала дешевый запрос count/max(updated_at): при совпадении ETag строки не читаются
+    count, last_modified = await crud.get_incidents_stamp(
+        db,
+        resolved=resolved,
+        sensor_id=sensor_id,
+        building_id=building_id,
+        level=level,
+        detected_from=detected_from,
+        detected_to=detected_to
+    )
+    etag = conditional.make_etag("incidents", count, last_modified, request.url.query)
+    if conditional.is_not_modified(request, etag, last_modified):
+        return conditional.not_modified(etag, last_modified)
+    conditional.set_validators(response, etag, last_modified)
+    incidents, next_cursor = await crud.get_incidents(
+        db,
+        skip=skip,
+        limit=limit,
+        resolved=resolved,
+        after=after,
+        sensor_id=sensor_id,
+        building_id=building_id,
+        level=level,
+        detected_from=detected_from,
+        detected_to=detected_to
+    )
+    pagination.set_next_cursor(response, next_cursor)
+    return responses.json_list(schemas.incidents_adapter, incidents, response)
+
+# ANALYTICS
+# Читают только агрегаты (incident_rollups_*), время ответа не зависит от размера incidents
+async def incident_stats(
+    db: AsyncSession,
+    granularity: str,
+    series: bool,
+    date_from: Optional[date],
+    date_to: Optional[date],
+    group_by: Optional[str],
+    **filters
+):
+    date_to = date_to or datetime.utcnow().date() + timedelta(days=1)
+    date_from = date_from or date_to - timedelta(days=30)
+    if date_from >= date_to:
+        raise HTTPException(status_code=400, detail="date_from must be earlier than date_to")
+    fields = {part.strip() for part in group_by.split(",") if part.strip()} if group_by else set()
+    if fields - set(analytics.GROUP_FIELDS):
+        raise HTTPException(status_code=400, detail=f"group_by must be a subset of {', '.join(analytics.GROUP_FIELDS)}")
+    rows = await analytics.query(
+        db, granularity, date_from, date_to, group_by=fields, series=series, **filters
+    )
+    if rows is None:
+        raise HTTPException(status_code=400, detail="Too many rows, narrow the period or grouping")
+    return rows
+
+@app.get("/analytics/incidents", response_model=List[schemas.IncidentStats])
+async def read_incident_series(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    date_from: Optional[date] = None,  # включительно, UTC; по умолчанию — 30 дней до date_to
+    date_to: Optional[date] = None,  # не включительно; по умолчанию — завтра
+    group_by: Optional[str] = None,  # building,sensor,level через запятую
+    building_id: Optional[int] = None,
+    sensor_id: Optional[int] = None,
+    level: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ряд по часам или суткам: число инцидентов, решенных и среднее время решения"""
+    return await incident_stats(
+        db, granularity, True, date_from, date_to, group_by,
+        building_id=building_id, sensor_id=sensor_id, level=level
+    )
+
+@app.get("/analytics/incidents/summary", response_model=List[schemas.IncidentStats])
+async def read_incident_summary(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    group_by: Optional[str] = None,
+    building_id: Optional[int] = None,
+    sensor_id: Optional[int] = None,
+    level: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Итоги за период без разбивки по времени (например, MTTR по зданиям)"""
+    return await incident_stats(
+        db, "day", False, date_from, date_to, group_by,
+        building_id=building_id, sensor_id=sensor_id, level=level
+    )
+
+@app.post("/analytics/rebuild")
+async def rebuild_analytics(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_admin)
+):
+    """Пересчет агрегатов из incidents — после первичного развертывания или ручных правок"""
+    return await analytics.rebuild(db)
+
+# EXPORT
+# Потоковая выгрузка без ORM и схем ответа; докачка — с after_id последней полученной строки
+def export_response(db: AsyncSession, query, name: str, format: str, gzip: bool) -> StreamingResponse:
+    filename = f"{name}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export.stream_rows(db.bind, query, format, compress=gzip),
+        media_type="application/gzip" if gzip else export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/export/incidents")
+async def export_incidents(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+    after_id: Optional[int] = None,
+    until_id: Optional[int] = None,
+    resolved: Optional[bool] = None,
+    sensor_id: Optional[int] = None,
+    building_id: Optional[int] = None,
+    level: Optional[str] = None,
+    detected_from: Optional[datetime] = None,
+    detected_to: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
+):
+    query = crud.filter_incidents(
+        export.table_query(models.Incident.__table__, after_id=after_id, until_id=until_id),
+        sensor_id=sensor_id,
+        building_id=building_id,
+        level=level,
+        resolved=resolved,
+        detected_from=detected_from,
+        detected_to=detected_to
+    )
+    return export_response(db, query, "incidents", format, gzip)
+
+@app.get("/export/sensors")
+async def export_sensors(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+    after_id: Optional[int] = None,
+    until_id: Optional[int] = None,
+    building_id: Optional[int] = None,
+    is_active: Optional[bool] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
+):
+    table = models.Sensor.__table__
+    query = export.table_query(table, after_id=after_id, until_id=until_id)
+    if building_id is not None:
+        query = query.where(table.c.building_id == building_id)
+    if is_active is not None:
+        query = query.where(table.c.is_active == is_active)
+    return export_response(db, query, "sensors", format, gzip)
+
+# IMPORT
+# Тело запроса — файл CSV (строка заголовка) или NDJSON; читается потоком, без загрузки в память
+def import_format(request: Request, format: Optional[str]) -> str:
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if format not in importer.FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    return format
+
+@app.post("/import/buildings")
+async def import_buildings(
+    request: Request,
+    format: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
+):
+    """Здания создаются от имени текущего пользователя; в отчете — id для каждой принятой строки"""
+    return await importer.import_buildings(db, request.stream(), import_format(request, format), current_user.id)
+
+@app.post("/import/sensors")
+async def import_sensors(
+    request: Request,
+    format: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_principal)
+):
+    """Датчики — только в здания текущего пользователя (администратору — в любые)"""
+    owner_id = None if current_user.is_admin else current_user.id
+    return await importer.import_sensors(db, request.stream(), import_format(request, format), owner_id)
+
+# TELEMETRY
+# Показания только ставятся в очередь — запись в БД выполняет фоновый flusher
+@app.post("/telemetry/readings", status_code=202)
+async def ingest_readings(
+    batch: schemas.SensorReadingBatch,
+    user_id: int = Depends(auth.get_user_id_from_token)
+):
+    records = [telemetry.to_record(reading) for reading in batch.readings]
+    if not telemetry.buffer.offer(records):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Telemetry queue is full",
+            headers={"Retry-After": str(max(1, int(telemetry.buffer.flush_interval)))}
+        )
+    return {"accepted": len(records)}
+
+@app.get("/telemetry/metrics")
+async def telemetry_metrics():
+    return telemetry.buffer.metrics()
 
 # TOKEN
 @app.post("/token", response_model=schemas.Token)
-def login_for_access_token(auth_data: schemas.UserAuth, db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, email=auth_data.email)
-    if not user or not pwd_context.verify(auth_data.password, user.password_hash):
+async def login_for_access_token(auth_data: schemas.UserAuth, db: AsyncSession = Depends(get_async_db)):
+    user = await crud.get_user_by_email(db, email=auth_data.email)
+    if not user:
         raise HTTPException(status_code=401, detail="Incorrect credentials")
+    verified, new_hash = await passwords.hasher.verify_and_update(auth_data.password, user.password_hash)
+    if not verified:
+        raise HTTPException(status_code=401, detail="Incorrect credentials")
+    if new_hash:
+        # Стоимость bcrypt изменилась — прозрачно пересчитываем хэш
+        await crud.update_password_hash(db, user, new_hash)
     
-    access_token = auth.create_access_token(user.id)  # Передаем только ID
+    access_token = auth.create_access_token(user.id, is_admin=user.is_admin)
     refresh_token = auth.create_refresh_token(user.id)
     
     return {
@@ -275,21 +826,25 @@ def login_for_access_token(auth_data: schemas.UserAuth, db: Session = Depends(ge
     }
 
 @app.post("/refresh-token", response_model=schemas.Token)
-def refresh_access_token(
+async def refresh_access_token(
     refresh_token: str = Body(..., embed=True),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         user_id = auth.verify_token(refresh_token, "refresh")
-        user = crud.get_user(db, user_id=user_id)
+        if await auth.is_token_revoked(refresh_token):
+            raise HTTPException(status_code=401, detail="Token revoked")
+        user = await crud.get_user(db, user_id=user_id)
         if user is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         
-        access_token = auth.create_access_token(user.id)
+        access_token = auth.create_access_token(user.id, is_admin=user.is_admin)
         new_refresh_token = auth.create_refresh_token(user.id)
+        # Ротация: старый refresh-токен больше не принимается (если включен отзыв)
+        await auth.revoke_token(refresh_token)
         
         return {
             "access_token": access_token,
@@ -305,13 +860,13 @@ def refresh_access_token(
         )
     
 @app.post("/validate-token")
-def validate_token(
+async def validate_token(
     token: str = Body(..., embed=True),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         user_id = auth.verify_token(token, expected_type="access")
-        user = crud.get_user(db, user_id=user_id)
+        user = await crud.get_user(db, user_id=user_id)
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
         
@@ -330,14 +885,34 @@ def validate_token(
 # middleware  
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logger.info(f"Request: {request.method} {request.url}")
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    status_code = 500
     try:
         response = await call_next(request)
-        logger.info(f"Response: {response.status_code}")
+        status_code = response.status_code
+        response.headers["X-Request-ID"] = request_id
         return response
     except Exception as e:
         logger.error(f"Request failed: {str(e)}", exc_info=True)
         raise
+    finally:
+        # Одна запись на запрос; шаблон маршрута известен после маршрутизации
+        route = request.scope.get("route")
+        access_logger.info(
+            f"{request.method} {request.url.path} {status_code}",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "query": request.url.query or None,
+                "route": getattr(route, "path", None),
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                "client": request.client.host if request.client else None,
+            }
+        )
+        request_id_var.reset(token)
 
 # Глобальный обработчик ошибок
 @app.exception_handler(HTTPException)
@@ -349,6 +924,7 @@ def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"message": exc.detail},
+        headers=exc.headers,
     )
 
 @app.exception_handler(Exception)
@@ -0,0 +1,271 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+import auth
+import cache
+import compression
+import database
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Family:
+    """Метрика с метками; значения по кортежу меток"""
+    kind = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _label_text(self, values, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, value in items:
+            lines.extend(self._render_value(values, value))
+        return lines
+
+    def _render_value(self, values, value) -> list:
+        return [f"{self.name}{self._label_text(values)} {_number(value)}"]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def inc(self, *values, amount: float = 1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *values, amount: float = 1):
+        self.inc(*values, amount=-amount)
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *values, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(values)
+            if entry is None:
+                entry = self._values[values] = [[0] * len(self.buckets), 0, 0.0]
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def _render_value(self, values, value) -> list:
+        counts, total, total_sum = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            le = f'le="{_number(bound)}"'
+            lines.append(f"{self.name}_bucket{self._label_text(values, le)} {cumulative}")
+        le = 'le="+Inf"'
+        lines.append(f"{self.name}_bucket{self._label_text(values, le)} {total}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {_number(total_sum)}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {total}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return repr(value) if not value.is_integer() else str(int(value))
+    return str(value)
+
+
+# HTTP
+requests_total = Counter("http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+request_duration = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests being processed", ("method",))
+request_sql_statements = Histogram(
+    "http_request_sql_statements", "SQL statements per HTTP request", ("route",), buckets=SQL_COUNT_BUCKETS
+)
+request_db_seconds = Histogram("http_request_db_seconds", "Time spent in SQL per HTTP request", ("route",))
+
+# SQL (включая фоновые задачи вне запросов)
+sql_statements_total = Counter("db_statements_total", "SQL statements executed", ("engine",))
+sql_seconds_total = Counter("db_statement_seconds_total", "Time spent executing SQL", ("engine",))
+
+FAMILIES = [
+    requests_total, request_duration, requests_in_flight,
+    request_sql_statements, request_db_seconds,
+    sql_statements_total, sql_seconds_total,
+]
+
+
+class RequestStats:
+    """SQL текущего запроса; заполняется обработчиками событий движков"""
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+# Контекст копируется в greenlet SQLAlchemy, поэтому события видят объект запроса
+request_stats_var: ContextVar = ContextVar("request_stats", default=None)
+
+
+def instrument_engine(engine, name: str):
+    """Счетчики SQL через события before/after_cursor_execute движка"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        sql_statements_total.inc(name)
+        sql_seconds_total.inc(name, amount=elapsed)
+        stats = request_stats_var.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        # Запрос с ошибкой не вызывает after_cursor_execute — снимаем его отметку
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("metrics_start"):
+            conn.info["metrics_start"].pop()
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: латентность по шаблону маршрута (не по URL — число рядов ограничено),
+    запросы в обработке и SQL на запрос. Потоковые ответы учитываются до конца отправки тела.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        status = 500
+        stats = RequestStats()
+        token = request_stats_var.set(stats)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        requests_in_flight.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            requests_in_flight.dec(method)
+            request_stats_var.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            requests_total.inc(method, route, str(status))
+            request_duration.observe(method, route, value=elapsed)
+            request_sql_statements.observe(route, value=stats.statements)
+            request_db_seconds.observe(route, value=stats.db_seconds)
+
+
+def _pool_lines() -> list:
+    gauges = {
+        "db_pool_size": "Configured pool size",
+        "db_pool_checked_out": "Connections checked out",
+        "db_pool_overflow": "Overflow connections in use",
+    }
+    counters = {
+        "db_pool_checkouts_total": "Pool checkouts",
+        "db_pool_timeouts_total": "Pool checkout timeouts",
+        "db_pool_wait_seconds_total": "Time spent waiting for a pooled connection",
+    }
+    samples = {name: [] for name in list(gauges) + list(counters)}
+    for name, eng in (("sync", database.engine), ("async", database.async_engine.sync_engine)):
+        pool = eng.pool
+        if not isinstance(pool, database._TimedCheckoutMixin):
+            continue
+        label = f'{{pool="{name}"}}'
+        samples["db_pool_size"].append(f"db_pool_size{label} {pool.size()}")
+        samples["db_pool_checked_out"].append(f"db_pool_checked_out{label} {pool.checkedout()}")
+        samples["db_pool_overflow"].append(f"db_pool_overflow{label} {pool.overflow()}")
+        samples["db_pool_checkouts_total"].append(f"db_pool_checkouts_total{label} {pool.stats.checkouts}")
+        samples["db_pool_timeouts_total"].append(f"db_pool_timeouts_total{label} {pool.stats.timeouts}")
+        samples["db_pool_wait_seconds_total"].append(
+            f"db_pool_wait_seconds_total{label} {_number(pool.stats.total_wait)}"
+        )
+    lines = []
+    for name, help in list(gauges.items()) + list(counters.items()):
+        kind = "gauge" if name in gauges else "counter"
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"] + samples[name]
+    return lines
+
+def _cache_lines() -> list:
+    response_cache = cache.cache.stats()
+    token_cache = auth.token_cache.stats()
+    compressor = compression.compressor.stats()
+    rows = [
+        ("response", response_cache["hits"], response_cache["misses"], response_cache["entries"]),
+        ("token", token_cache["hits"], token_cache["misses"], token_cache["size"]),
+        ("compression", compressor["cache_hits"], compressor["compressed"], compressor["cache_size"]),
+    ]
+    lines = ["# HELP cache_hits_total Cache hits", "# TYPE cache_hits_total counter"]
+    lines += [f'cache_hits_total{{cache="{name}"}} {hits}' for name, hits, _, _ in rows]
+    lines += ["# HELP cache_misses_total Cache misses", "# TYPE cache_misses_total counter"]
+    lines += [f'cache_misses_total{{cache="{name}"}} {misses}' for name, _, misses, _ in rows]
+    lines += ["# HELP cache_entries Entries currently cached", "# TYPE cache_entries gauge"]
+    lines += [f'cache_entries{{cache="{name}"}} {size}' for name, _, _, size in rows]
+    return lines
+
+def render() -> bytes:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for family in FAMILIES:
+        lines.extend(family.render())
+    lines.extend(_pool_lines())
+    lines.extend(_cache_lines())
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def reset():
+    for family in FAMILIES:
+        family.clear()
+
+
+instrument_engine(database.engine, "sync")
+instrument_engine(database.async_engine.sync_engine, "async")
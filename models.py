@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, Text, ForeignKey, Date, TIMESTAMP
+from sqlalchemy import DDL, event, Column, Integer, BigInteger, Float, String, Boolean, Text, ForeignKey, Date, TIMESTAMP, Index
 from sqlalchemy.orm import relationship
 from database import Base
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 class User(Base):
     __tablename__ = "users"
@@ -21,29 +21,116 @@ class Building(Base):
     address = Column(Text, nullable=False)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(TIMESTAMP(timezone=False), nullable=False, server_default=func.now())
+    # Версия строки (ETag, оптимистическая блокировка) и время последнего изменения
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=func.now(), onupdate=func.now())
+    version = Column(Integer, nullable=False, server_default=text("1"))
 
     owner = relationship("User", back_populates="buildings")
     sensors = relationship("Sensor", back_populates="building")
 
+    # eager_defaults: updated_at возвращается через RETURNING, без отдельного SELECT
+    __mapper_args__ = {"version_id_col": version, "eager_defaults": True}
+
 class Sensor(Base):
     __tablename__ = "sensors"
     id = Column(Integer, primary_key=True, index=True)
-    building_id = Column(Integer, ForeignKey("buildings.id"))
+    building_id = Column(Integer, ForeignKey("buildings.id"), index=True)
     type = Column(String)
     location = Column(String)
     installed_at = Column(Date)
     is_active = Column(Boolean, default=True)
+    # Версия строки (ETag, оптимистическая блокировка) и время последнего изменения
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=func.now(), onupdate=func.now())
+    version = Column(Integer, nullable=False, server_default=text("1"))
 
     building = relationship("Building", back_populates="sensors")
     incidents = relationship("Incident", back_populates="sensor")
 
+    # eager_defaults: updated_at возвращается через RETURNING, без отдельного SELECT
+    __mapper_args__ = {"version_id_col": version, "eager_defaults": True}
+
 class Incident(Base):
     __tablename__ = "incidents"
-    id = Column(Integer, primary_key=True, index=True)
+    # Таблица секционирована по detected_at: ключ секционирования входит в первичный ключ
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     sensor_id = Column(Integer, ForeignKey("sensors.id"), nullable=True)
-    detected_at = Column(TIMESTAMP)
+    detected_at = Column(TIMESTAMP, primary_key=True, nullable=False, server_default=func.now())
     level = Column(String)
     description = Column(Text)
     resolved = Column(Boolean, default=False)
+    resolved_at = Column(TIMESTAMP)  # время решения — для MTTR
+    # Версия строки (ETag, оптимистическая блокировка) и время последнего изменения
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=func.now(), onupdate=func.now())
+    version = Column(Integer, nullable=False, server_default=text("1"))
+
+    sensor = relationship("Sensor", back_populates="incidents")
+
+    # eager_defaults: updated_at возвращается через RETURNING, без отдельного SELECT.
+    # Идентичность в ORM — (id, detected_at), как у ключа таблицы: UPDATE и DELETE по версии
+    # фильтруют и по ключу секционирования и затрагивают одну секцию
+    __mapper_args__ = {"version_id_col": version, "eager_defaults": True}
+
+    __table_args__ = (
+        # Ключ keyset-пагинации списка инцидентов
+        Index("ix_incidents_detected_at_id", "detected_at", "id"),
+        # Инциденты датчика за период (SensorDetail, фильтр sensor_id + detected_at)
+        Index("ix_incidents_sensor_id_detected_at", "sensor_id", "detected_at"),
+        # Открытые инциденты (дашборд): маленький частичный индекс в порядке выдачи
+        Index("ix_incidents_unresolved", "detected_at", "id", postgresql_where=text("NOT resolved")),
+        # Помесячные секции создает partitions.py; строки вне созданных секций попадают в DEFAULT
+        {"postgresql_partition_by": "RANGE (detected_at)"},
+    )
+
+event.listen(
+    Incident.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS incidents_default PARTITION OF incidents DEFAULT")
+)
+
+class SensorReading(Base):
+    """Показания датчиков (телеметрия), пишутся пакетами через COPY"""
+    __tablename__ = "sensor_readings"
+    id = Column(BigInteger, primary_key=True)
+    sensor_id = Column(Integer, ForeignKey("sensors.id", ondelete="CASCADE"), nullable=False)
+    recorded_at = Column(TIMESTAMP, nullable=False)
+    value = Column(Float, nullable=False)
+    unit = Column(String(16))
+
+    __table_args__ = (
+        Index("ix_sensor_readings_sensor_id_recorded_at", "sensor_id", "recorded_at"),
+    )
+
+class IncidentHourlyRollup(Base):
+    """
+    Счетчики инцидентов за час по датчику и уровню; обновляются в транзакции,
+    создающей или решающей инцидент (analytics.py). building_id — здание на момент
+    первого инцидента в ячейке.
+    """
+    __tablename__ = "incident_rollups_hourly"
+    bucket = Column(TIMESTAMP, primary_key=True)
+    sensor_id = Column(Integer, primary_key=True)
+    level = Column(String(20), primary_key=True)
+    building_id = Column(Integer)
+    incident_count = Column(Integer, nullable=False, default=0)
+    # Решенные инциденты с известным resolved_at и суммарное время до решения
+    resolved_count = Column(Integer, nullable=False, default=0)
+    resolve_seconds = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_incident_rollups_hourly_building_id_bucket", "building_id", "bucket"),
+    )
+
+class IncidentDailyRollup(Base):
+    """Те же счетчики за сутки (UTC) — для дашбордов за месяцы и годы"""
+    __tablename__ = "incident_rollups_daily"
+    bucket = Column(Date, primary_key=True)
+    sensor_id = Column(Integer, primary_key=True)
+    level = Column(String(20), primary_key=True)
+    building_id = Column(Integer)
+    incident_count = Column(Integer, nullable=False, default=0)
+    resolved_count = Column(Integer, nullable=False, default=0)
+    resolve_seconds = Column(Float, nullable=False, default=0)
 
-    sensor = relationship("Sensor", back_populates="incidents")
\ No newline at end of file
+    __table_args__ = (
+        Index("ix_incident_rollups_daily_building_id_bucket", "building_id", "bucket"),
+    )
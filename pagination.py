@@ -0,0 +1,59 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(values: list) -> str:
+    """Упаковывает значения ключа последней строки в непрозрачный токен"""
+    raw = json.dumps(
+        [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    """Распаковывает токен в значения ключа с типами, соответствующими колонкам"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor arity mismatch")
+        return [
+            datetime.fromisoformat(value) if column.type.python_type is datetime else column.type.python_type(value)
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset(query, columns: list, limit: int, after: Optional[str] = None, descending: bool = False):
+    """
+    Добавляет к запросу keyset-пагинацию по колонкам columns (последняя — уникальная, обычно id).
+    Запрашивает limit + 1 строк, чтобы понять, есть ли следующая страница.
+    """
+    if after:
+        values = decode_cursor(after, columns)
+        if len(columns) == 1:
+            key, bound = columns[0], values[0]
+        else:
+            key, bound = tuple_(*columns), tuple_(*values)
+        query = query.where(key < bound if descending else key > bound)
+    order = [column.desc() if descending else column.asc() for column in columns]
+    return query.order_by(*order).limit(limit + 1)
+
+def split_page(rows: list, columns: list, limit: int):
+    """Отрезает лишнюю строку и возвращает (строки страницы, курсор следующей страницы или None)"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, column.key) for column in columns])
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
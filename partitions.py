@@ -0,0 +1,397 @@
+import asyncio
+import csv
+import gzip
+import heapq
+import os
+import re
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import Optional
+from sqlalchemy import Boolean, Integer, TIMESTAMP, text
+import database
+import models
+from logger import logger
+
+# Секционирование incidents по месяцам detected_at: сколько месяцев вперед создавать заранее
+INCIDENTS_PARTITION_MONTHS_AHEAD = int(os.getenv("INCIDENTS_PARTITION_MONTHS_AHEAD", "3"))
+# Секции старше стольких месяцев, где все инциденты решены, выгружаются в архив и удаляются; 0 — хранить все
+INCIDENTS_RETENTION_MONTHS = int(os.getenv("INCIDENTS_RETENTION_MONTHS", "0"))
+INCIDENTS_ARCHIVE_DIR = Path(os.getenv("INCIDENTS_ARCHIVE_DIR", "archive/incidents"))
+# "csv" — csv.gz; "parquet" — нужен pyarrow
+INCIDENTS_ARCHIVE_FORMAT = os.getenv("INCIDENTS_ARCHIVE_FORMAT", "csv")
+INCIDENTS_MAINTENANCE_INTERVAL = float(os.getenv("INCIDENTS_MAINTENANCE_INTERVAL", "3600"))
+# Горячее окно — столько последних месяцев (с текущим): поиск по id и список сначала читают
+# только их секции, к более старым обращаются, лишь если в окне не нашлось нужного
+INCIDENTS_RECENT_MONTHS = int(os.getenv("INCIDENTS_RECENT_MONTHS", "2"))
+# statement_timeout для обслуживания и миграции секций (мс); 0 — без ограничения:
+# перенос строк из DEFAULT, выгрузка в архив и миграция идут дольше обычного запроса
+INCIDENTS_MAINTENANCE_STATEMENT_TIMEOUT_MS = int(os.getenv("INCIDENTS_MAINTENANCE_STATEMENT_TIMEOUT_MS", "0"))
+
+TABLE = models.Incident.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+COLUMNS = [column.name for column in models.Incident.__table__.columns]
+ARCHIVE_BATCH_SIZE = 5000
+# Ключ advisory-блокировки: обслуживание выполняет один процесс из нескольких воркеров
+MAINTENANCE_LOCK_ID = 7316001
+
+_PARTITION_RE = re.compile(rf"^{TABLE}_p(\d{{4}})(\d{{2}})$")
+_ARCHIVE_RE = re.compile(rf"^{TABLE}_p(\d{{4}})(\d{{2}})(?:_\d+)?\.(csv\.gz|parquet)$")
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+async def _set_statement_timeout(conn):
+    """Снимает DB_STATEMENT_TIMEOUT_MS соединения до конца текущей транзакции"""
+    await conn.execute(text(f"SET LOCAL statement_timeout = {INCIDENTS_MAINTENANCE_STATEMENT_TIMEOUT_MS}"))
+
+def recent_cutoff(today: Optional[date] = None) -> datetime:
+    """Начало горячего окна; совпадает с границей секции, чтобы старые секции отсекались целиком"""
+    current = month_start(today or datetime.utcnow().date())
+    return datetime.combine(add_months(current, 1 - max(INCIDENTS_RECENT_MONTHS, 1)), time.min)
+
+def _bounds(month: date):
+    # detected_at — TIMESTAMP без часового пояса (UTC)
+    return datetime.combine(month, time.min), datetime.combine(add_months(month, 1), time.min)
+
+
+async def list_partitions(conn) -> dict:
+    """{месяц: имя секции} для помесячных секций incidents (DEFAULT не включается)"""
+    result = await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:table AS regclass)"
+    ), {"table": TABLE})
+    partitions = {}
+    for (name,) in result.all():
+        match = _PARTITION_RE.match(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+async def create_partition(conn, month: date):
+    """
+    Создает секцию месяца. Строки этого месяца, уже попавшие в DEFAULT,
+    переносятся в новую секцию до подключения — иначе ATTACH завершится ошибкой.
+    """
+    name = partition_name(month)
+    start, end = _bounds(month)
+    await conn.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)"))
+    await conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE detected_at >= :start AND detected_at < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"start": start, "end": end})
+    # Границы секции задаются только литералами; значения формируются здесь, а не приходят извне
+    await conn.execute(text(
+        f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+
+async def ensure_partitions(conn, today: Optional[date] = None, months_ahead: int = None) -> list:
+    """Создает секции текущего и следующих месяцев, а также месяцев, чьи строки лежат в DEFAULT"""
+    await _set_statement_timeout(conn)
+    months_ahead = INCIDENTS_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(today or datetime.utcnow().date())
+    wanted = {add_months(current, offset) for offset in range(months_ahead + 1)}
+    # Инциденты задним числом и данные, загруженные до появления секций
+    result = await conn.execute(text(f"SELECT DISTINCT date_trunc('month', detected_at) FROM {DEFAULT_PARTITION}"))
+    wanted |= {month_start(row[0]) for row in result.all()}
+    existing = await list_partitions(conn)
+    created = []
+    for month in sorted(wanted - set(existing)):
+        await create_partition(conn, month)
+        created.append(partition_name(month))
+    return created
+
+
+class _CsvArchive:
+    suffix = ".csv.gz"
+
+    def __init__(self, path: Path):
+        self._file = gzip.open(path, "wt", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, rows: list):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetArchive:
+    suffix = ".parquet"
+
+    def __init__(self, path: Path):
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        types = {Integer: pyarrow.int64(), TIMESTAMP: pyarrow.timestamp("us"), Boolean: pyarrow.bool_()}
+        self._schema = pyarrow.schema([
+            (column.name, next((t for kind, t in types.items() if isinstance(column.type, kind)), pyarrow.string()))
+            for column in models.Incident.__table__.columns
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows: list):
+        columns = list(zip(*rows))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(values, type=field.type) for values, field in zip(columns, self._schema)],
+            schema=self._schema
+        ))
+
+    def close(self):
+        self._writer.close()
+
+
+def _archive_class():
+    if INCIDENTS_ARCHIVE_FORMAT == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+            return _ParquetArchive
+        except ImportError:
+            logger.warning("INCIDENTS_ARCHIVE_FORMAT=parquet, but pyarrow is not installed; using csv.gz")
+    return _CsvArchive
+
+def _archive_path(month: date, suffix: str) -> Path:
+    # Месяц может архивироваться повторно (инциденты задним числом) — файлы не перезаписываются
+    path = INCIDENTS_ARCHIVE_DIR / f"{partition_name(month)}{suffix}"
+    number = 0
+    while path.exists():
+        number += 1
+        path = INCIDENTS_ARCHIVE_DIR / f"{partition_name(month)}_{number}{suffix}"
+    return path
+
+async def archive_partition(conn, month: date) -> Path:
+    """Выгружает секцию в файл, затем отключает и удаляет ее (в транзакции вызывающего кода)"""
+    name = partition_name(month)
+    archive_class = _archive_class()
+    INCIDENTS_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _archive_path(month, archive_class.suffix)
+    partial = path.with_name(path.name + ".partial")
+    archive = await asyncio.to_thread(archive_class, partial)
+    try:
+        # Пакеты по ключу (detected_at, id) обычными запросами: открытый серверный курсор
+        # держал бы секцию до конца транзакции, и DROP TABLE в ней был бы невозможен
+        select_batch = f"SELECT {', '.join(COLUMNS)} FROM {name}"
+        last = None
+        while True:
+            where = " WHERE (detected_at, id) > (:detected_at, :id)" if last else ""
+            result = await conn.execute(
+                text(f"{select_batch}{where} ORDER BY detected_at, id LIMIT {ARCHIVE_BATCH_SIZE}"),
+                {"detected_at": last[0], "id": last[1]} if last else {}
+            )
+            rows = [tuple(row) for row in result.all()]
+            if not rows:
+                break
+            await asyncio.to_thread(archive.write, rows)
+            last = (rows[-1][COLUMNS.index("detected_at")], rows[-1][COLUMNS.index("id")])
+        await asyncio.to_thread(archive.close)
+    except BaseException:
+        await asyncio.to_thread(archive.close)
+        partial.unlink(missing_ok=True)
+        raise
+    os.replace(partial, path)
+    await conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+    await conn.execute(text(f"DROP TABLE {name}"))
+    return path
+
+async def apply_retention(conn, retention_months: int, today: Optional[date] = None) -> list:
+    """Архивирует секции старше retention_months, в которых не осталось нерешенных инцидентов"""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(today or datetime.utcnow().date()), -retention_months)
+    archived = []
+    for month, name in sorted((await list_partitions(conn)).items()):
+        if month >= cutoff:
+            continue
+        # Каждая секция архивируется в своей транзакции — SET LOCAL повторяется для каждой
+        await _set_statement_timeout(conn)
+        # SHARE: до конца транзакции в секцию никто не пишет, и выгрузка не теряет строк
+        await conn.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+        unresolved = await conn.scalar(text(f"SELECT count(*) FROM {name} WHERE resolved IS NOT TRUE"))
+        if unresolved:
+            logger.info(f"Partition {name} kept: {unresolved} unresolved incidents")
+            await conn.commit()
+            continue
+        path = await archive_partition(conn, month)
+        await conn.commit()
+        logger.info(f"Partition {name} archived to {path}")
+        archived.append(str(path))
+    return archived
+
+async def maintain(engine=None, today: Optional[date] = None) -> dict:
+    """Создание секций и политика хранения; при нескольких воркерах выполняется одним из них"""
+    engine = engine or database.async_engine
+    async with engine.connect() as conn:
+        locked = await conn.scalar(text("SELECT pg_try_advisory_lock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+        await conn.commit()
+        if not locked:
+            return {"skipped": True, "created": [], "archived": []}
+        try:
+            created = await ensure_partitions(conn, today)
+            await conn.commit()
+            archived = await apply_retention(conn, INCIDENTS_RETENTION_MONTHS, today)
+        finally:
+            await conn.rollback()
+            await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+            await conn.commit()
+    return {"skipped": False, "created": created, "archived": archived}
+
+async def migrate_heap(conn) -> bool:
+    """
+    Переводит существующую несекционированную таблицу incidents в секционированную
+    (одна транзакция; столбцы updated_at, version и resolved_at уже должны быть добавлены).
+    """
+    await _set_statement_timeout(conn)
+    kind = await conn.scalar(text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:table)"), {"table": TABLE})
+    if kind != "r":
+        return False
+    legacy = f"{TABLE}_heap"
+    await conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {legacy}"))
+    # Имена индексов и последовательностей уникальны в схеме — старые освобождают их
+    indexes = await conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {"table": legacy})
+    for (index,) in indexes.all():
+        await conn.execute(text(f"ALTER INDEX {index} RENAME TO {index}_heap"))
+    sequence = await conn.scalar(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": legacy})
+    if sequence:
+        await conn.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO {legacy}_id_seq"))
+
+    await conn.run_sync(lambda sync_conn: models.Incident.__table__.create(sync_conn))
+    months = await conn.execute(text(f"SELECT DISTINCT date_trunc('month', detected_at) FROM {legacy}"))
+    for month in sorted({month_start(row[0]) for row in months.all()}):
+        await create_partition(conn, month)
+    columns = ", ".join(COLUMNS)
+    await conn.execute(text(f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {legacy}"))
+    await conn.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)"
+    ))
+    await conn.execute(text(f"DROP TABLE {legacy}"))
+    return True
+
+
+# Чтение архива
+def _parse_csv_row(row: dict) -> dict:
+    parsed = {}
+    for column in models.Incident.__table__.columns:
+        value = row.get(column.name)
+        if value in ("", None):
+            parsed[column.name] = None
+        elif isinstance(column.type, Integer):
+            parsed[column.name] = int(value)
+        elif isinstance(column.type, TIMESTAMP):
+            parsed[column.name] = datetime.fromisoformat(value)
+        elif isinstance(column.type, Boolean):
+            parsed[column.name] = value == "True"
+        else:
+            parsed[column.name] = value
+    return parsed
+
+def _read_archive(path: Path):
+    if path.name.endswith(".parquet"):
+        import pyarrow.parquet
+        yield from pyarrow.parquet.read_table(path).to_pylist()
+        return
+    with gzip.open(path, "rt", newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            yield _parse_csv_row(row)
+
+def archive_files(date_from: date, date_to: date) -> list:
+    """Файлы архива, месяцы которых пересекаются с [date_from, date_to)"""
+    if not INCIDENTS_ARCHIVE_DIR.is_dir():
+        return []
+    files = []
+    for path in sorted(INCIDENTS_ARCHIVE_DIR.iterdir()):
+        match = _ARCHIVE_RE.match(path.name)
+        if match:
+            month = date(int(match[1]), int(match[2]), 1)
+            if month < date_to and add_months(month, 1) > date_from:
+                files.append(path)
+    return files
+
+def _query_archive(date_from: date, date_to: date, sensor_id: Optional[int], level: Optional[str], limit: int) -> list:
+    start, end = datetime.combine(date_from, time.min), datetime.combine(date_to, time.min)
+    rows = (
+        row
+        for path in archive_files(date_from, date_to)
+        for row in _read_archive(path)
+        if start <= row["detected_at"] < end
+        and (sensor_id is None or row["sensor_id"] == sensor_id)
+        and (level is None or row["level"] == level)
+    )
+    # Порядок как у GET /incidents: от новых к старым
+    return heapq.nlargest(limit, rows, key=lambda row: (row["detected_at"], row["id"]))
+
+async def query_archive(
+    date_from: date, date_to: date, sensor_id: Optional[int] = None, level: Optional[str] = None, limit: int = 100
+) -> list:
+    """Инциденты из архивных файлов за [date_from, date_to); читаются только файлы нужных месяцев"""
+    return await asyncio.to_thread(_query_archive, date_from, date_to, sensor_id, level, limit)
+
+
+class PartitionMaintainer:
+    """Периодическое обслуживание секций в фоне"""
+
+    def __init__(self, interval: float = INCIDENTS_MAINTENANCE_INTERVAL):
+        self.interval = interval
+        self._task = None
+        self.runs = 0
+        self.failures = 0
+        self.last_result = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="incident-partitions")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.last_result = await maintain()
+                self.runs += 1
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Incident partition maintenance failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "retention_months": INCIDENTS_RETENTION_MONTHS,
+            "last_result": self.last_result,
+        }
+
+
+maintainer = PartitionMaintainer()
+
+
+async def _cli(command: str):
+    try:
+        if command == "migrate":
+            async with database.async_engine.begin() as conn:
+                if not await migrate_heap(conn):
+                    return {"migrated": False}
+        return await maintain()
+    finally:
+        await database.async_engine.dispose()
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Обслуживание секций таблицы incidents")
+    parser.add_argument("command", choices=["maintain", "migrate"])
+    print(json.dumps(asyncio.run(_cli(parser.parse_args().command)), default=str))
@@ -0,0 +1,100 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+import bcrypt_worker
+from bcrypt_worker import BCRYPT_ROUNDS, pwd_context  # noqa: F401
+from logger import logger
+
+# Процессов для хэширования; 0 — выполнять в пуле потоков текущего процесса
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Одновременно выполняемых и ожидающих операций; остальные ждут не дольше HASH_QUEUE_TIMEOUT
+HASH_MAX_CONCURRENCY = int(os.getenv("HASH_MAX_CONCURRENCY", str(max(1, HASH_WORKERS) * 2)))
+HASH_QUEUE_TIMEOUT = float(os.getenv("HASH_QUEUE_TIMEOUT", "5"))
+# fork копировал бы процесс с уже запущенными потоками (журнал, профилировщик, пул БД):
+# блокировка, захваченная другим потоком в момент fork, осталась бы в дочернем процессе навсегда
+HASH_START_METHOD = "spawn"
+
+# Выполняются в дочерних процессах
+_hash = bcrypt_worker.hash_password
+_verify_and_update = bcrypt_worker.verify_and_update
+
+
+class PasswordHasher:
+    """Выполняет bcrypt в отдельном пуле процессов с ограничением параллелизма"""
+
+    def __init__(
+        self,
+        workers: int = HASH_WORKERS,
+        max_concurrency: int = HASH_MAX_CONCURRENCY,
+        queue_timeout: float = HASH_QUEUE_TIMEOUT
+    ):
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._executor = None
+        self._semaphore = None
+        self._loop = None
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    def _get_executor(self):
+        if self.workers > 0 and self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context(HASH_START_METHOD)
+            )
+        return self._executor
+
+    async def _run(self, func, *args):
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning("Password hashing queue is full, request rejected")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service is busy, try again later",
+                headers={"Retry-After": "1"}
+            )
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+            self.completed += 1
+            return result
+        finally:
+            semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        """Проверяет пароль; вторым значением возвращает новый хэш, если стоимость устарела"""
+        return await self._run(_verify_and_update, password, password_hash)
+
+    def shutdown(self, wait: bool = False):
+        """Останавливает пул; wait=True — дождаться завершения дочерних процессов"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "start_method": HASH_START_METHOD if self.workers > 0 else None,
+            "rounds": BCRYPT_ROUNDS,
+            "max_concurrency": self.max_concurrency,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,453 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import HTTPException
+from logger import logger
+import auth
+
+# Профилировщик встроен всегда; пока профиль не запрошен, поток выборки не запущен
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Период выборки стеков; 5 мс — ~200 выборок в секунду при незаметной нагрузке
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+# Сколько готовых профилей хранится в памяти процесса (старые вытесняются)
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+# Одновременно профилируемых запросов; остальные выполняются без профиля
+PROFILE_MAX_REQUESTS = int(os.getenv("PROFILE_MAX_REQUESTS", "4"))
+# Строк в сводке tracemalloc и глубина стека выделений
+PROFILE_MEMORY_TOP = int(os.getenv("PROFILE_MEMORY_TOP", "30"))
+PROFILE_MEMORY_FRAMES = int(os.getenv("PROFILE_MEMORY_FRAMES", "1"))
+
+# Заголовок запроса администратора: "cpu", "memory" или "cpu,memory"
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-ID"
+FORMATS = ("speedscope", "collapsed", "json")
+
+_MAX_DEPTH = 128
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+_labels = {}
+# Ожидание в этих функциях — простой потока, а не работа (исключается без idle=true)
+_IDLE_FUNCTIONS = {
+    ("selectors.py", "select"), ("threading.py", "wait"), ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def ensure_enabled():
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        # Путь относительно проекта; библиотеки — пакет и файл: имена кадров не зависят от машины
+        path = code.co_filename
+        if path.startswith(_PROJECT_DIR):
+            path = os.path.relpath(path, _PROJECT_DIR)
+        else:
+            path = "/".join(path.replace("\\", "/").split("/")[-2:])
+        label = _labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+    return label
+
+def _frame_stack(frame, stop=None) -> list:
+    """Кадры от корня к листу; stop — внешний кадр, выше которого стек обрезается"""
+    frames = []
+    while frame is not None and len(frames) < _MAX_DEPTH:
+        frames.append(frame)
+        if frame is stop:
+            break
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+def _awaiting_frames(coro) -> list:
+    """Стек приостановленной корутины по цепочке cr_await, от корня к листу"""
+    frames = []
+    while coro is not None and len(frames) < _MAX_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return frames
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FUNCTIONS
+
+
+class _Memory:
+    """tracemalloc на время профиля; трассировка включается первым пользователем и выключается последним"""
+    _lock = threading.Lock()
+    _users = 0
+    _started = False
+
+    def __init__(self):
+        with self._lock:
+            if _Memory._users == 0:
+                # Трассировку, включенную извне (PYTHONTRACEMALLOC), не выключаем
+                _Memory._started = not tracemalloc.is_tracing()
+                if _Memory._started:
+                    tracemalloc.start(PROFILE_MEMORY_FRAMES)
+            _Memory._users += 1
+        tracemalloc.reset_peak()
+        self.before = self._snapshot()
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    def finish(self) -> dict:
+        after = self._snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            _Memory._users -= 1
+            if _Memory._users == 0 and _Memory._started:
+                tracemalloc.stop()
+        top = after.compare_to(self.before, "lineno")[:PROFILE_MEMORY_TOP]
+        return {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {
+                    "file": stat.traceback[0].filename,
+                    "line": stat.traceback[0].lineno,
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                    "size": stat.size,
+                }
+                for stat in top
+            ],
+        }
+
+
+class Profile:
+    """
+    Профиль выборки: счетчики стеков (корень -> лист). Профиль процесса собирает стеки
+    всех потоков; профиль запроса — только задачи запроса: "(running)" пока она выполняется
+    в цикле событий, "(waiting)" — на чем она ждет (SQL, блокировки, пул потоков).
+    """
+
+    def __init__(self, kind: str, seconds: float, include_idle: bool = False, meta: dict = None, cpu: bool = True):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.cpu = cpu
+        self.meta = meta or {}
+        self.include_idle = include_idle
+        self.samples = Counter()
+        self.ticks = 0
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self.deadline = time.monotonic() + min(seconds, PROFILE_MAX_SECONDS)
+        self.duration = None
+        self.memory = None
+        self._memory = None
+        self.task = None
+        self.thread_id = None
+
+    @property
+    def running(self) -> bool:
+        return self.duration is None
+
+    def start_memory(self):
+        """Снимок tracemalloc идет дольше, чем больше выделений, — вызывать вне цикла событий"""
+        self._memory = _Memory()
+
+    def attach(self, task):
+        self.task = task
+        self.thread_id = threading.get_ident()
+
+    def sample(self, frames: dict, thread_names: dict, own_thread: int):
+        self.ticks += 1
+        if self.task is None:
+            for thread_id, frame in frames.items():
+                if thread_id == own_thread or (not self.include_idle and _is_idle(frame)):
+                    continue
+                stack = [f"thread {thread_names.get(thread_id, thread_id)}"]
+                stack += [_label(item.f_code) for item in _frame_stack(frame)]
+                self.samples[tuple(stack)] += 1
+            return
+        if self.task.done():
+            return
+        coro = self.task.get_coro()
+        # cr_running истинен, пока цикл событий выполняет шаг задачи (вся цепочка await);
+        # кадры сняты чуть раньше — если корня задачи в стеке потока нет, шаг уже закончился
+        running = None
+        if getattr(coro, "cr_running", False) and self.thread_id in frames:
+            root = coro.cr_frame
+            running = _frame_stack(frames[self.thread_id], stop=root)
+            if running[0] is not root:
+                running = None
+        if running is not None:
+            stack = ["(running)"] + [_label(item.f_code) for item in running]
+        else:
+            stack = ["(waiting)"] + [_label(item.f_code) for item in _awaiting_frames(coro)]
+        self.samples[tuple(stack)] += 1
+
+    def finish(self):
+        if not self.running:
+            return
+        self.duration = time.perf_counter() - self._start
+        if self._memory is not None:
+            self.memory = self._memory.finish()
+            self._memory = None
+
+    def summary(self, top: int = 20) -> dict:
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack[-1]] += count
+        total = sum(self.samples.values())
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "cpu": self.cpu,
+            "running": self.running,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "duration_seconds": round(self.duration, 4) if self.duration is not None else None,
+            "interval_ms": PROFILE_INTERVAL * 1000,
+            "ticks": self.ticks,
+            "samples": total,
+            "top": [{"frame": frame, "samples": count, "share": round(count / total, 4)} for frame, count in leaves.most_common(top)],
+            "memory": self.memory,
+            **self.meta,
+        }
+
+    def collapsed(self) -> str:
+        """Формат flamegraph.pl / inferno / speedscope: "кадр;кадр;... число" """
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.samples.items()))
+
+    def speedscope(self) -> dict:
+        """Файл speedscope (sampled): одинаковые стеки сведены в один с весом в секундах"""
+        frame_index = {}
+        stacks, weights = [], []
+        for stack, count in sorted(self.samples.items()):
+            stacks.append([frame_index.setdefault(name, len(frame_index)) for name in stack])
+            weights.append(round(count * PROFILE_INTERVAL, 6))
+        name = f"{self.kind} {self.meta.get('method', '')} {self.meta.get('path', '')}".strip()
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "fire_safety.profiler",
+            "shared": {"frames": [{"name": frame} for frame in frame_index]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 6),
+                "samples": stacks,
+                "weights": weights,
+            }],
+        }
+
+
+class Profiler:
+    """Профили процесса и запросов; один общий поток выборки работает, только пока есть активные профили"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, keep: int = PROFILE_KEEP):
+        self.interval = interval
+        self.keep = keep
+        self._profiles = OrderedDict()
+        self._active = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self.process_profile = None
+
+    @staticmethod
+    def _needs_thread(profile: Profile) -> bool:
+        # Поток нужен для выборки стеков и для срока профиля процесса; профилю запроса
+        # только с памятью он не нужен — его завершает middleware
+        return profile.cpu or profile.kind == "process"
+
+    def _register(self, profile: Profile):
+        with self._lock:
+            self._active.append(profile)
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+            if self._thread is None and self._needs_thread(profile):
+                self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                expired = [item for item in self._active if item.deadline <= now and self._deactivate(item)]
+                if not any(self._needs_thread(item) for item in self._active):
+                    self._thread = None
+                active = [item for item in self._active if item.cpu]
+                stopping = self._thread is None
+            # Снимок памяти истекших профилей — в этом потоке, а не в цикле событий
+            for profile in expired:
+                profile.finish()
+            if stopping:
+                return
+            if not active:
+                time.sleep(self.interval)
+                continue
+            frames = sys._current_frames()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for profile in active:
+                try:
+                    profile.sample(frames, names, own)
+                except Exception as e:
+                    # Стеки чужих потоков меняются во время обхода — выборка пропускается
+                    logger.debug(f"Profiler sample skipped: {e}")
+            del frames
+            time.sleep(self.interval)
+
+    def _deactivate(self, profile: Profile) -> bool:
+        """Убирает профиль из активных (под self._lock); True — завершать его должен вызвавший"""
+        if profile is self.process_profile:
+            self.process_profile = None
+        if profile not in self._active:
+            return False
+        self._active.remove(profile)
+        return True
+
+    async def start(self, seconds: float, memory: bool = False, include_idle: bool = False, cpu: bool = True) -> Profile:
+        """Профиль всего процесса на seconds секунд; одновременно — не больше одного"""
+        with self._lock:
+            if self.process_profile is not None:
+                raise HTTPException(status_code=409, detail="Profiling is already in progress")
+            # Место профиля процесса занимается сразу, снимок памяти делается вне блокировки
+            self.process_profile = profile = Profile(
+                "process", seconds, include_idle=include_idle, meta={"pid": os.getpid()}, cpu=cpu
+            )
+        if memory:
+            try:
+                await asyncio.to_thread(profile.start_memory)
+            except BaseException:
+                with self._lock:
+                    self._deactivate(profile)
+                raise
+        self._register(profile)
+        logger.info(f"Process profiling started: {profile.id} for {seconds}s")
+        return profile
+
+    async def stop(self) -> Optional[Profile]:
+        with self._lock:
+            profile = self.process_profile
+            finishing = profile is not None and self._deactivate(profile)
+        if finishing:
+            await asyncio.to_thread(profile.finish)
+        return profile
+
+    async def start_request(self, memory: bool, meta: dict, cpu: bool = True) -> Optional[Profile]:
+        """Профиль текущей задачи asyncio; None — лимит одновременных профилей исчерпан"""
+        with self._lock:
+            if sum(1 for item in self._active if item.kind == "request") >= PROFILE_MAX_REQUESTS:
+                return None
+        profile = Profile("request", PROFILE_MAX_SECONDS, meta=meta, cpu=cpu)
+        if memory:
+            await asyncio.to_thread(profile.start_memory)
+        profile.attach(asyncio.current_task())
+        self._register(profile)
+        return profile
+
+    async def finish(self, profile: Profile):
+        with self._lock:
+            finishing = self._deactivate(profile)
+        if finishing:
+            await asyncio.to_thread(profile.finish)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def profiles(self) -> list:
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [profile.summary(top=0) for profile in reversed(profiles)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": PROFILING_ENABLED,
+                "sampling": self._thread is not None,
+                "active": len(self._active),
+                "process_profile": self.process_profile.id if self.process_profile else None,
+                "stored": len(self._profiles),
+            }
+
+profiler = Profiler()
+
+
+def render(profile: Profile, format: str):
+    """(тело, media type) профиля в формате format"""
+    if format == "collapsed":
+        return profile.collapsed().encode("utf-8"), "text/plain; charset=utf-8"
+    if format == "speedscope":
+        return json.dumps(profile.speedscope(), ensure_ascii=False).encode("utf-8"), "application/json"
+    return json.dumps(profile.summary(), ensure_ascii=False).encode("utf-8"), "application/json"
+
+
+def _requested_modes(scope) -> Optional[str]:
+    name = PROFILE_HEADER.lower().encode()
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1").lower()
+    return None
+
+def _is_admin(scope) -> bool:
+    """Только по claim is_admin токена, без запросов к БД; старые токены без claim не подходят"""
+    for key, value in scope.get("headers", ()):
+        if key == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return False
+            try:
+                return bool(auth.decode_access_token(token).get("is_admin"))
+            except HTTPException:
+                return False
+    return False
+
+
+class ProfilerMiddleware:
+    """
+    Профиль одного запроса по заголовку X-Profile (только администраторам).
+    Без заголовка — один проход по заголовкам запроса и никакой другой работы.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_ENABLED:
+            return await self.app(scope, receive, send)
+        modes = _requested_modes(scope)
+        if modes is None or not _is_admin(scope):
+            return await self.app(scope, receive, send)
+
+        modes = {mode.strip() for mode in modes.split(",")}
+        memory = "memory" in modes
+        # Только "memory" — без выборки стеков; прочие значения означают cpu
+        cpu = "cpu" in modes or not memory
+        profile = await profiler.start_request(
+            memory=memory, meta={"method": scope["method"], "path": scope["path"]}, cpu=cpu
+        )
+        if profile is None:
+            logger.warning("Request profiling limit reached, request is not profiled")
+            return await self.app(scope, receive, send)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER.lower().encode(), profile.id.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            await profiler.finish(profile)
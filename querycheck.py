@@ -0,0 +1,109 @@
+import os
+import re
+from collections import Counter
+from contextvars import ContextVar
+from sqlalchemy import event
+from logger import logger
+import database
+
+# Отладочный режим: запись SQL каждого запроса, поиск N+1 и проверка бюджетов маршрутов
+SQL_CHECK_ENABLED = os.getenv("SQL_CHECK_ENABLED", "false").lower() in ("1", "true", "yes")
+# Нарушения копятся в violations — тесты падают на них (см. tests/conftest.py)
+SQL_CHECK_ENFORCE = os.getenv("SQL_CHECK_ENFORCE", "false").lower() in ("1", "true", "yes")
+# Столько одинаковых по форме запросов за один HTTP-запрос считается N+1
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+
+STATEMENTS_HEADER = "X-SQL-Statements"
+
+_PLACEHOLDERS = re.compile(r"\$\d+|%\(\w+\)s|%s")
+_PLACEHOLDER_LISTS = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACES = re.compile(r"\s+")
+
+violations = []
+
+# Список форм SQL текущего HTTP-запроса
+trace_var: ContextVar = ContextVar("sql_trace", default=None)
+
+
+def shape(statement: str) -> str:
+    """Форма запроса: параметры и списки IN (...) любой длины сводятся к одному виду"""
+    normalized = _PLACEHOLDERS.sub("?", statement)
+    normalized = _PLACEHOLDER_LISTS.sub("?...", normalized)
+    return _SPACES.sub(" ", normalized).strip()
+
+def budget(max_statements: int = None, repeats: bool = False):
+    """
+    Бюджет SQL маршрута: не больше max_statements запросов за HTTP-запрос.
+    repeats=True — повторы одной формы ожидаемы (пакетная обработка), N+1 не проверяется.
+    Декоратор ставится под @app.<method>.
+    """
+    def decorator(endpoint):
+        endpoint.sql_budget = max_statements
+        endpoint.sql_repeats_allowed = repeats
+        return endpoint
+    return decorator
+
+def _record(conn, cursor, statement, parameters, context, executemany):
+    trace = trace_var.get()
+    if trace is not None:
+        trace.append(shape(statement))
+
+def instrument_engine(engine):
+    if not event.contains(engine, "before_cursor_execute", _record):
+        event.listen(engine, "before_cursor_execute", _record)
+
+def enable(*engines, enforce: bool = None):
+    """Включает проверку (тесты, отладка) для движков engines"""
+    global SQL_CHECK_ENABLED, SQL_CHECK_ENFORCE
+    SQL_CHECK_ENABLED = True
+    if enforce is not None:
+        SQL_CHECK_ENFORCE = enforce
+    for engine in engines:
+        instrument_engine(engine)
+
+def check(endpoint, statements: list) -> list:
+    """Нарушения для списка форм SQL одного HTTP-запроса"""
+    problems = []
+    if not getattr(endpoint, "sql_repeats_allowed", False):
+        for statement, count in Counter(statements).items():
+            if count >= SQL_N_PLUS_ONE_THRESHOLD:
+                problems.append(f"N+1: {count} x {statement}")
+    limit = getattr(endpoint, "sql_budget", None)
+    if limit is not None and len(statements) > limit:
+        problems.append(f"SQL budget exceeded: {len(statements)} > {limit}")
+    return problems
+
+
+class QueryCheckMiddleware:
+    """ASGI-middleware отладочного режима; при SQL_CHECK_ENABLED=false ничего не делает"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_CHECK_ENABLED:
+            return await self.app(scope, receive, send)
+        statements = []
+        token = trace_var.set(statements)
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (STATEMENTS_HEADER.lower().encode(), str(len(statements)).encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            trace_var.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                for problem in check(getattr(route, "endpoint", None), statements):
+                    logger.warning(f"{scope['method']} {route.path}: {problem}")
+                    if SQL_CHECK_ENFORCE:
+                        violations.append(f"{scope['method']} {route.path}: {problem}")
+
+
+if SQL_CHECK_ENABLED:
+    enable(database.engine, database.async_engine.sync_engine)
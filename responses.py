@@ -0,0 +1,36 @@
+import json
+from fastapi import Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from logger import logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.warning("orjson is not installed; responses are encoded with stdlib json")
+
+# Класс ответа по умолчанию для приложения
+DefaultResponse = ORJSONResponse if orjson else JSONResponse
+
+
+def dumps(content) -> bytes:
+    """JSON-тело из уже сериализуемых данных (dict/list/str/числа)"""
+    if orjson:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_body(body: bytes, response: Response = None) -> Response:
+    """
+    Готовое JSON-тело без повторной проверки response_model.
+    Заголовки, выставленные эндпоинтом на response (ETag, курсор), переносятся в ответ.
+    """
+    result = Response(content=body, media_type="application/json")
+    if response is not None:
+        result.headers.raw.extend(
+            (name, value) for name, value in response.headers.raw if name != b"content-length"
+        )
+    return result
+
+def json_list(adapter, rows, response: Response = None) -> Response:
+    """Список строк (ORM-объекты или Row) через TypeAdapter схемы — проверка и кодирование в pydantic-core"""
+    return json_body(adapter.dump_json(adapter.validate_python(rows, from_attributes=True)), response)
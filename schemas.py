@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, field_validator
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, TypeAdapter, field_validator
 from datetime import datetime, date
-from typing import Optional
+from typing import Any, Dict, List, Optional, Union
 
 class UserBase(BaseModel):
     username: str
@@ -10,15 +10,14 @@ class UserCreate(BaseModel):
     username: str
     email: EmailStr
     password: str
-    
-    class Config:
-        schema_extra = {
-            "example": {
-                "username": "johndoe",
-                "email": "johndoe@example.com",
-                "password": "securepassword123"
-            }
+
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "username": "johndoe",
+            "email": "johndoe@example.com",
+            "password": "securepassword123"
         }
+    })
 
 class User(BaseModel):
     id: int
@@ -27,8 +26,7 @@ class User(BaseModel):
     is_admin: bool
     created_at: Optional[datetime] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class BuildingBase(BaseModel):
     name: str
@@ -37,10 +35,19 @@ class BuildingBase(BaseModel):
 class BuildingCreate(BuildingBase):
     pass
 
+class BuildingStats(BaseModel):
+    sensor_count: int = 0
+    active_sensor_count: int = 0
+    open_incidents: int = 0
+
 class Building(BuildingBase):
     id: int
     owner_id: int
     created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    version: Optional[int] = None
+    # Заполняется только при GET /buildings/?include=stats
+    stats: Optional[BuildingStats] = None
     
     @field_validator('created_at', mode='before')
     def parse_created_at(cls, value):
@@ -55,9 +62,7 @@ class Building(BuildingBase):
         except (TypeError, ValueError):
             return None
     
-    class Config:
-        from_attributes = True
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class SensorBase(BaseModel):
     type: str
@@ -72,9 +77,10 @@ class Sensor(SensorBase):
     id: int
     building_id: int
     is_active: bool
+    updated_at: Optional[datetime] = None
+    version: Optional[int] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class IncidentBase(BaseModel):
     level: str
@@ -91,16 +97,70 @@ class Incident(IncidentBase):
     sensor_id: Optional[int] = None
     detected_at: datetime
     resolved: bool
+    resolved_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    version: Optional[int] = None
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+# Составные ответы: все данные страницы одним запросом клиента
+class SensorWithStats(Sensor):
+    open_incidents: int = 0
+
+class BuildingOverview(Building):
+    sensors: List[SensorWithStats] = []
+    open_incidents: int = 0
+
+class SensorOverview(Sensor):
+    building: Optional[Building] = None
+    incidents: List[Incident] = []
+
+# Ограничение пакета: 5 колонок * 5000 строк укладывается в лимит параметров Postgres (32767)
+INCIDENT_BATCH_MAX_SIZE = 5000
+
+class IncidentBatchCreate(BaseModel):
+    # Элементы валидируются по одному, чтобы ошибка в одном не отклоняла весь пакет
+    incidents: List[Dict[str, Any]] = Field(..., min_length=1, max_length=INCIDENT_BATCH_MAX_SIZE)
+
+class IncidentBatchItem(BaseModel):
+    index: int
+    ok: bool
+    incident: Optional[Incident] = None
+    error: Optional[str] = None
+
+class IncidentBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[IncidentBatchItem]
+
+# ANALYTICS
+class IncidentStats(BaseModel):
+    # bucket — час (datetime) или сутки (date); отсутствует в сводке без разбивки по времени
+    bucket: Optional[Union[datetime, date]] = None
+    building_id: Optional[int] = None
+    sensor_id: Optional[int] = None
+    level: Optional[str] = None
+    incidents: int
+    resolved: int
+    mttr_seconds: Optional[float] = None
+
+# TELEMETRY
+TELEMETRY_BATCH_MAX_SIZE = 10000
+
+class SensorReadingCreate(BaseModel):
+    sensor_id: int
+    value: float
+    unit: Optional[str] = Field(None, max_length=16)
+    recorded_at: datetime
+
+class SensorReadingBatch(BaseModel):
+    readings: List[SensorReadingCreate] = Field(..., min_length=1, max_length=TELEMETRY_BATCH_MAX_SIZE)
 
 class UserAuth(BaseModel):
     email: EmailStr
     password: str
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
     
 class Token(BaseModel):
     access_token: str
@@ -109,4 +169,10 @@ class Token(BaseModel):
 
 class IncidentUpdate(BaseModel):
     resolved: Optional[bool] = None
-    description: Optional[str] = None
\ No newline at end of file
+    description: Optional[str] = None
+
+# Адаптеры списков собираются один раз при импорте, а не на каждый ответ
+users_adapter = TypeAdapter(List[User])
+buildings_adapter = TypeAdapter(List[Building])
+sensors_adapter = TypeAdapter(List[Sensor])
+incidents_adapter = TypeAdapter(List[Incident])
\ No newline at end of file
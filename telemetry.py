@@ -0,0 +1,164 @@
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import timezone
+from sqlalchemy import select
+import database
+import models
+from logger import logger
+
+# Настройки буфера телеметрии
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", "100000"))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "5000"))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "1.0"))
+
+READING_COLUMNS = ("sensor_id", "recorded_at", "value", "unit")
+
+
+def to_record(reading) -> tuple:
+    """Переводит схему показания в кортеж для COPY (время — naive UTC, как в остальных таблицах)"""
+    recorded_at = reading.recorded_at
+    if recorded_at.tzinfo is not None:
+        recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return (reading.sensor_id, recorded_at, reading.value, reading.unit)
+
+
+async def copy_readings(records: list, engine=None) -> int:
+    """Пишет пакет показаний через COPY; строки с несуществующими датчиками отбрасываются"""
+    engine = engine or database.async_engine
+    async with engine.begin() as conn:
+        sensor_ids = {record[0] for record in records}
+        # Проверка и COPY в одной транзакции; FOR KEY SHARE не дает удалить датчик до ее конца —
+        # иначе удаление между ними роняло бы весь пакет на внешнем ключе
+        result = await conn.execute(
+            select(models.Sensor.id).where(models.Sensor.id.in_(sensor_ids)).with_for_update(key_share=True)
+        )
+        existing = set(result.scalars().all())
+        valid = [record for record in records if record[0] in existing]
+        if valid:
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                models.SensorReading.__tablename__,
+                records=valid,
+                columns=READING_COLUMNS
+            )
+        return len(valid)
+
+
+class TelemetryBuffer:
+    """Ограниченная очередь показаний с фоновой записью пакетами (write-behind)"""
+
+    def __init__(
+        self,
+        maxsize: int = TELEMETRY_QUEUE_SIZE,
+        batch_size: int = TELEMETRY_BATCH_SIZE,
+        flush_interval: float = TELEMETRY_FLUSH_INTERVAL,
+        writer=copy_readings
+    ):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._writer = writer
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._task = None
+        self._inflight = None
+        self._flush_latencies = deque(maxlen=256)
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.failed_rows = 0
+        self.dropped_unknown_sensor = 0
+
+    def offer(self, records: list) -> bool:
+        """Ставит показания в очередь целиком или не ставит ни одного (нет места — False)"""
+        if self.maxsize - self._queue.qsize() < len(records):
+            self.rejected += len(records)
+            return False
+        for record in records:
+            self._queue.put_nowait(record)
+        self.accepted += len(records)
+        return True
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="telemetry-flusher")
+
+    async def stop(self):
+        """Останавливает фоновую запись и дописывает все, что осталось в очереди"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight is not None:
+            await asyncio.gather(self._inflight, return_exceptions=True)
+            self._inflight = None
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._flush(batch)
+
+    async def _collect(self) -> list:
+        """Набирает пакет: до batch_size записей или до истечения flush_interval"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Запись не прерывается отменой задачи — stop() дождется ее завершения
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    async def _flush(self, batch: list):
+        start = time.perf_counter()
+        try:
+            written = await self._writer(batch)
+        except Exception as e:
+            self.failed_rows += len(batch)
+            logger.error(f"Telemetry flush failed ({len(batch)} rows): {str(e)}")
+            return
+        self._flush_latencies.append(time.perf_counter() - start)
+        self.flushes += 1
+        self.flushed_rows += written
+        self.dropped_unknown_sensor += len(batch) - written
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._flush_latencies)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self.maxsize,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_rows": self.failed_rows,
+            "dropped_unknown_sensor": self.dropped_unknown_sensor,
+            "flush_latency_last_ms": round(self._flush_latencies[-1] * 1000, 3) if latencies else 0.0,
+            "flush_latency_avg_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            "flush_latency_max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        }
+
+
+buffer = TelemetryBuffer()
@@ -0,0 +1,57 @@
+import auth
+
+
+def test_incident_analytics_rollups(client):
+    register = client.post("/register", json={
+        "username": "analytics_user",
+        "email": "analytics@example.com",
+        "password": "password123"
+    })
+    token = register.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/", json={"name": "Аналитика", "address": "ул. Сводная, 15"}, headers=headers
+    ).json()["id"]
+    sensor_id = client.post("/sensors/", json={
+        "type": "smoke",
+        "location": "Склад",
+        "installed_at": "2023-01-01",
+        "building_id": building_id,
+        "is_active": True
+    }, headers=headers).json()["id"]
+
+    first = client.post("/incidents", json={
+        "sensor_id": sensor_id, "level": "high", "detected_at": "2024-03-01T10:15:00"
+    }, headers=headers).json()
+    client.post("/incidents/batch", json={"incidents": [
+        {"sensor_id": sensor_id, "level": "low", "detected_at": "2024-03-01T10:45:00"},
+        {"sensor_id": sensor_id, "level": "high", "detected_at": "2024-03-02T08:00:00"}
+    ]}, headers=headers)
+    resolved = client.patch(f"/incidents/{first['id']}", json={"resolved": True}, headers=headers).json()
+    assert resolved["resolved_at"] is not None
+
+    period = "date_from=2024-03-01&date_to=2024-03-03"
+    daily = client.get(f"/analytics/incidents?{period}").json()
+    assert [(row["bucket"], row["incidents"], row["resolved"]) for row in daily] == [
+        ("2024-03-01", 2, 1), ("2024-03-02", 1, 0)
+    ]
+    assert daily[0]["mttr_seconds"] > 0
+
+    hourly = client.get(f"/analytics/incidents?{period}&granularity=hour&group_by=level").json()
+    assert [(row["bucket"], row["level"], row["incidents"]) for row in hourly] == [
+        ("2024-03-01T10:00:00", "high", 1), ("2024-03-01T10:00:00", "low", 1), ("2024-03-02T08:00:00", "high", 1)
+    ]
+
+    summary = client.get(f"/analytics/incidents/summary?{period}&group_by=building").json()
+    assert [(row["building_id"], row["incidents"], row["resolved"]) for row in summary] == [(building_id, 3, 1)]
+
+    # Пересчет с нуля дает те же агрегаты; доступен только администратору
+    assert client.post("/analytics/rebuild", headers=headers).status_code == 403
+    # Principal собирается из claims токена — строка пользователя для проверки роли не нужна
+    admin_token = auth.create_access_token(1, is_admin=True)
+    rebuilt = client.post("/analytics/rebuild", headers={"Authorization": f"Bearer {admin_token}"})
+    assert rebuilt.status_code == 200
+    assert client.get(f"/analytics/incidents/summary?{period}&group_by=building").json() == summary
+
+    assert client.get("/analytics/incidents?group_by=owner").status_code == 400
+    assert client.get("/analytics/incidents?date_from=2024-03-02&date_to=2024-03-01").status_code == 400
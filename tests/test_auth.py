@@ -20,4 +20,80 @@ def test_login(client):
         "password": "password123"
     })
     assert response.status_code == 200
-    assert "access_token" in response.json()
\ No newline at end of file
+    assert "access_token" in response.json()
+
+def test_refresh_token_rotation_revokes_old_token(client, monkeypatch):
+    import auth
+    monkeypatch.setattr(auth, "TOKEN_REVOCATION_ENABLED", True)
+    tokens = client.post("/register", json={
+        "username": "rotator",
+        "email": "rotator@example.com",
+        "password": "password123"
+    }).json()
+
+    first = client.post("/refresh-token", json={"refresh_token": tokens["refresh_token"]})
+    assert first.status_code == 200
+    # Повторное использование старого refresh-токена отклоняется
+    reused = client.post("/refresh-token", json={"refresh_token": tokens["refresh_token"]})
+    assert reused.status_code == 401
+
+    # Другой воркер не видит отзыв в своей памяти, но находит его в общем бэкенде кэша
+    second = first.json()["refresh_token"]
+    assert client.post("/refresh-token", json={"refresh_token": second}).status_code == 200
+    auth.token_cache.clear()
+    assert client.post("/refresh-token", json={"refresh_token": second}).status_code == 401
+
+def test_admin_flag_cache_evicts_oldest(monkeypatch):
+    import asyncio
+    import auth
+    monkeypatch.setattr(auth, "ADMIN_FLAG_CACHE_MAX_SIZE", 2)
+    monkeypatch.setattr(auth, "_admin_flag_cache", auth.OrderedDict())
+
+    async def get_user(db, user_id):
+        return type("User", (), {"is_admin": user_id == 1})()
+
+    monkeypatch.setattr(auth.crud, "get_user", get_user)
+    # 1 читается повторно и становится свежее 2 — вытесняется 2
+    for user_id in (1, 2, 1, 3):
+        asyncio.run(auth._get_admin_flag(None, user_id))
+    assert list(auth._admin_flag_cache) == [1, 3]
+
+def test_token_cache_hits(client):
+    import auth
+    auth.token_cache.clear()
+    token = client.post("/register", json={
+        "username": "cached",
+        "email": "cached@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(3):
+        client.post("/buildings/", json={"name": "Кэш", "address": "ул. Кэша, 1"}, headers=headers)
+    stats = auth.token_cache.stats()
+    assert stats["misses"] >= 1
+    assert stats["hits"] >= 2
+
+def _worker_modules():
+    import sys
+    return "logger" in sys.modules, "passwords" in sys.modules
+
+def test_password_hasher_spawns_light_workers():
+    import asyncio
+    import passwords
+
+    async def run(hasher):
+        password_hash = await hasher.hash("password123")
+        valid, _ = await hasher.verify_and_update("password123", password_hash)
+        # Дочерний процесс запущен через spawn и не загружает журнал и остальное приложение
+        modules = await asyncio.get_running_loop().run_in_executor(hasher._get_executor(), _worker_modules)
+        return valid, modules
+
+    hasher = passwords.PasswordHasher(workers=1)
+    try:
+        valid, modules = asyncio.run(run(hasher))
+    finally:
+        hasher.shutdown(wait=True)
+    assert valid
+    assert modules == (False, False)
+    assert hasher.stats()["start_method"] == "spawn"
+    assert hasher._executor is None
@@ -0,0 +1,106 @@
+import asyncio
+import json
+from main import app
+from benchmarks import report, workload
+from benchmarks.replay import replay
+
+
+def test_parse_both_log_formats():
+    text = workload.parse_line(
+        "2025-04-12 10:00:01,123 - fire_safety - INFO - Request: GET http://localhost:8000/buildings/7?include=stats"
+    )
+    assert text == workload.WorkItem("GET", "/buildings/7", "include=stats")
+    assert text.route == "GET /buildings/{id}?include"
+    # Запросы тестов и посторонние строки пропускаются
+    assert workload.parse_line("... - INFO - Request: GET http://testserver/buildings/") is None
+    assert workload.parse_line("... - INFO - Response: 200") is None
+
+    record = json.dumps({
+        "logger": "fire_safety.access", "method": "GET", "path": "/sensors/", "query": "building_id=3", "status": 200
+    })
+    assert workload.parse_line(record) == workload.WorkItem("GET", "/sensors/", "building_id=3")
+    assert workload.parse_line(json.dumps({"logger": "fire_safety", "message": "x"})) is None
+
+def test_remap_ids_into_seeded_fleet():
+    fleet = {"users": 10, "buildings": 200, "sensors": 5000, "incidents": 0}
+    item = workload.remap(workload.WorkItem("GET", "/buildings/205", "sensor_id=5001&limit=10"), fleet)
+    assert item.path == "/buildings/5"
+    assert dict(pair.split("=") for pair in item.query.split("&")) == {"sensor_id": "1", "limit": "10"}
+
+def test_report_percentiles_and_compare():
+    assert report.percentile([1, 2, 3, 4], 0.5) == 2
+    assert report.percentile([1, 2, 3, 4], 0.99) == 4
+    samples = {"GET /buildings": [0.01] * 99 + [0.1]}
+    statuses = {"GET /buildings": {200: 99, 500: 1}}
+    baseline = report.summarize(samples, statuses, wall_seconds=1.0)
+    assert baseline["routes"]["GET /buildings"]["p50_ms"] == 10.0
+    assert baseline["routes"]["GET /buildings"]["p99_ms"] == 10.0
+    assert baseline["total"]["errors"] == 1
+    assert baseline["total"]["throughput_rps"] == 100.0
+
+    current = report.summarize({"GET /buildings": [0.02] * 100}, {"GET /buildings": {200: 100}}, wall_seconds=2.0)
+    delta = report.compare(baseline, current)
+    assert delta["GET /buildings"]["p50_ms"] == 100.0
+    assert delta["total"]["throughput_rps"] == -50.0
+
+def test_replay_against_app(client):
+    token = client.post("/register", json={
+        "username": "bench_user",
+        "email": "bench@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/", json={"name": "Замер", "address": "ул. Нагрузочная, 1"}, headers=headers
+    ).json()["id"]
+
+    items = [
+        workload.WorkItem("GET", "/buildings/"),
+        workload.WorkItem("GET", f"/buildings/{building_id}"),
+        workload.WorkItem("GET", "/buildings/999999"),
+    ] * 5
+    result = asyncio.run(replay(app, items, concurrency=3, headers=headers))
+    assert result["total"]["requests"] == 15
+    assert result["total"]["errors"] == 0
+    assert result["routes"]["GET /buildings/{id}"]["statuses"] == {"200": 5, "404": 5}
+    assert result["meta"]["concurrency"] == 3
+
+def test_streaming_requests_do_not_hang_replay(client, tmp_path):
+    log = tmp_path / "access.log"
+    log.write_text("".join(json.dumps({
+        "logger": "fire_safety.access", "method": "GET", "path": path, "query": query, "status": 200
+    }) + "\n" for path, query in [
+        ("/incidents/stream", "building_id=1"), ("/export/incidents", "format=ndjson"), ("/buildings/", "")
+    ]), encoding="utf-8")
+    assert workload.parse_logs([str(log)]) == [workload.WorkItem("GET", "/buildings/")]
+
+    # Нагрузка, сохраненная до исключения потоков: SSE обрывается по тайм-ауту и считается ошибкой
+    items = [workload.WorkItem("GET", "/incidents/stream"), workload.WorkItem("GET", "/buildings/")]
+    result = asyncio.run(asyncio.wait_for(replay(app, items, concurrency=2, timeout=0.5), 20))
+    assert result["total"]["requests"] == 2
+    assert result["routes"]["GET /incidents/stream"]["statuses"] == {"0": 1}
+    assert result["routes"]["GET /buildings"]["statuses"] == {"200": 1}
+
+def test_micro_measure_and_regressions():
+    from benchmarks import micro
+    stats = asyncio.run(micro.measure(lambda: sum(range(100)), min_time=0))
+    assert stats["rounds"] >= micro.MICRO_MIN_ROUNDS
+    assert 0 < stats["min"] <= stats["median"] <= stats["max"]
+
+    baseline = {"cases": {"crud.get_sensor": {"median": 0.001}, "auth.create_access_token": {"median": 0.00004}}}
+    current = {"cases": {
+        "crud.get_sensor": {"median": 0.00125},
+        "auth.create_access_token": {"median": 0.000041},
+        "crud.new_case": {"median": 1.0},
+    }}
+    found = micro.regressions(baseline, current, threshold=0.2)
+    assert [item["case"] for item in found] == ["crud.get_sensor"]
+    assert found[0]["change"] == 0.25
+
+def test_micro_cases_without_database():
+    from benchmarks import micro, micro_cases  # noqa: F401
+    names = [name for name, item in micro.CASES.items() if item.group in ("schemas", "auth")]
+    result = asyncio.run(micro.run(names, min_time=0))
+    assert set(result["cases"]) == set(names)
+    assert "schemas.Building.parse_created_at[text x100]" in result["cases"]
+    assert all(stats["median"] > 0 for stats in result["cases"].values())
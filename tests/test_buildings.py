@@ -1,3 +1,6 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
 def test_create_building(client):
     # Регистрируем пользователя и получаем токен
     auth_response = client.post("/register", json={
@@ -80,3 +83,127 @@ def test_delete_building(client):
         headers={"Authorization": f"Bearer {token}"}
     )
     assert get_response.status_code == 404
+
+def test_get_buildings_cursor_pagination(client):
+    auth_response = client.post("/register", json={
+        "username": "pager",
+        "email": "pager@example.com",
+        "password": "password123"
+    })
+    token = auth_response.json()["access_token"]
+    for i in range(3):
+        client.post(
+            "/buildings/",
+            json={"name": f"Здание {i}", "address": f"ул. Страничная, {i}"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    first = client.get("/buildings/?limit=2")
+    assert first.status_code == 200
+    assert len(first.json()) == 2
+    cursor = first.headers["X-Next-Cursor"]
+
+    second = client.get(f"/buildings/?limit=2&after={cursor}")
+    assert second.status_code == 200
+    assert len(second.json()) == 1
+    assert "X-Next-Cursor" not in second.headers
+    ids = [b["id"] for b in first.json() + second.json()]
+    assert ids == sorted(ids)
+
+    assert client.get("/buildings/?after=garbage").status_code == 400
+
+def test_read_building_after_update_is_not_stale(client):
+    token = client.post("/register", json={
+        "username": "cache_editor",
+        "email": "cache_editor@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/", json={"name": "До", "address": "ул. Кэшная, 1"}, headers=headers
+    ).json()["id"]
+
+    # Прогреваем кэш строки и списка
+    assert client.get(f"/buildings/{building_id}").json()["name"] == "До"
+    assert [b["name"] for b in client.get("/buildings/").json()] == ["До"]
+
+    client.put(f"/buildings/{building_id}", json={"name": "После", "address": "ул. Кэшная, 1"}, headers=headers)
+
+    assert client.get(f"/buildings/{building_id}").json()["name"] == "После"
+    assert [b["name"] for b in client.get("/buildings/").json()] == ["После"]
+
+def test_read_building_conditional_get(client):
+    token = client.post("/register", json={
+        "username": "etag_owner",
+        "email": "etag_owner@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/", json={"name": "ETag", "address": "ул. Условная, 1"}, headers=headers
+    ).json()["id"]
+
+    first = client.get(f"/buildings/{building_id}")
+    etag = first.headers["ETag"]
+    assert first.json()["version"] == 1
+    cached = client.get(f"/buildings/{building_id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    list_etag = client.get("/buildings/").headers["ETag"]
+    assert client.get("/buildings/", headers={"If-None-Match": list_etag}).status_code == 304
+
+    client.put(f"/buildings/{building_id}", json={"name": "ETag 2", "address": "ул. Условная, 1"}, headers=headers)
+
+    changed = client.get(f"/buildings/{building_id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["version"] == 2
+    assert changed.headers["ETag"] != etag
+    assert client.get("/buildings/", headers={"If-None-Match": list_etag}).status_code == 200
+
+def test_building_overview_and_stats(client):
+    token = client.post("/register", json={
+        "username": "overview_owner",
+        "email": "overview_owner@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/", json={"name": "Обзор", "address": "ул. Сводная, 1"}, headers=headers
+    ).json()["id"]
+    sensor_ids = [
+        client.post("/sensors/", json={
+            "type": "smoke",
+            "location": f"Этаж {i}",
+            "installed_at": "2023-01-01",
+            "building_id": building_id,
+            "is_active": i == 0
+        }, headers=headers).json()["id"]
+        for i in range(2)
+    ]
+    for _ in range(2):
+        client.post("/incidents", json={"sensor_id": sensor_ids[0], "level": "high"}, headers=headers)
+
+    statements = []
+    def count_statement(*args):
+        statements.append(args[2])
+    event.listen(Engine, "before_cursor_execute", count_statement)
+    try:
+        overview = client.get(f"/buildings/{building_id}/overview")
+    finally:
+        event.remove(Engine, "before_cursor_execute", count_statement)
+    assert overview.status_code == 200
+    assert 0 < len(statements) <= 3
+    data = overview.json()
+    assert data["open_incidents"] == 2
+    assert [(s["id"], s["open_incidents"]) for s in data["sensors"]] == [(sensor_ids[0], 2), (sensor_ids[1], 0)]
+
+    sensor = client.get(f"/sensors/{sensor_ids[0]}/overview").json()
+    assert sensor["building"]["id"] == building_id
+    assert len(sensor["incidents"]) == 2
+
+    stats = client.get("/buildings/?include=stats").json()[0]["stats"]
+    assert stats == {"sensor_count": 2, "active_sensor_count": 1, "open_incidents": 2}
+    assert client.get("/buildings/").json()[0]["stats"] is None
+    assert client.get("/buildings/?include=owners").status_code == 400
+    assert client.get("/buildings/999999/overview").status_code == 404
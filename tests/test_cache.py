@@ -0,0 +1,33 @@
+import asyncio
+import pytest
+import cache
+
+
+def test_row_loaded_before_invalidation_is_not_cached():
+    store = cache.ReadThroughCache(cache.MemoryBackend(), ttl=60, enabled=True)
+
+    async def scenario():
+        async def stale_load():
+            # Запись изменила строку и сбросила ключ, пока загрузка читала старую версию
+            await store.invalidate(keys=["building:1"])
+            return {"name": "old"}
+
+        async def fresh_load():
+            return {"name": "new"}
+
+        first = await store.get_or_load("building:1", stale_load)
+        second = await store.get_or_load("building:1", fresh_load)
+        third = await store.get_or_load("building:1", stale_load)
+        return first, second, third
+
+    assert asyncio.run(scenario()) == ({"name": "old"}, {"name": "new"}, {"name": "new"})
+    assert store.stale_writes == 1
+    assert store.hits == 1
+
+def test_memory_backend_is_refused_with_several_workers(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_ENABLED", True)
+    with pytest.raises(RuntimeError, match="WEB_CONCURRENCY=4"):
+        cache._make_backend("memory", workers=4)
+    assert isinstance(cache._make_backend("memory", workers=1), cache.MemoryBackend)
+    monkeypatch.setattr(cache, "CACHE_ENABLED", False)
+    assert isinstance(cache._make_backend("memory", workers=4), cache.MemoryBackend)
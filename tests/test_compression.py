@@ -0,0 +1,81 @@
+import compression
+
+
+def _headers(client):
+    token = client.post("/register", json={
+        "username": "gzip_user",
+        "email": "gzip@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def test_list_response_is_gzipped_and_cached(client):
+    compression.compressor.clear()
+    headers = _headers(client)
+    for i in range(30):
+        client.post("/buildings", json={"name": f"Корпус {i}", "address": f"ул. Сжатая, {i}"}, headers=headers)
+
+    # httpx распаковывает тело сам; заголовки показывают, что пришло по сети
+    response = client.get("/buildings/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 30
+
+    hits = compression.compressor.stats()["cache_hits"]
+    again = client.get("/buildings/", headers={"Accept-Encoding": "gzip"})
+    assert again.json() == response.json()
+    assert compression.compressor.stats()["cache_hits"] == hits + 1
+
+    plain = client.get("/buildings/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    small = client.get("/incidents", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+def test_large_bodies_are_compressed_off_the_event_loop(client, monkeypatch):
+    compression.compressor.clear()
+    headers = _headers(client)
+    for i in range(30):
+        client.post("/buildings", json={"name": f"Корпус {i}", "address": f"ул. Потоковая, {i}"}, headers=headers)
+
+    offloaded = compression.compressor.stats()["offloaded"]
+    client.get("/buildings/", headers={"Accept-Encoding": "gzip"})
+    assert compression.compressor.stats()["offloaded"] == offloaded
+
+    compression.compressor.clear()
+    monkeypatch.setattr(compression, "COMPRESSION_THREAD_MIN_SIZE", compression.COMPRESSION_MIN_SIZE)
+    response = client.get("/buildings/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 30
+    assert compression.compressor.stats()["offloaded"] == offloaded + 1
+
+def test_streaming_export_is_not_recompressed(client):
+    headers = _headers(client)
+    response = client.get("/export/sensors?gzip=true", headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert "content-encoding" not in response.headers
+
+def test_collections_accept_both_path_forms(client):
+    headers = _headers(client)
+    created = client.post("/buildings", json={"name": "Без слеша", "address": "ул. Прямая, 1"}, headers=headers)
+    assert created.status_code == 201
+    for path in ("/buildings", "/buildings/", "/sensors", "/sensors/", "/incidents", "/incidents/"):
+        response = client.get(path, follow_redirects=False)
+        assert response.status_code == 200, path
+
+def test_cors_preflight_is_cacheable(client):
+    response = client.options("/buildings/", headers={
+        "Origin": "http://localhost:3000",
+        "Access-Control-Request-Method": "GET",
+        "Access-Control-Request-Headers": "authorization"
+    })
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "http://localhost:3000"
+    assert int(response.headers["access-control-max-age"]) > 0
+
+    foreign = client.options("/buildings/", headers={
+        "Origin": "http://evil.example",
+        "Access-Control-Request-Method": "GET"
+    })
+    assert foreign.status_code == 400
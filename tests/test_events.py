@@ -0,0 +1,89 @@
+import asyncio
+import events
+
+
+def test_broker_filters_by_building():
+    async def scenario():
+        broker = events.Broker(backend="memory", buffer_size=10)
+        everything = broker.subscribe()
+        building_1 = broker.subscribe(building_id=1)
+        await broker.publish({"type": "incident.created", "building_id": 1, "incident": {"id": 1}})
+        await broker.publish({"type": "incident.created", "building_id": 2, "incident": {"id": 2}})
+        return everything.queue.qsize(), building_1.queue.qsize()
+
+    assert asyncio.run(scenario()) == (2, 1)
+
+def test_broker_drops_slow_subscriber():
+    async def scenario():
+        broker = events.Broker(backend="memory", buffer_size=2)
+        slow = broker.subscribe()
+        for i in range(3):
+            await broker.publish({"type": "incident.created", "building_id": 1, "incident": {"id": i}})
+        return slow, broker
+
+    slow, broker = asyncio.run(scenario())
+    assert slow.closed
+    assert slow.queue.get_nowait() is None
+    assert broker.stats()["subscribers"] == 0
+    assert broker.stats()["dropped_subscribers"] == 1
+
+def _postgres_broker():
+    from tests.conftest import SQLALCHEMY_DATABASE_URL
+    broker = events.Broker(backend="memory", buffer_size=1000)
+    broker.backend = events.PostgresNotifyBackend(broker, channel="test_incident_events", dsn=SQLALCHEMY_DATABASE_URL)
+    return broker
+
+async def _wait_for(queue, count: int):
+    for _ in range(200):
+        if queue.qsize() >= count:
+            return
+        await asyncio.sleep(0.01)
+
+def test_postgres_backend_concurrent_publish_and_large_payload():
+    async def scenario():
+        broker = _postgres_broker()
+        await broker.start()
+        try:
+            subscription = broker.subscribe()
+            # Публикации из фоновых задач разных запросов идут одновременно
+            await asyncio.gather(*(
+                broker.publish({"type": "incident.created", "building_id": 1, "incident": {"id": i}}) for i in range(20)
+            ))
+            await broker.publish({
+                "type": "incident.created", "building_id": 1, "incident": {"id": 100, "description": "Дым" * 5000}
+            })
+            await _wait_for(subscription.queue, 21)
+            received = [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+            return received, broker.stats()
+        finally:
+            await broker.stop()
+
+    received, stats = asyncio.run(scenario())
+    assert sorted(event["incident"]["id"] for event in received) == list(range(20)) + [100]
+    large = next(event for event in received if event["incident"]["id"] == 100)
+    assert large["truncated"] is True and "description" not in large["incident"]
+    assert stats["truncated"] == 1
+
+def test_postgres_backend_reconnects_listener():
+    import asyncpg
+
+    async def scenario():
+        broker = _postgres_broker()
+        await broker.start()
+        try:
+            subscription = broker.subscribe()
+            pid = broker.backend._listen_conn.get_server_pid()
+            admin = await asyncpg.connect(broker.backend.dsn)
+            await admin.execute("SELECT pg_terminate_backend($1)", pid)
+            await admin.close()
+            for _ in range(200):
+                if broker.backend.reconnects:
+                    break
+                await asyncio.sleep(0.01)
+            await broker.publish({"type": "incident.updated", "building_id": 1, "incident": {"id": 1}})
+            await _wait_for(subscription.queue, 1)
+            return subscription.queue.qsize(), broker.backend.reconnects
+        finally:
+            await broker.stop()
+
+    assert asyncio.run(scenario()) == (1, 1)
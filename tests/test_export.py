@@ -0,0 +1,52 @@
+import csv
+import gzip
+import io
+import json
+
+
+def _setup(client):
+    token = client.post("/register", json={
+        "username": "export_user",
+        "email": "export@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/", json={"name": "Выгрузка", "address": "ул. Архивная, 7"}, headers=headers
+    ).json()["id"]
+    sensor_id = client.post("/sensors/", json={
+        "type": "gas",
+        "location": "Котельная",
+        "installed_at": "2023-01-01",
+        "building_id": building_id,
+        "is_active": True
+    }, headers=headers).json()["id"]
+    client.post("/incidents/batch", json={"incidents": [
+        {"sensor_id": sensor_id, "level": level, "description": f"Событие {i}"}
+        for i, level in enumerate(["low", "high", "low", "high", "low"])
+    ]}, headers=headers)
+    return headers, sensor_id
+
+def test_export_incidents_ndjson_and_resume(client):
+    headers, sensor_id = _setup(client)
+
+    assert client.get("/export/incidents").status_code == 401
+    response = client.get("/export/incidents?level=low", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["level"] for row in rows] == ["low"] * 3
+    assert rows == sorted(rows, key=lambda row: row["id"])
+
+    # Докачка после обрыва: продолжаем с id последней полученной строки
+    rest = client.get(f"/export/incidents?after_id={rows[0]['id']}&level=low", headers=headers)
+    assert [json.loads(line)["id"] for line in rest.text.splitlines()] == [row["id"] for row in rows[1:]]
+
+def test_export_sensors_csv_gzip(client):
+    headers, sensor_id = _setup(client)
+
+    response = client.get("/export/sensors?format=csv&gzip=true", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == 'attachment; filename="sensors.csv.gz"'
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode("utf-8"))))
+    assert [(int(row["id"]), row["type"]) for row in rows] == [(sensor_id, "gas")]
@@ -0,0 +1,68 @@
+import json
+
+
+def _headers(client, username="import_user"):
+    token = client.post("/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def test_import_buildings_csv(client):
+    headers = _headers(client)
+    body = (
+        "name,address\n"
+        "Склад,\"ул. Портовая, 1\"\n"
+        "Офис,\"ул. Ленина, 5\n корпус 2\"\n"
+        ",ул. Пустая, 3\n"
+        "Склад,\"ул. Портовая, 1\"\n"
+    )
+    assert client.post("/import/buildings?format=csv", content=body).status_code == 401
+    response = client.post("/import/buildings?format=csv", content=body.encode(), headers=headers)
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["received"], report["created"], report["existing"], report["failed"]) == (4, 2, 1, 1)
+    assert report["errors"][0]["row"] == 3
+    # Строки-дубликаты получают id того же здания
+    ids = {row["row"]: row["id"] for row in report["rows"]}
+    assert ids[1] == ids[4] and ids[1] != ids[2]
+
+    buildings = client.get("/buildings/", headers=headers).json()
+    assert {building["address"] for building in buildings} == {"ул. Портовая, 1", "ул. Ленина, 5\n корпус 2"}
+
+    # Повторный импорт ничего не создает
+    report = client.post(
+        "/import/buildings", content=body, headers={**headers, "Content-Type": "text/csv"}
+    ).json()
+    assert (report["created"], report["existing"]) == (0, 3)
+
+def test_import_sensors_ndjson(client):
+    headers = _headers(client)
+    building_id = client.post(
+        "/buildings/", json={"name": "Импорт", "address": "ул. Новая, 2"}, headers=headers
+    ).json()["id"]
+    other_headers = _headers(client, "import_other")
+    foreign_id = client.post(
+        "/buildings/", json={"name": "Чужое", "address": "ул. Другая, 9"}, headers=other_headers
+    ).json()["id"]
+
+    rows = [
+        {"type": "smoke", "location": f"Этаж {i}", "installed_at": "2023-05-01", "building_id": building_id, "is_active": True}
+        for i in range(1, 4)
+    ]
+    lines = [json.dumps(row, ensure_ascii=False) for row in rows] + [
+        "{broken",
+        json.dumps({"type": "heat", "location": "Крыша", "building_id": foreign_id, "is_active": True}),
+        json.dumps({"type": "heat", "location": "Крыша"}),
+    ]
+    response = client.post("/import/sensors", content="\n".join(lines), headers=headers)
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["received"], report["created"], report["failed"]) == (6, 3, 3)
+    assert [(error["row"], error["error"]) for error in report["errors"]][1] == (5, "Building not found")
+    assert "rows" not in report
+
+    sensors = client.get(f"/sensors/?building_id={building_id}", headers=headers).json()
+    assert sorted(sensor["location"] for sensor in sensors) == ["Этаж 1", "Этаж 2", "Этаж 3"]
+    assert client.post("/import/sensors?format=xml", content="", headers=headers).status_code == 400
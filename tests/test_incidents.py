@@ -1,3 +1,6 @@
+from tests.conftest import delete_sensor_during
+
+
 def test_create_incident(client):
     # Создаем датчик
     auth_response = client.post("/register", json={
@@ -39,4 +42,185 @@ def test_create_incident(client):
         headers={"Authorization": f"Bearer {token}"}
     )
     assert response.status_code == 201
-    assert response.json()["level"] == "high"
\ No newline at end of file
+    assert response.json()["level"] == "high"
+
+def test_create_incidents_batch(client):
+    auth_response = client.post("/register", json={
+        "username": "batch_user",
+        "email": "batch@example.com",
+        "password": "password123"
+    })
+    token = auth_response.json()["access_token"]
+    building = client.post(
+        "/buildings/",
+        json={"name": "Здание с пакетом", "address": "ул. Пакетная, 7"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    sensor = client.post(
+        "/sensors/",
+        json={
+            "type": "smoke",
+            "location": "Холл",
+            "installed_at": "2023-01-01",
+            "building_id": building.json()["id"],
+            "is_active": True
+        },
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    sensor_id = sensor.json()["id"]
+
+    # Один валидный, один с несуществующим датчиком, один без sensor_id
+    response = client.post(
+        "/incidents/batch",
+        json={"incidents": [
+            {"level": "high", "description": "Дым", "sensor_id": sensor_id},
+            {"level": "low", "sensor_id": 999999},
+            {"level": "low"}
+        ]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["created"] == 1
+    assert data["failed"] == 2
+    assert data["results"][0]["ok"] is True
+    assert data["results"][0]["incident"]["sensor_id"] == sensor_id
+    assert data["results"][1]["ok"] is False
+    assert data["results"][2]["ok"] is False
+
+def test_read_incidents_filters(client):
+    auth_response = client.post("/register", json={
+        "username": "filter_user",
+        "email": "filter@example.com",
+        "password": "password123"
+    })
+    token = auth_response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/",
+        json={"name": "Здание с фильтрами", "address": "ул. Фильтровая, 1"},
+        headers=headers
+    ).json()["id"]
+    sensor_ids = []
+    for location in ("Кухня", "Подвал"):
+        sensor_ids.append(client.post(
+            "/sensors/",
+            json={
+                "type": "smoke",
+                "location": location,
+                "installed_at": "2023-01-01",
+                "building_id": building_id,
+                "is_active": True
+            },
+            headers=headers
+        ).json()["id"])
+    client.post("/incidents", json={"level": "high", "sensor_id": sensor_ids[0],
+                                    "detected_at": "2025-01-10T10:00:00"}, headers=headers)
+    client.post("/incidents", json={"level": "low", "sensor_id": sensor_ids[1],
+                                    "detected_at": "2025-02-10T10:00:00"}, headers=headers)
+
+    by_sensor = client.get(f"/incidents?sensor_id={sensor_ids[0]}").json()
+    assert [i["sensor_id"] for i in by_sensor] == [sensor_ids[0]]
+
+    by_building = client.get(f"/incidents?building_id={building_id}").json()
+    assert len(by_building) == 2
+
+    by_level = client.get(f"/incidents?building_id={building_id}&level=low").json()
+    assert [i["level"] for i in by_level] == ["low"]
+
+    by_range = client.get(
+        "/incidents?detected_from=2025-02-01T00:00:00&detected_to=2025-03-01T00:00:00"
+    ).json()
+    assert [i["sensor_id"] for i in by_range] == [sensor_ids[1]]
+
+    first = client.get(f"/incidents?building_id={building_id}&limit=1")
+    assert first.headers["content-type"] == "application/json"
+    assert "ETag" in first.headers
+    assert set(first.json()[0]) == {
+        "id", "sensor_id", "level", "description", "detected_at", "resolved", "resolved_at", "updated_at", "version"
+    }
+    second = client.get(f"/incidents?building_id={building_id}&limit=1&after={first.headers['X-Next-Cursor']}")
+    assert [i["sensor_id"] for i in first.json() + second.json()] == [sensor_ids[1], sensor_ids[0]]
+    assert "X-Next-Cursor" not in second.headers
+
+def _sensor_with_owner(client, username: str):
+    token = client.post("/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/", json={"name": "Часовой пояс", "address": f"ул. Поясная, {username}"}, headers=headers
+    ).json()["id"]
+    sensor_id = client.post("/sensors/", json={
+        "type": "smoke", "location": "Холл", "building_id": building_id, "is_active": True
+    }, headers=headers).json()["id"]
+    return sensor_id, headers
+
+def test_create_incident_with_timezone(client):
+    sensor_id, headers = _sensor_with_owner(client, "tz_user")
+    # Форма отправляет new Date().toISOString() — время с Z; хранится UTC без пояса
+    for detected_at, expected in (("2025-03-01T10:00:00+03:00", "2025-03-01T07:00:00"),
+                                  ("2025-03-01T10:00:00Z", "2025-03-01T10:00:00")):
+        response = client.post(
+            "/incidents", json={"level": "high", "sensor_id": sensor_id, "detected_at": detected_at}, headers=headers
+        )
+        assert response.status_code == 201, response.text
+        assert response.json()["detected_at"].startswith(expected)
+
+def test_create_incidents_batch_with_timezone(client):
+    sensor_id, headers = _sensor_with_owner(client, "tz_batch_user")
+    response = client.post("/incidents/batch", json={"incidents": [
+        {"level": "high", "sensor_id": sensor_id, "detected_at": "2025-03-01T10:00:00Z"},
+        {"level": "low", "sensor_id": sensor_id, "detected_at": "2025-03-01T10:00:00+03:00"}
+    ]}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["created"] == 2
+    detected = [item["incident"]["detected_at"] for item in response.json()["results"]]
+    assert detected[0].startswith("2025-03-01T10:00:00")
+    assert detected[1].startswith("2025-03-01T07:00:00")
+
+def test_incidents_etag_changes_when_sensors_move_between_buildings(client):
+    sensor_a, headers = _sensor_with_owner(client, "etag_mover")
+    building_a = client.get(f"/sensors/{sensor_a}").json()["building_id"]
+    building_b = client.post(
+        "/buildings/", json={"name": "Второе", "address": "ул. Переездная, 2"}, headers=headers
+    ).json()["id"]
+    sensor_b, sensor_c = (
+        client.post("/sensors/", json={
+            "type": "heat", "location": location, "building_id": building_b, "is_active": True
+        }, headers=headers).json()["id"]
+        for location in ("Склад", "Котельная")
+    )
+    # Самый свежий инцидент — у датчика, который остается в здании B
+    for sensor_id in (sensor_c, sensor_a, sensor_b):
+        client.post("/incidents", json={"level": "high", "sensor_id": sensor_id}, headers=headers)
+
+    before = client.get(f"/incidents?building_id={building_b}")
+    # Датчики A и C меняются зданиями: число инцидентов и max(updated_at) те же, содержимое — другое
+    client.put(f"/sensors/{sensor_a}", json={
+        "type": "smoke", "location": "Холл", "building_id": building_b, "is_active": True
+    }, headers=headers)
+    client.put(f"/sensors/{sensor_c}", json={
+        "type": "heat", "location": "Котельная", "building_id": building_a, "is_active": True
+    }, headers=headers)
+
+    after = client.get(f"/incidents?building_id={building_b}", headers={"If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200
+    assert sorted(item["sensor_id"] for item in after.json()) == sorted([sensor_a, sensor_b])
+    assert after.headers["ETag"] != before.headers["ETag"]
+
+def test_batch_keeps_sensors_until_insert(client):
+    sensor_id, headers = _sensor_with_owner(client, "batch_locker")
+    # Удаление датчика между проверкой и INSERT ждет конца транзакции, а не роняет пакет
+    outcome, remove = delete_sensor_during("FROM sensors", sensor_id)
+    try:
+        response = client.post("/incidents/batch", json={"incidents": [
+            {"sensor_id": sensor_id, "level": "high"}
+        ]}, headers=headers)
+    finally:
+        remove()
+    assert outcome == [True]
+    assert response.status_code == 200
+    assert response.json()["created"] == 1
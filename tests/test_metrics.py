@@ -0,0 +1,58 @@
+import database
+import metrics
+from tests.conftest import SQLALCHEMY_DATABASE_URL, async_engine
+
+# Тестовый движок подменяет database.async_engine — его SQL учитывается так же
+metrics.instrument_engine(async_engine.sync_engine, "test")
+
+
+def _sample(text: str, prefix: str) -> float:
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(prefix))
+
+def test_metrics_route_latency_and_sql(client):
+    metrics.reset()
+    token = client.post("/register", json={
+        "username": "metrics_user",
+        "email": "metrics@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/", json={"name": "Метрики", "address": "ул. Счетная, 1"}, headers=headers
+    ).json()["id"]
+    client.get(f"/buildings/{building_id}")
+    client.get("/buildings/999999")
+    client.get("/no/such/path")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+
+    # Метка route — шаблон маршрута, а не конкретный URL
+    assert 'http_requests_total{method="GET",route="/buildings/{building_id}",status="200"} 1' in text
+    assert 'http_requests_total{method="GET",route="/buildings/{building_id}",status="404"} 1' in text
+    assert 'route="unmatched"' in text
+    assert f"/buildings/{building_id}\"" not in text
+    assert _sample(text, 'http_request_duration_seconds_count{method="POST",route="/buildings/"}') == 1
+    assert _sample(text, 'http_request_sql_statements_sum{route="/buildings/"}') >= 1
+    assert _sample(text, 'db_statements_total{engine="test"}') >= 1
+    assert "http_requests_in_flight" in text
+    assert 'cache_hits_total{cache="token"}' in text
+    assert "# TYPE db_pool_checkouts_total counter" in text
+
+def test_pool_stats_are_per_engine():
+    first = database.make_engine(SQLALCHEMY_DATABASE_URL)
+    second = database.make_engine(SQLALCHEMY_DATABASE_URL)
+    try:
+        with first.connect():
+            pass
+        assert first.pool.stats is not second.pool.stats
+        assert first.pool.stats.checkouts == 1
+        assert second.pool.stats.checkouts == 0
+        stats = first.pool.stats
+        first.dispose()
+        assert first.pool.stats is stats
+    finally:
+        first.dispose()
+        second.dispose()
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime
+from sqlalchemy import event, text
+import auth
+import crud
+import partitions
+from tests.conftest import TestingAsyncSessionLocal, async_engine
+
+
+def test_partition_maintenance_and_archive(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(partitions, "INCIDENTS_RETENTION_MONTHS", 12)
+    monkeypatch.setattr(partitions, "INCIDENTS_ARCHIVE_DIR", tmp_path)
+    token = client.post("/register", json={
+        "username": "partition_user",
+        "email": "partition@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/", json={"name": "Архив", "address": "ул. Историческая, 1"}, headers=headers
+    ).json()["id"]
+    sensor_id = client.post("/sensors/", json={
+        "type": "heat",
+        "location": "Подвал",
+        "installed_at": "2023-01-01",
+        "building_id": building_id,
+        "is_active": True
+    }, headers=headers).json()["id"]
+
+    # Старые инциденты попадают в DEFAULT, пока для их месяца нет секции
+    resolved_old = client.post("/incidents", json={
+        "sensor_id": sensor_id, "level": "low", "detected_at": "2024-03-05T12:00:00"
+    }, headers=headers).json()
+    client.patch(f"/incidents/{resolved_old['id']}", json={"resolved": True}, headers=headers)
+    open_old = client.post("/incidents", json={
+        "sensor_id": sensor_id, "level": "high", "detected_at": "2024-02-10T08:00:00"
+    }, headers=headers).json()
+    current = client.post("/incidents", json={"sensor_id": sensor_id, "level": "medium"}, headers=headers).json()
+
+    assert client.post("/incidents/partitions/maintain", headers=headers).status_code == 403
+    admin_token = auth.create_access_token(1, is_admin=True)
+    result = client.post("/incidents/partitions/maintain", headers={"Authorization": f"Bearer {admin_token}"}).json()
+    assert {"incidents_p202402", "incidents_p202403"} <= set(result["created"])
+    # Секция с нерешенным инцидентом остается в БД
+    assert [path.rsplit("/", 1)[-1] for path in result["archived"]] == ["incidents_p202403.csv.gz"]
+
+    assert {i["id"] for i in client.get("/incidents").json()} == {open_old["id"], current["id"]}
+    archived = client.get("/incidents/archive?date_from=2024-03-01&date_to=2024-04-01").json()
+    assert [(i["id"], i["resolved"], i["level"]) for i in archived] == [(resolved_old["id"], True, "low")]
+    assert client.get("/incidents/archive?date_from=2024-01-01&date_to=2024-03-01").json() == []
+
+def test_partition_maintenance_lifts_statement_timeout(client):
+    async def scenario():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SET LOCAL statement_timeout = 15000"))
+            await partitions.ensure_partitions(conn)
+            in_maintenance = await conn.scalar(text("SHOW statement_timeout"))
+            migrated = await partitions.migrate_heap(conn)
+            await conn.rollback()
+        return in_maintenance, migrated
+
+    # Таблица уже секционирована: migrate_heap ничего не делает, но тайм-аут снят
+    assert asyncio.run(scenario()) == ("0", False)
+
+def test_hot_queries_prune_old_partitions(client):
+    token = client.post("/register", json={
+        "username": "pruning_user",
+        "email": "pruning@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/", json={"name": "Секции", "address": "ул. Отсеченная, 3"}, headers=headers
+    ).json()["id"]
+    sensor_id = client.post("/sensors/", json={
+        "type": "smoke", "location": "Щитовая", "building_id": building_id, "is_active": True
+    }, headers=headers).json()["id"]
+    client.post("/incidents", json={"sensor_id": sensor_id, "level": "low", "detected_at": "2024-02-10T08:00:00"}, headers=headers)
+    recent = [client.post("/incidents", json={"sensor_id": sensor_id, "level": "high"}, headers=headers).json() for _ in range(2)]
+    old_partition = partitions.partition_name(datetime(2024, 2, 1))
+    hot_partition = partitions.partition_name(datetime.utcnow())
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    async def plans():
+        async with async_engine.begin() as conn:
+            await partitions.ensure_partitions(conn)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            async with TestingAsyncSessionLocal() as db:
+                incident = await crud.get_incident(db, recent[0]["id"])
+                page, _ = await crud.get_incidents(db, limit=1)
+                incident.level = "medium"
+                await db.commit()
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+        lookup, listing, update = statements
+        assert [row.id for row in page] == [recent[1]["id"]]
+        async with async_engine.connect() as conn:
+            result = []
+            for statement, parameters in (lookup, listing, update):
+                explain = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, COSTS OFF, TIMING OFF, SUMMARY OFF) {statement}", parameters)
+                result.append([row[0] for row in explain.all()])
+            await conn.rollback()
+        return result
+
+    lookup, listing, update = asyncio.run(plans())
+    # Поиск по id: старая секция есть в плане второй ветки UNION ALL, но не выполняется
+    assert any(hot_partition in line and "never executed" not in line for line in lookup)
+    assert all("never executed" in line for line in lookup if old_partition in line)
+    # Первая страница, заполненная горячим окном, и UPDATE по версии старые секции не видят
+    assert hot_partition in "\n".join(listing) and old_partition not in "\n".join(listing)
+    assert [line for line in update if "incidents_p" in line or "incidents_default" in line] == [
+        line for line in update if hot_partition in line
+    ]
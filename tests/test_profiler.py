@@ -0,0 +1,96 @@
+import asyncio
+import json
+import threading
+import time
+import auth
+import profiler
+
+
+def _admin_headers():
+    return {"Authorization": f"Bearer {auth.create_access_token(1, is_admin=True)}"}
+
+def _spin(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def test_request_profile_running_and_waiting_stacks():
+    async def handler():
+        profile = await profiler.profiler.start_request(memory=True, meta={"method": "GET", "path": "/test"})
+        _spin(0.1)
+        await asyncio.sleep(0.1)
+        await profiler.profiler.finish(profile)
+        return profile
+
+    profile = asyncio.run(handler())
+    stacks = list(profile.samples)
+    assert any(stack[0] == "(running)" and "_spin" in stack[-1] for stack in stacks)
+    assert any(stack[0] == "(waiting)" and "handler" in stack[1] for stack in stacks)
+    assert profile.memory is not None and "peak_bytes" in profile.memory
+
+    speedscope = profile.speedscope()
+    assert speedscope["profiles"][0]["type"] == "sampled"
+    assert len(speedscope["profiles"][0]["samples"]) == len(speedscope["profiles"][0]["weights"])
+    line = profile.collapsed().splitlines()[0]
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+def test_memory_only_profile_skips_sampler_and_snapshots_off_loop(monkeypatch):
+    loop_threads, snapshot_threads = set(), set()
+    snapshot = profiler._Memory._snapshot
+
+    def tracked_snapshot():
+        snapshot_threads.add(threading.get_ident())
+        return snapshot()
+    monkeypatch.setattr(profiler._Memory, "_snapshot", staticmethod(tracked_snapshot))
+
+    async def handler():
+        loop_threads.add(threading.get_ident())
+        profile = await profiler.profiler.start_request(memory=True, meta={}, cpu=False)
+        sampling = profiler.profiler.stats()["sampling"]
+        _spin(0.05)
+        await profiler.profiler.finish(profile)
+        return profile, sampling
+
+    profile, sampling = asyncio.run(handler())
+    assert sampling is False
+    assert profile.ticks == 0 and not profile.samples
+    assert profile.memory is not None and "peak_bytes" in profile.memory
+    assert snapshot_threads and not snapshot_threads & loop_threads
+
+def test_profiling_header_is_admin_only(client):
+    token = client.post("/register", json={
+        "username": "profile_user",
+        "email": "profile@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    user_headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/profiler", headers=user_headers).status_code == 403
+    response = client.get("/buildings/", headers={**user_headers, profiler.PROFILE_HEADER: "cpu"})
+    assert response.status_code == 200
+    assert profiler.PROFILE_ID_HEADER not in response.headers
+
+    response = client.get("/buildings/", headers={**_admin_headers(), profiler.PROFILE_HEADER: "cpu,memory"})
+    assert response.status_code == 200
+    profile_id = response.headers[profiler.PROFILE_ID_HEADER]
+    summary = client.get(f"/profiler/profiles/{profile_id}?format=json", headers=_admin_headers()).json()
+    assert summary["kind"] == "request"
+    assert summary["path"] == "/buildings/"
+    assert summary["running"] is False
+    assert "top" in summary["memory"]
+
+def test_process_profile_start_and_stop(client):
+    headers = _admin_headers()
+    started = client.post("/profiler/start?seconds=30", headers=headers)
+    assert started.status_code == 202
+    assert client.post("/profiler/start", headers=headers).status_code == 409
+    time.sleep(0.05)
+    stopped = client.post("/profiler/stop", headers=headers)
+    assert stopped.status_code == 200
+    assert stopped.json()["id"] == started.json()["id"]
+    assert client.post("/profiler/stop", headers=headers).status_code == 404
+
+    response = client.get(f"/profiler/profiles/{started.json()['id']}", headers=headers)
+    assert response.status_code == 200
+    assert "speedscope" in response.headers["content-disposition"]
+    assert json.loads(response.content)["profiles"][0]["unit"] == "seconds"
+    assert any(item["id"] == started.json()["id"] for item in client.get("/profiler", headers=headers).json()["profiles"])
@@ -0,0 +1,40 @@
+import querycheck
+
+
+def test_shape_ignores_parameters_and_in_list_length():
+    assert querycheck.shape("SELECT * FROM sensors\n WHERE id IN ($1, $2, $3)") == \
+        querycheck.shape("SELECT * FROM sensors WHERE id IN ($4, $5)") == \
+        "SELECT * FROM sensors WHERE id IN (?...)"
+    assert querycheck.shape("SELECT * FROM users WHERE id = %(id_1)s") == "SELECT * FROM users WHERE id = ?"
+
+def test_check_flags_n_plus_one_and_budget():
+    @querycheck.budget(3)
+    def endpoint():
+        pass
+
+    one_by_one = ["SELECT * FROM buildings"] + ["SELECT * FROM sensors WHERE building_id = ?"] * 5
+    problems = querycheck.check(endpoint, one_by_one)
+    assert any(problem.startswith("N+1: 5 x SELECT * FROM sensors") for problem in problems)
+    assert "SQL budget exceeded: 6 > 3" in problems
+    assert querycheck.check(endpoint, one_by_one[:2]) == []
+
+    @querycheck.budget(repeats=True)
+    def batch_endpoint():
+        pass
+
+    assert querycheck.check(batch_endpoint, one_by_one) == []
+
+def test_statement_count_header(client):
+    token = client.post("/register", json={
+        "username": "budget_user",
+        "email": "budget@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    building_id = client.post(
+        "/buildings/", json={"name": "Бюджет", "address": "ул. Лимитная, 1"},
+        headers={"Authorization": f"Bearer {token}"}
+    ).json()["id"]
+    first = client.get(f"/buildings/{building_id}")
+    assert first.headers[querycheck.STATEMENTS_HEADER] == "1"
+    # Повторное чтение обслуживается кэшем
+    assert client.get(f"/buildings/{building_id}").headers[querycheck.STATEMENTS_HEADER] == "0"
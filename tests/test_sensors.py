@@ -118,3 +118,41 @@ def test_delete_sensor(client):
     # Проверка, что он больше не существует
     get_response = client.get(f"/sensors/{sensor_id}")
     assert get_response.status_code == 404
+
+def test_update_sensor_forbidden_for_non_owner(client):
+    owner_token = client.post("/register", json={
+        "username": "sensor_real_owner",
+        "email": "real_owner@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+    other_token = client.post("/register", json={
+        "username": "sensor_stranger",
+        "email": "stranger@example.com",
+        "password": "password123"
+    }).json()["access_token"]
+
+    building_id = client.post(
+        "/buildings/",
+        json={"name": "Чужое здание", "address": "ул. Чужая, 1"},
+        headers={"Authorization": f"Bearer {owner_token}"}
+    ).json()["id"]
+    payload = {
+        "type": "smoke",
+        "location": "Лестница",
+        "installed_at": "2023-04-01",
+        "building_id": building_id,
+        "is_active": True
+    }
+    sensor_id = client.post(
+        "/sensors/", json=payload, headers={"Authorization": f"Bearer {owner_token}"}
+    ).json()["id"]
+
+    response = client.put(
+        f"/sensors/{sensor_id}",
+        json={**payload, "location": "Крыша"},
+        headers={"Authorization": f"Bearer {other_token}"}
+    )
+    assert response.status_code == 403
+
+    response = client.delete(f"/sensors/999999", headers={"Authorization": f"Bearer {owner_token}"})
+    assert response.status_code == 404
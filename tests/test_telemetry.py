@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime
+from sqlalchemy import text
+import telemetry
+from tests.conftest import async_engine, delete_sensor_during
+
+
+def register(client, username):
+    response = client.post("/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "password123"
+    })
+    return response.json()["access_token"]
+
+def test_ingest_readings_is_queued(client, monkeypatch):
+    writes = []
+
+    async def fake_writer(batch):
+        writes.append(batch)
+        return len(batch)
+
+    monkeypatch.setattr(telemetry, "buffer", telemetry.TelemetryBuffer(maxsize=10, writer=fake_writer))
+    token = register(client, "telemetry_user")
+
+    response = client.post(
+        "/telemetry/readings",
+        json={"readings": [
+            {"sensor_id": 1, "value": 21.5, "unit": "C", "recorded_at": "2025-06-01T10:00:00"},
+            {"sensor_id": 1, "value": 22.0, "unit": "C", "recorded_at": "2025-06-01T10:00:01"}
+        ]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 202
+    assert response.json()["accepted"] == 2
+    # Запрос не ждет записи в БД
+    assert writes == []
+    assert client.get("/telemetry/metrics").json()["queue_depth"] == 2
+
+def test_ingest_readings_backpressure(client, monkeypatch):
+    monkeypatch.setattr(telemetry, "buffer", telemetry.TelemetryBuffer(maxsize=1))
+    token = register(client, "telemetry_full")
+
+    response = client.post(
+        "/telemetry/readings",
+        json={"readings": [
+            {"sensor_id": 1, "value": 1.0, "recorded_at": "2025-06-01T10:00:00"},
+            {"sensor_id": 1, "value": 2.0, "recorded_at": "2025-06-01T10:00:01"}
+        ]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert telemetry.buffer.metrics()["rejected"] == 2
+
+def test_copy_keeps_sensors_until_commit(client):
+    token = register(client, "telemetry_locker")
+    headers = {"Authorization": f"Bearer {token}"}
+    building_id = client.post(
+        "/buildings/", json={"name": "Телеметрия", "address": "ул. Датчиковая, 5"}, headers=headers
+    ).json()["id"]
+    sensor_id = client.post("/sensors/", json={
+        "type": "heat", "location": "Подвал", "building_id": building_id, "is_active": True
+    }, headers=headers).json()["id"]
+
+    async def scenario():
+        written = await telemetry.copy_readings([(sensor_id, datetime(2025, 6, 1, 10), 21.5, "C")], engine=async_engine)
+        async with async_engine.connect() as conn:
+            stored = await conn.scalar(text("SELECT count(*) FROM sensor_readings"))
+        return written, stored
+
+    outcome, remove = delete_sensor_during("FROM sensors", sensor_id)
+    try:
+        assert asyncio.run(scenario()) == (1, 1)
+    finally:
+        remove()
+    assert outcome == [True]